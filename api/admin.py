@@ -1,27 +1,181 @@
+from django import forms
+from django.conf import settings
 from django.contrib import admin
-from .models import UserProfile, FoodScan, Feedback, ChatMessage
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.contrib.auth.models import User
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.utils.functional import cached_property
+
+from . import search
+from .models import UserProfile, FoodScan, Feedback, ChatMessage, ChatSummary, Food, FoodAlias
+
+
+class EstimatedCountPaginator(Paginator):
+    """Uses the planner's row estimate instead of COUNT(*) for an unfiltered big table.
+
+    Filtered lists (by user, date or search) are still counted exactly;
+    those counts are served by indexes.
+    """
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where:
+            estimate = estimated_row_count(self.object_list)
+            if estimate is not None and estimate >= settings.ADMIN_COUNT_ESTIMATE_THRESHOLD:
+                return estimate
+        return super().count
+
+
+def estimated_row_count(queryset):
+    """The database's own row estimate for the table, or None without statistics."""
+    table = queryset.model._meta.db_table
+    connection = connections[queryset.db]
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [table])
+            elif connection.vendor == 'sqlite':
+                # Filled in by ANALYZE (or PRAGMA optimize); the first number is the row count
+                cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [table])
+            else:
+                return None
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    if row is None:
+        return None
+    estimate = int(str(row[0]).split()[0])
+    return estimate if estimate >= 0 else None  # reltuples is -1 before the first ANALYZE
+
+
+class _FilterAutocompleteSelect(AutocompleteSelect):
+    def __init__(self, field, admin_site, placeholder):
+        super().__init__(field, admin_site)
+        self.placeholder = placeholder
+
+    def build_attrs(self, base_attrs, extra_attrs=None):
+        attrs = super().build_attrs(base_attrs, extra_attrs)
+        attrs['data-placeholder'] = self.placeholder  # the widget blanks it
+        return attrs
+
+
+class UserAutocompleteFilter(admin.FieldListFilter):
+    """Filter by user with the admin's autocomplete widget instead of listing every user."""
+    template = 'admin/api/autocomplete_filter.html'
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        self.lookup_kwarg = f'{field_path}__{field.target_field.name}__exact'
+        super().__init__(field, request, params, model, model_admin, field_path)
+        self.title = field.verbose_name
+        value = self.used_parameters.get(self.lookup_kwarg)
+        self.lookup_val = value[-1] if isinstance(value, list) else value
+        if not self.lookup_val:
+            # The filter form submits the cleared select as an empty value
+            self.used_parameters.pop(self.lookup_kwarg, None)
+        self.form_field = forms.ModelChoiceField(
+            field.remote_field.model._default_manager.all(), required=False,
+            widget=_FilterAutocompleteSelect(field, model_admin.admin_site, self.title),
+        )
+
+    def expected_parameters(self):
+        return [self.lookup_kwarg]
+
+    def choices(self, changelist):
+        # Rendered as a single autocomplete select (see the template)
+        return []
+
+    def rendered_widget(self):
+        return self.form_field.widget.render(
+            self.lookup_kwarg, self.lookup_val,
+            attrs={'class': 'form-control', 'style': 'min-width: 220px'},
+        )
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """List pages for tables with millions of rows.
+
+    No COUNT(*) of the whole table (EstimatedCountPaginator, and no second
+    count for filtered pages), users joined instead of fetched per row, an
+    autocomplete user filter, and search through the full-text index
+    (api/search.py) or an exact username/email.
+    """
+    list_select_related = ('user',)
+    list_filter = (('user', UserAutocompleteFilter),)
+    autocomplete_fields = ('user',)
+    date_hierarchy = 'timestamp'
+    ordering = ('-timestamp', '-id')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    search_fields = ('user__username', 'user__email')
+    search_help_text = "Words to find, or a username or email"
+
+    @property
+    def media(self):
+        # The filter's widget needs the autocomplete scripts on the list page too
+        field = self.model._meta.get_field('user')
+        return super().media + AutocompleteSelect(field, self.admin_site).media
+
+    def get_search_results(self, request, queryset, search_term):
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        users = User.objects.annotate(email_lower=Lower('email')).filter(
+            Q(username=search_term) | Q(email_lower=search_term.lower())).values('pk')
+        condition = Q(user__in=users)
+        matches = search.matches(self.model, search_term)
+        if matches is not None:
+            condition |= matches
+        return queryset.filter(condition), False
+
 
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
     list_display = ('user', 'weight', 'height', 'goal', 'lifestyle')
+    list_select_related = ('user',)
+    autocomplete_fields = ('user',)
     search_fields = ('user__username', 'user__email')
 
 @admin.register(FoodScan)
-class FoodScanAdmin(admin.ModelAdmin):
+class FoodScanAdmin(LargeTableAdmin):
     list_display = ('id', 'user', 'calories', 'protein', 'carbs', 'fats', 'timestamp')
-    list_filter = ('timestamp', 'user')
-    search_fields = ('user__username', 'user__email')
 
 @admin.register(Feedback)
 class FeedbackAdmin(admin.ModelAdmin):
     list_display = ('scan', 'is_accurate', 'correct_food_name')
     list_filter = ('is_accurate',)
+    list_select_related = ('scan__user',)
+    raw_id_fields = ('scan',)
 
 @admin.register(ChatMessage)
-class ChatMessageAdmin(admin.ModelAdmin):
+class ChatMessageAdmin(LargeTableAdmin):
     list_display = ('user', 'message_preview', 'timestamp')
-    list_filter = ('timestamp', 'user')
-    search_fields = ('user__username', 'user__email', 'message', 'response')
 
     def message_preview(self, obj):
         return obj.message[:50] + "..." if len(obj.message) > 50 else obj.message
+
+@admin.register(ChatSummary)
+class ChatSummaryAdmin(admin.ModelAdmin):
+    list_display = ('user', 'last_message_id', 'updated_at')
+    list_select_related = ('user',)
+    autocomplete_fields = ('user',)
+    search_fields = ('user__username', 'user__email', 'summary')
+
+class FoodAliasInline(admin.TabularInline):
+    model = FoodAlias
+    extra = 0
+
+@admin.register(Food)
+class FoodAdmin(admin.ModelAdmin):
+    list_display = ('name', 'calories', 'protein', 'carbs', 'fats')
+    search_fields = ('name', 'aliases__alias')
+    inlines = [FoodAliasInline]
+
+@admin.register(FoodAlias)
+class FoodAliasAdmin(admin.ModelAdmin):
+    list_display = ('alias', 'food', 'source', 'votes')
+    list_filter = ('source',)
+    search_fields = ('alias', 'food__name')
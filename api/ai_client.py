@@ -0,0 +1,366 @@
+"""
+Model clients used by api/utils.py.
+
+Every client offers the same two calls, taking ``contents`` in the
+google-generativeai format (strings and ``{"mime_type", "data"}`` dicts)
+and returning the response text:
+
+* ``generate_content(model_name, contents)`` - blocking, for sync views
+  and workers.
+* ``agenerate_content(model_name, contents)`` - a coroutine for the async
+  views, so one process can keep hundreds of model calls in flight.
+
+Both accept ``timeout`` (seconds) so a stuck request is abandoned; see
+api/invoke.py for the deadlines, retries and hedging built on top. With
+``response_schema`` the model is asked for JSON matching that schema
+(structured output) instead of free text.
+``stream_content`` / ``astream_content`` yield the text as it is generated.
+``embed_content`` / ``aembed_content`` return an embedding vector for a
+piece of text (used by the coach reply cache, api/coach_cache.py).
+
+``AI_BACKEND`` selects the implementation: ``gemini`` talks to Google
+(the SDK for sync calls, the REST API over aiohttp for async ones) and
+``fake`` answers locally after ``AI_FAKE_LATENCY_MS`` so throughput can be
+measured offline (see ``manage.py bench_ai_client``). For end-to-end load
+tests, api/fake_gemini.py serves the Gemini REST API locally instead.
+
+The SDK and aiohttp are imported on first use: the SDK alone costs most of
+a second and tens of MB per process (``manage.py check_import_budget``),
+which workers and management commands that never call a model should not
+pay. One GenerativeModel per model name is kept for the process.
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import weakref
+from typing import Optional
+from urllib.parse import urlsplit
+
+from django.conf import settings
+
+
+class AIClientError(Exception):
+    """A non-2xx response from the model API.
+
+    The message starts with the HTTP status so the error classification in
+    ``utils.test_gemini_connection`` works for both clients.
+    """
+
+    def __init__(self, status: int, message: str):
+        self.status = status
+        super().__init__(f"{status} {message}")
+
+
+GOOGLE_API_BASE_URL = 'https://generativelanguage.googleapis.com/v1beta'
+
+
+_sdk = None
+_sdk_lock = threading.Lock()
+
+
+def sdk():
+    """google.generativeai, imported and configured with ``GEMINI_API_KEY`` on first use."""
+    global _sdk
+    if _sdk is None:
+        with _sdk_lock:
+            if _sdk is None:
+                import google.generativeai as genai
+                if settings.GEMINI_API_KEY:
+                    _configure(genai, settings.GEMINI_API_KEY)
+                _sdk = genai
+    return _sdk
+
+
+def _configure(genai, api_key):
+    base_url = settings.GEMINI_API_BASE_URL.rstrip('/')
+    if base_url == GOOGLE_API_BASE_URL:
+        genai.configure(api_key=api_key)
+        return
+    parts = urlsplit(base_url)
+    genai.configure(api_key=api_key, transport='rest',
+                    client_options={'api_endpoint': f"{parts.scheme}://{parts.netloc}"})
+
+
+def configure_sdk(api_key: Optional[str]) -> None:
+    """Configure the SDK used for sync calls.
+
+    When ``GEMINI_API_BASE_URL`` points somewhere other than Google (e.g.
+    api/fake_gemini.py), the SDK is sent there too, over REST.
+    """
+    _configure(sdk(), api_key)
+    if _gemini_client is not None:
+        # Models hold on to the client they were first used with
+        _gemini_client.models.clear()
+
+
+def _client_timeout(seconds):
+    import aiohttp
+    return aiohttp.ClientTimeout(total=seconds) if seconds else None
+
+
+def _has_image(contents) -> bool:
+    return any(isinstance(part, dict) for part in contents)
+
+
+def _as_list(contents):
+    return contents if isinstance(contents, (list, tuple)) else [contents]
+
+
+class GeminiClient:
+    def __init__(self, api_key: Optional[str], base_url: str = None):
+        self.api_key = api_key
+        self.base_url = (base_url or settings.GEMINI_API_BASE_URL).rstrip('/')
+        # aiohttp sessions are bound to the loop that created them; under
+        # WSGI each async request may run on its own loop.
+        self._sessions = weakref.WeakKeyDictionary()
+        self.models = {}
+
+    def model(self, model_name):
+        """The SDK's GenerativeModel for ``model_name``, reused across calls."""
+        model = self.models.get(model_name)
+        if model is None:
+            model = self.models.setdefault(model_name, sdk().GenerativeModel(model_name))
+        return model
+
+    def generate_content(self, model_name, contents, timeout: Optional[float] = None,
+                         response_schema: Optional[dict] = None):
+        model = self.model(model_name)
+        request_options = {"timeout": timeout} if timeout else None
+        generation_config = {
+            "response_mime_type": "application/json", "response_schema": response_schema,
+        } if response_schema else None
+        return model.generate_content(contents, generation_config=generation_config,
+                                      request_options=request_options).text
+
+    def stream_content(self, model_name, contents):
+        for chunk in self.model(model_name).generate_content(contents, stream=True):
+            if chunk.parts:
+                yield chunk.text
+
+    def embed_content(self, model_name, text, dimensions: Optional[int] = None,
+                      timeout: Optional[float] = None):
+        request_options = {"timeout": timeout} if timeout else None
+        return sdk().embed_content(model=model_name, content=text, output_dimensionality=dimensions,
+                                   request_options=request_options)["embedding"]
+
+    def _session(self):
+        import aiohttp
+        loop = asyncio.get_running_loop()
+        session = self._sessions.get(loop)
+        if session is None or session.closed:
+            session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=settings.AI_MAX_CONNECTIONS),
+                timeout=aiohttp.ClientTimeout(total=settings.AI_HTTP_TIMEOUT),
+            )
+            self._sessions[loop] = session
+        return session
+
+    @staticmethod
+    def _request_body(contents, response_schema=None):
+        parts = []
+        for part in _as_list(contents):
+            if isinstance(part, dict):
+                parts.append({"inline_data": {
+                    "mime_type": part["mime_type"],
+                    "data": base64.b64encode(part["data"]).decode('ascii'),
+                }})
+            else:
+                parts.append({"text": str(part)})
+        body = {"contents": [{"role": "user", "parts": parts}]}
+        if response_schema:
+            body["generationConfig"] = {"responseMimeType": "application/json", "responseSchema": response_schema}
+        return body
+
+    @staticmethod
+    async def _raise_for_status(resp):
+        if resp.status >= 400:
+            payload = await resp.json(content_type=None)
+            error = payload.get("error", {}) if isinstance(payload, dict) else {}
+            raise AIClientError(resp.status, error.get("message", resp.reason or "Request failed"))
+
+    @staticmethod
+    def _response_text(payload, status):
+        try:
+            parts = payload["candidates"][0]["content"]["parts"]
+        except (KeyError, IndexError, TypeError):
+            raise AIClientError(status, f"Unexpected response: {json.dumps(payload)[:200]}")
+        return "".join(part.get("text", "") for part in parts)
+
+    async def agenerate_content(self, model_name, contents, api_key: Optional[str] = None,
+                                timeout: Optional[float] = None, response_schema: Optional[dict] = None):
+        url = f"{self.base_url}/{model_name}:generateContent"
+        headers = {"x-goog-api-key": api_key or self.api_key or ""}
+        request_timeout = _client_timeout(timeout)
+        body = self._request_body(contents, response_schema)
+        async with self._session().post(url, json=body, headers=headers, timeout=request_timeout) as resp:
+            await self._raise_for_status(resp)
+            payload = await resp.json(content_type=None)
+        return self._response_text(payload, resp.status)
+
+    async def aembed_content(self, model_name, text, dimensions: Optional[int] = None,
+                             timeout: Optional[float] = None):
+        url = f"{self.base_url}/{model_name}:embedContent"
+        headers = {"x-goog-api-key": self.api_key or ""}
+        body = {"content": {"parts": [{"text": text}]}}
+        if dimensions:
+            body["outputDimensionality"] = dimensions
+        request_timeout = _client_timeout(timeout)
+        async with self._session().post(url, json=body, headers=headers, timeout=request_timeout) as resp:
+            await self._raise_for_status(resp)
+            payload = await resp.json(content_type=None)
+        try:
+            return payload["embedding"]["values"]
+        except (KeyError, TypeError):
+            raise AIClientError(resp.status, f"Unexpected response: {json.dumps(payload)[:200]}")
+
+    async def astream_content(self, model_name, contents, api_key: Optional[str] = None):
+        url = f"{self.base_url}/{model_name}:streamGenerateContent?alt=sse"
+        headers = {"x-goog-api-key": api_key or self.api_key or ""}
+        async with self._session().post(url, json=self._request_body(contents), headers=headers) as resp:
+            await self._raise_for_status(resp)
+            async for line in resp.content:
+                line = line.strip()
+                if not line.startswith(b"data:"):
+                    continue
+                text = self._response_text(json.loads(line[5:]), resp.status)
+                if text:
+                    yield text
+
+
+FAKE_ANALYSIS = {
+    "items": [{
+        "name": "Chicken Curry", "confidence": 0.92, "calories": 420.0, "protein": 32.0,
+        "carbs": 14.0, "fats": 26.0, "fiber": 3.0, "sugar": 5.0, "sodium": 780.0,
+        "portion": "1 bowl", "weight_grams": 300.0,
+    }, {
+        "name": "Steamed Rice", "confidence": 0.88, "calories": 260.0, "protein": 5.0,
+        "carbs": 57.0, "fats": 0.5, "fiber": 0.6, "sugar": 0.1, "sodium": 2.0,
+        "portion": "1 cup", "weight_grams": 200.0,
+    }],
+    "total_calories": 680.0, "total_protein": 37.0, "total_carbs": 71.0, "total_fats": 26.5,
+    "health_score": "B",
+    "dietary_tags": ["High Protein"],
+    "ai_insights": "A filling, protein-rich meal; consider adding vegetables.",
+}
+
+FAKE_COACH_REPLY = (
+    "Great question! Aim for a balanced plate: half vegetables, a quarter lean protein "
+    "and a quarter whole grains. Stay hydrated and keep portions consistent."
+)
+
+
+class FakeClient:
+    """Offline stand-in that answers after a simulated latency.
+
+    A ``tail_rate`` fraction of calls takes ``tail_ms`` instead (a stuck or
+    slow request) and an ``error_rate`` fraction fails with a 503, for
+    exercising timeouts, retries and hedging (see ``manage.py bench_invoke``).
+    """
+
+    def __init__(self, latency_ms: float = 0, jitter_ms: float = 0,
+                 tail_rate: float = 0, tail_ms: float = 0, error_rate: float = 0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.tail_rate = tail_rate
+        self.tail_ms = tail_ms
+        self.error_rate = error_rate
+
+    def _delay(self) -> float:
+        if self.tail_rate and random.random() < self.tail_rate:
+            return self.tail_ms / 1000
+        return max(0.0, self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)) / 1000
+
+    def _outcome(self, timeout):
+        """(seconds to wait, error to raise afterwards or None)."""
+        delay = self._delay()
+        if timeout is not None and delay > timeout:
+            return timeout, TimeoutError(f"fake model call timed out after {timeout:.2f}s")
+        if self.error_rate and random.random() < self.error_rate:
+            return delay, AIClientError(503, "The model is overloaded. Please try again later.")
+        return delay, None
+
+    def _stream_plan(self, contents):
+        """(delay, token) pairs: the first token arrives after a fifth of the
+        latency and the rest are spread over the remainder."""
+        delay = self._delay()
+        tokens = [word + " " for word in self._reply(contents).split(" ")]
+        tokens[-1] = tokens[-1].rstrip(" ")
+        per_token = delay * 0.8 / max(1, len(tokens) - 1)
+        return [(delay * 0.2 if i == 0 else per_token, token) for i, token in enumerate(tokens)]
+
+    def _reply(self, contents, structured=False) -> str:
+        if _has_image(_as_list(contents)):
+            if structured:
+                return json.dumps(FAKE_ANALYSIS)
+            return "```json\n" + json.dumps(FAKE_ANALYSIS) + "\n```"
+        return FAKE_COACH_REPLY
+
+    def generate_content(self, model_name, contents, timeout: Optional[float] = None,
+                         response_schema: Optional[dict] = None):
+        delay, error = self._outcome(timeout)
+        time.sleep(delay)
+        if error is not None:
+            raise error
+        return self._reply(contents, bool(response_schema))
+
+    async def agenerate_content(self, model_name, contents, api_key: Optional[str] = None,
+                                timeout: Optional[float] = None, response_schema: Optional[dict] = None):
+        delay, error = self._outcome(timeout)
+        await asyncio.sleep(delay)
+        if error is not None:
+            raise error
+        return self._reply(contents, bool(response_schema))
+
+    def embed_content(self, model_name, text, dimensions: Optional[int] = None,
+                      timeout: Optional[float] = None):
+        """Hashed bag of words: texts sharing most words embed close together."""
+        vector = [0.0] * (dimensions or 256)
+        for word in re.findall(r"\w+", text.lower()):
+            digest = hashlib.blake2b(word.encode(), digest_size=8).digest()
+            index = int.from_bytes(digest[:4], 'big') % len(vector)
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        return vector
+
+    async def aembed_content(self, model_name, text, dimensions: Optional[int] = None,
+                             timeout: Optional[float] = None):
+        return self.embed_content(model_name, text, dimensions, timeout)
+
+    def stream_content(self, model_name, contents):
+        for delay, token in self._stream_plan(contents):
+            time.sleep(delay)
+            yield token
+
+    async def astream_content(self, model_name, contents, api_key: Optional[str] = None):
+        for delay, token in self._stream_plan(contents):
+            await asyncio.sleep(delay)
+            yield token
+
+
+_client = None
+_gemini_client = None
+
+
+def get_gemini_client() -> GeminiClient:
+    """Process-wide Gemini client, regardless of ``AI_BACKEND``."""
+    global _gemini_client
+    if _gemini_client is None:
+        _gemini_client = GeminiClient(settings.GEMINI_API_KEY)
+    return _gemini_client
+
+
+def get_ai_client():
+    """Process-wide client for the configured ``AI_BACKEND``."""
+    global _client
+    if _client is None:
+        if settings.AI_BACKEND == 'fake':
+            _client = FakeClient(settings.AI_FAKE_LATENCY_MS, settings.AI_FAKE_JITTER_MS,
+                                 settings.AI_FAKE_TAIL_RATE, settings.AI_FAKE_TAIL_MS,
+                                 settings.AI_FAKE_ERROR_RATE)
+        else:
+            _client = get_gemini_client()
+    return _client
@@ -0,0 +1,267 @@
+"""
+Native async versions of FoodAnalyzeView, FoodAnalyzeBatchView, ChatView and
+AdminCheckAIView.
+
+api/urls.py routes these in place of the DRF views when ``ASYNC_VIEWS`` is
+enabled. Under ASGI a request that is waiting on the model no longer holds
+a thread, so one process can keep hundreds of model calls in flight.
+Request and response formats match the sync views.
+"""
+import asyncio
+import io
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse
+from django.shortcuts import render
+from django.urls import reverse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework import exceptions, status
+from rest_framework.parsers import JSONParser
+from rest_framework.request import Request
+
+from .authentication import CachedJWTAuthentication
+from .models import FoodScan, ChatMessage
+from .pagination import KeysetPagination
+from .queues import get_scan_queue
+from .ratelimit import AIRateThrottle, AIServiceUnavailable
+from .renderers import ORJSONRenderer
+from .serializers import FoodScanSerializer
+from . import utils, scan_cache, pipeline, chat_stream, coach_cache, coach_context, encoders, metrics
+
+
+def json_response(data, status=status.HTTP_200_OK, headers=None):
+    # The sync views' default renderer keeps the bytes identical to their output
+    return HttpResponse(ORJSONRenderer().render(data), status=status,
+                        content_type='application/json', headers=headers)
+
+
+def request_data(request):
+    if request.content_type == 'application/json':
+        if not request.body:
+            return {}
+        # DRF's own parser, so malformed JSON fails as it does on the sync views
+        return JSONParser().parse(io.BytesIO(request.body), parser_context={
+            'encoding': request.encoding or settings.DEFAULT_CHARSET,
+        })
+    return request.POST
+
+
+class AsyncAPIView(View):
+    """Async counterpart of the APIView pieces these endpoints use:
+    authentication, a permission check, throttling and DRF-style error
+    responses."""
+    require_staff = False
+    throttle_classes = []
+
+    async def authenticate(self, request):
+        authenticator = CachedJWTAuthentication()
+        result = await sync_to_async(authenticator.authenticate)(request)
+        if result is None:
+            raise exceptions.NotAuthenticated()
+        return result[0]
+
+    def authenticate_header(self):
+        return CachedJWTAuthentication().authenticate_header(None)
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            user = await self.authenticate(request)
+            if self.require_staff and not user.is_staff:
+                raise exceptions.PermissionDenied()
+            request.user = user
+            await sync_to_async(self.check_throttles, thread_sensitive=False)(request)
+            return await super().dispatch(request, *args, **kwargs)
+        except exceptions.APIException as exc:
+            return self.handle_exception(exc)
+
+    def check_throttles(self, request):
+        waits = []
+        for throttle in [throttle_class() for throttle_class in self.throttle_classes]:
+            if not throttle.allow_request(request, self):
+                waits.append(throttle.wait())
+        if waits:
+            raise exceptions.Throttled(max((wait for wait in waits if wait is not None), default=None))
+
+    def handle_exception(self, exc):
+        # Same status/header rules as APIView.handle_exception
+        data = exc.detail if isinstance(exc.detail, (list, dict)) else {"detail": exc.detail}
+        status_code, headers = exc.status_code, None
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            auth_header = self.authenticate_header()
+            if auth_header:
+                headers = {"WWW-Authenticate": auth_header}
+            else:
+                status_code = status.HTTP_403_FORBIDDEN
+        if getattr(exc, 'wait', None):
+            headers = {**(headers or {}), "Retry-After": '%d' % exc.wait}
+        return json_response(data, status=status_code, headers=headers)
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncFoodAnalyzeView(AsyncAPIView):
+    http_method_names = ['post', 'options']
+    throttle_classes = [AIRateThrottle]
+    ai_overflow = 'queue'
+
+    async def post(self, request):
+        image = request.FILES.get('image')
+        if not image:
+            return json_response({"error": "No image provided"}, status=status.HTTP_400_BAD_REQUEST)
+
+        upload = await sync_to_async(pipeline.prepare_upload, thread_sensitive=False)(image)
+        upload_fields = pipeline.upload_fields(request, upload)
+
+        analysis_result = scan_cache.lookup(upload.image.data, upload.digest)
+        cache_status = "hit"
+        retry_after = None
+        if analysis_result is None and not pipeline.wants_async(request):
+            try:
+                analysis_result = await pipeline.arun_analysis(
+                    upload.image.data, upload.image.content_type, upload.digest
+                )
+                cache_status = "miss"
+            except AIServiceUnavailable as exc:
+                retry_after = exc.wait
+
+        if analysis_result is None:
+            await asyncio.wrap_future(upload.stored)
+            scan = await FoodScan.objects.acreate(
+                user=request.user,
+                food_items=[],
+                calories=0, protein=0, carbs=0, fats=0,
+                status=FoodScan.STATUS_PENDING,
+                **upload_fields
+            )
+            await sync_to_async(get_scan_queue().enqueue)(scan)
+            headers = {"Location": reverse('food-scan-detail', args=[scan.id])}
+            if retry_after:
+                headers["Retry-After"] = str(retry_after)
+            return json_response(FoodScanSerializer(scan).data, status=status.HTTP_202_ACCEPTED,
+                                 headers=headers)
+
+        if not analysis_result or "error" in analysis_result:
+            return json_response({"error": analysis_result.get("error", "Analysis failed")},
+                                 status=status.HTTP_400_BAD_REQUEST)
+
+        await asyncio.wrap_future(upload.stored)
+        fields = await sync_to_async(pipeline.analysis_fields)(analysis_result)
+        with metrics.span('db_insert'):
+            scan = await FoodScan.objects.acreate(user=request.user, **upload_fields, **fields)
+        with metrics.span('serialize'):
+            data = FoodScanSerializer(scan).data
+        return json_response(data, status=status.HTTP_201_CREATED,
+                             headers={"X-Scan-Cache": cache_status})
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncFoodAnalyzeBatchView(AsyncAPIView):
+    http_method_names = ['post', 'options']
+    throttle_classes = [AIRateThrottle]
+
+    def ai_call_cost(self, request):
+        return len(request.FILES.getlist('images'))
+
+    async def post(self, request):
+        images = request.FILES.getlist('images')
+        if not images:
+            return json_response({"error": "No images provided"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(images) > settings.SCAN_BATCH_MAX_IMAGES:
+            return json_response({"error": f"At most {settings.SCAN_BATCH_MAX_IMAGES} images per batch"},
+                                 status=status.HTTP_400_BAD_REQUEST)
+
+        semaphore = asyncio.Semaphore(settings.SCAN_BATCH_CONCURRENCY)
+
+        async def analyze(image):
+            async with semaphore:
+                return await self.analyze_upload(image)
+
+        outcomes = await asyncio.gather(*(analyze(image) for image in images))
+        results, all_ok = await sync_to_async(pipeline.record_batch)(request, images, outcomes)
+        return json_response({"results": results},
+                             status=status.HTTP_201_CREATED if all_ok else status.HTTP_207_MULTI_STATUS)
+
+    async def analyze_upload(self, image):
+        # Async counterpart of pipeline.analyze_upload: only the model call
+        # is awaited natively, preprocessing runs in a thread.
+        try:
+            upload = await sync_to_async(pipeline.prepare_upload, thread_sensitive=False)(image)
+            analysis_result = scan_cache.lookup(upload.image.data, upload.digest)
+            cache_status = "hit"
+            if analysis_result is None:
+                analysis_result = await pipeline.arun_analysis(
+                    upload.image.data, upload.image.content_type, upload.digest
+                )
+                cache_status = "miss"
+            if analysis_result and "error" not in analysis_result:
+                await asyncio.wrap_future(upload.stored)
+            return upload, analysis_result, cache_status
+        except AIServiceUnavailable as exc:
+            return None, pipeline.unavailable_result(exc), "miss"
+        except Exception as e:
+            return None, {"error": f"AI Analysis failed: {e}"}, "miss"
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncChatView(AsyncAPIView):
+    http_method_names = ['get', 'post', 'options']
+    throttle_classes = [AIRateThrottle]
+
+    async def get(self, request):
+        messages = ChatMessage.objects.filter(user=request.user)
+        paginator = KeysetPagination()
+        drf_request = Request(request)
+        if paginator.is_requested(drf_request):
+            page = await sync_to_async(paginator.paginate_queryset)(encoders.chat_values(messages), drf_request)
+            return json_response({
+                'next': paginator.get_next_link(),
+                'results': encoders.chat_dicts(page),
+            })
+
+        rows = [row async for row in encoders.chat_values(messages.order_by('timestamp'))]
+        return json_response(encoders.chat_dicts(rows))
+
+    async def post(self, request):
+        message = request_data(request).get('message')
+        if not message:
+            return json_response({"error": "No message provided"}, status=status.HTTP_400_BAD_REQUEST)
+
+        if chat_stream.wants_stream(request):
+            chunks = await utils.astream_ai_coach_response(message, await coach_context.abuild(request.user))
+            return chat_stream.event_stream_response(
+                chat_stream.astream_chat_reply(request.user, message, chunks)
+            )
+
+        ai_response, cache_status = await coach_cache.agenerate(request.user, message)
+
+        await ChatMessage.objects.acreate(
+            user=request.user,
+            message=message,
+            response=ai_response
+        )
+        return json_response({"response": ai_response}, headers={"X-Coach-Cache": cache_status})
+
+
+class AsyncAdminCheckAIView(AsyncAPIView):
+    http_method_names = ['get', 'post', 'options']
+    require_staff = True
+
+    async def authenticate(self, request):
+        # Session auth; CSRF is enforced by CsrfViewMiddleware
+        user = await request.auser()
+        if not user.is_authenticated:
+            raise exceptions.NotAuthenticated()
+        return user
+
+    def authenticate_header(self):
+        return None
+
+    async def get(self, request):
+        return await sync_to_async(render)(request, 'api/check_ai.html')
+
+    async def post(self, request):
+        api_key = request_data(request).get('api_key')
+        result = await utils.test_gemini_connection_async(api_key)
+        return json_response(result)
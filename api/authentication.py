@@ -0,0 +1,61 @@
+"""
+JWT authentication that does not load the user on every request.
+
+simplejwt's ``JWTAuthentication`` trusts the token's signature but still
+fetches the ``User`` row each time, and ``UserSerializer`` then fetches the
+profile lazily. ``CachedJWTAuthentication`` keeps the user, with its
+profile already joined, in the ``auth_users`` cache for
+``AUTH_USER_CACHE_TTL`` seconds, so a warm request authenticates without a
+query and ``/api/auth/me`` is served without touching the database.
+
+Saving or deleting a ``User`` or ``UserProfile`` drops the cached copy (see
+api/signals.py). Writes that skip signals (``QuerySet.update()``) or happen
+in another process with an in-process cache are picked up when the entry
+expires, so keep the TTL short.
+"""
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+CACHE_ALIAS = 'auth_users'
+
+
+def _cache_key(user_id) -> str:
+    return f"auth:user:{user_id}"
+
+
+def load_user(user_id):
+    """The user with its profile joined, or None."""
+    User = get_user_model()
+    return User.objects.select_related('profile').filter(**{api_settings.USER_ID_FIELD: user_id}).first()
+
+
+def invalidate_user(user_id) -> None:
+    caches[CACHE_ALIAS].delete(_cache_key(user_id))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        cache = caches[CACHE_ALIAS]
+        user = cache.get(_cache_key(user_id))
+        if user is None:
+            user = load_user(user_id)
+            if user is None:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found")
+            cache.set(_cache_key(user_id), user)
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if api_settings.CHECK_REVOKE_TOKEN \
+                and validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+            raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+        return user
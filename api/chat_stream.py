@@ -0,0 +1,70 @@
+"""
+Server-Sent Events relay for streamed AI coach replies.
+
+Each model chunk is sent as ``data: {"delta": "..."}``. When the model
+finishes, the ChatMessage row is written and a final ``event: done`` carries
+the full reply; a failure ends the stream with ``event: error`` instead.
+The model stream is opened before the response starts (see
+``utils.stream_ai_coach_response``), so a shed or failed call is still an
+ordinary error response.
+"""
+import json
+import logging
+
+from django.http import StreamingHttpResponse
+
+from .models import ChatMessage
+
+logger = logging.getLogger(__name__)
+
+
+def sse_event(data, event=None) -> bytes:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n".encode()
+
+
+def wants_stream(request) -> bool:
+    """Streaming is requested with ?stream=true or `Accept: text/event-stream`."""
+    if request.GET.get('stream', '').lower() in ('1', 'true'):
+        return True
+    return 'text/event-stream' in request.headers.get('Accept', '')
+
+
+def event_stream_response(events):
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def stream_chat_reply(user, message, chunks):
+    parts = []
+    try:
+        for chunk in chunks:
+            parts.append(chunk)
+            yield sse_event({"delta": chunk})
+    except Exception as e:
+        logger.warning("Coach stream failed: %s", e)
+        yield sse_event({"error": f"AI Coach failed: {e}"}, event="error")
+        return
+
+    response = "".join(parts)
+    ChatMessage.objects.create(user=user, message=message, response=response)
+    yield sse_event({"response": response}, event="done")
+
+
+async def astream_chat_reply(user, message, chunks):
+    parts = []
+    try:
+        async for chunk in chunks:
+            parts.append(chunk)
+            yield sse_event({"delta": chunk})
+    except Exception as e:
+        logger.warning("Coach stream failed: %s", e)
+        yield sse_event({"error": f"AI Coach failed: {e}"}, event="error")
+        return
+
+    response = "".join(parts)
+    await ChatMessage.objects.acreate(user=user, message=message, response=response)
+    yield sse_event({"response": response}, event="done")
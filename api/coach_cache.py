@@ -0,0 +1,313 @@
+"""
+Reply cache for the AI coach.
+
+Replies are keyed on the normalized message text (case, punctuation and
+spacing folded) plus the user's goal context and
+``utils.COACH_CACHE_VERSION``. Storage, TTL and LRU eviction come from the
+``coach_replies`` cache alias (see ``CACHES`` in settings).
+
+Every reply is cached for its own user. A reply is also shared with other
+users with the same goal only when the whole prompt could have come from
+anyone: the message carries nothing personal (no numbers, e-mail addresses
+or "my"/"I am" statements) and the conversation context sent with it
+(api/coach_context.py) told the model nothing but that goal. A reply
+written with the user's intake, lifestyle or earlier turns in view is kept
+in their own scope.
+
+Nearest-neighbour lookup is optional: when ``COACH_CACHE_SIMILARITY`` is
+greater than zero, each cached message is embedded with
+``COACH_CACHE_EMBEDDING_MODEL`` and kept in a bounded in-process index. A
+miss on the exact key falls back to the most similar cached message (cosine
+similarity at or above the threshold) with the same goal, among the user's
+own replies and, for generic messages, the generic ones.
+
+The conversation context is not part of the key: a user's own cached
+reply answers the message again even after their context has moved on.
+
+Hits, misses and the model time they saved are counted for
+``/api/admin/ai-limits``.
+"""
+import hashlib
+import logging
+import math
+import re
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+
+from . import coach_context, utils
+from .ai_client import get_ai_client
+from .models import UserProfile
+
+logger = logging.getLogger(__name__)
+
+CACHE_ALIAS = 'coach_replies'
+GENERIC_SCOPE = 'generic'
+COUNTERS = ('hits', 'semantic_hits', 'misses', 'saved_ms')
+PERSONAL_PATTERN = re.compile(
+    r"\d|@|\b(my|mine|myself|i'm|im|i am|i've|i have|i weigh|years old)\b",
+    re.IGNORECASE,
+)
+
+_vector_index = OrderedDict()  # cache key -> IndexEntry
+_vector_lock = threading.Lock()
+
+
+class IndexEntry(NamedTuple):
+    scope: str
+    context: str
+    vector: array
+
+
+class Lookup(NamedTuple):
+    reply: Optional[str]
+    status: str  # "hit", "semantic" or "miss"
+    vector: Optional[array] = None
+
+
+def normalize(text: Optional[str]) -> str:
+    text = unicodedata.normalize('NFKC', text or '').casefold()
+    return " ".join(re.sub(r"[^\w\s']", " ", text).split())
+
+
+def is_generic(message: str) -> bool:
+    """True when a reply to ``message`` may be shared with other users."""
+    return not PERSONAL_PATTERN.search(normalize(message))
+
+
+def is_shareable(message: str, goal: Optional[str], prompt_context: str) -> bool:
+    """True when a reply generated with ``prompt_context`` may be shared with other users."""
+    return is_generic(message) and prompt_context == coach_context.goal_only(goal)
+
+
+def user_scope(user_id) -> str:
+    return f"user:{user_id}"
+
+
+def _cache_key(scope: str, message: str, context: str) -> str:
+    digest = hashlib.sha256(f"{message}\n{context}".encode()).hexdigest()
+    return f"coach:{utils.COACH_CACHE_VERSION}:{scope}:{digest}"
+
+
+def user_context(user) -> Optional[str]:
+    """The goal that cached replies are keyed on."""
+    if User.profile.is_cached(user):
+        # Already joined by CachedJWTAuthentication; a missing profile raises AttributeError
+        return getattr(getattr(user, 'profile', None), 'goal', None)
+    return UserProfile.objects.filter(user=user).values_list('goal', flat=True).first()
+
+
+async def auser_context(user) -> Optional[str]:
+    if User.profile.is_cached(user):
+        return getattr(getattr(user, 'profile', None), 'goal', None)
+    return await UserProfile.objects.filter(user=user).values_list('goal', flat=True).afirst()
+
+
+def _similarity_threshold() -> float:
+    return getattr(settings, 'COACH_CACHE_SIMILARITY', 0)
+
+
+def _unit(values) -> Optional[array]:
+    norm = math.sqrt(sum(v * v for v in values))
+    if not norm:
+        return None
+    return array('f', (v / norm for v in values))
+
+
+def _embed(message: str) -> Optional[array]:
+    try:
+        return _unit(get_ai_client().embed_content(
+            settings.COACH_CACHE_EMBEDDING_MODEL, message,
+            dimensions=settings.COACH_CACHE_EMBEDDING_DIMENSIONS,
+            timeout=settings.COACH_CACHE_EMBEDDING_TIMEOUT,
+        ))
+    except Exception as e:
+        logger.warning("Coach cache embedding failed: %s", e)
+        return None
+
+
+async def _aembed(message: str) -> Optional[array]:
+    try:
+        return _unit(await get_ai_client().aembed_content(
+            settings.COACH_CACHE_EMBEDDING_MODEL, message,
+            dimensions=settings.COACH_CACHE_EMBEDDING_DIMENSIONS,
+            timeout=settings.COACH_CACHE_EMBEDDING_TIMEOUT,
+        ))
+    except Exception as e:
+        logger.warning("Coach cache embedding failed: %s", e)
+        return None
+
+
+def _nearest_key(vector: array, scopes, context: str) -> Optional[str]:
+    best_key, best_score = None, _similarity_threshold()
+    with _vector_lock:
+        for key, entry in _vector_index.items():
+            if entry.context != context or entry.scope not in scopes:
+                continue
+            score = sum(map(float.__mul__, vector, entry.vector))
+            if score >= best_score:
+                best_key, best_score = key, score
+        if best_key is not None:
+            _vector_index.move_to_end(best_key)
+    return best_key
+
+
+def _remember_vector(key: str, entry: IndexEntry) -> None:
+    limit = getattr(settings, 'COACH_CACHE_MAX_ENTRIES', 1000)
+    with _vector_lock:
+        _vector_index[key] = entry
+        _vector_index.move_to_end(key)
+        while len(_vector_index) > limit:
+            _vector_index.popitem(last=False)
+
+
+def _count(name: str, amount: int = 1) -> None:
+    cache = caches['default']
+    key = f"coach:metrics:{name}"
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key, amount)
+    except ValueError:
+        cache.set(key, amount, timeout=None)
+
+
+def _exact(user_id, message: str, context: Optional[str]):
+    """``(key, entry)`` of an exact hit, looking in the user's scope first."""
+    cache = caches[CACHE_ALIAS]
+    text, goal = normalize(message), normalize(context)
+    scopes = [user_scope(user_id)] + ([GENERIC_SCOPE] if is_generic(message) else [])
+    for scope in scopes:
+        key = _cache_key(scope, text, goal)
+        entry = cache.get(key)
+        if entry is not None:
+            return key, entry
+    return None, None
+
+
+def _semantic(user_id, message: str, context: Optional[str], vector: Optional[array]):
+    if vector is None:
+        return None
+    scopes = {user_scope(user_id)} | ({GENERIC_SCOPE} if is_generic(message) else set())
+    key = _nearest_key(vector, scopes, normalize(context))
+    if key is None:
+        return None
+    entry = caches[CACHE_ALIAS].get(key)
+    if entry is None:
+        # Expired or evicted from the cache; drop it from the index too
+        with _vector_lock:
+            _vector_index.pop(key, None)
+    return entry
+
+
+def _hit(entry: dict, status: str, vector=None) -> Lookup:
+    _count('semantic_hits' if status == 'semantic' else 'hits')
+    _count('saved_ms', int(entry.get('ms', 0)))
+    return Lookup(entry['reply'], status, vector)
+
+
+def lookup(user_id, message: str, context: Optional[str] = None) -> Lookup:
+    """Return the cached reply for this user, message and goal, if any."""
+    _, entry = _exact(user_id, message, context)
+    if entry is not None:
+        return _hit(entry, 'hit')
+    if _similarity_threshold() <= 0:
+        _count('misses')
+        return Lookup(None, 'miss')
+    vector = _embed(normalize(message))
+    entry = _semantic(user_id, message, context, vector)
+    if entry is not None:
+        return _hit(entry, 'semantic', vector)
+    _count('misses')
+    return Lookup(None, 'miss', vector)
+
+
+async def alookup(user_id, message: str, context: Optional[str] = None) -> Lookup:
+    """Async counterpart of lookup(); only the embedding call is awaited."""
+    _, entry = _exact(user_id, message, context)
+    if entry is not None:
+        return _hit(entry, 'hit')
+    if _similarity_threshold() <= 0:
+        _count('misses')
+        return Lookup(None, 'miss')
+    vector = await _aembed(normalize(message))
+    entry = _semantic(user_id, message, context, vector)
+    if entry is not None:
+        return _hit(entry, 'semantic', vector)
+    _count('misses')
+    return Lookup(None, 'miss', vector)
+
+
+def store(user_id, message: str, context: Optional[str], reply: str, elapsed: float,
+          vector: Optional[array] = None, shared: bool = False) -> None:
+    """Cache a reply that took ``elapsed`` seconds to generate.
+
+    ``vector`` is the message embedding from the preceding lookup, if any.
+    The reply also goes to the generic scope when ``shared`` (see
+    is_shareable()). Offline replies are never cached.
+    """
+    if not reply or reply == utils.OFFLINE_COACH_REPLY:
+        return
+    cache = caches[CACHE_ALIAS]
+    text, goal = normalize(message), normalize(context)
+    entry = {'reply': reply, 'ms': elapsed * 1000}
+    scope = user_scope(user_id)
+    cache.set(_cache_key(scope, text, goal), entry)
+    if shared:
+        scope = GENERIC_SCOPE
+        cache.set(_cache_key(scope, text, goal), entry)
+
+    if vector is not None and _similarity_threshold() > 0:
+        _remember_vector(_cache_key(scope, text, goal), IndexEntry(scope, goal, vector))
+
+
+def generate(user, message: str):
+    """The coach's reply to ``message``, from the cache when possible.
+
+    Returns ``(reply, cache_status)``.
+    """
+    context = user_context(user)
+    cached = lookup(user.pk, message, context)
+    if cached.reply is not None:
+        return cached.reply, cached.status
+    started = time.perf_counter()
+    prompt_context = coach_context.build(user)
+    reply = utils.get_ai_coach_response(message, prompt_context)
+    store(user.pk, message, context, reply, time.perf_counter() - started, cached.vector,
+          shared=is_shareable(message, context, prompt_context))
+    return reply, cached.status
+
+
+async def agenerate(user, message: str):
+    """Async counterpart of generate()."""
+    context = await auser_context(user)
+    cached = await alookup(user.pk, message, context)
+    if cached.reply is not None:
+        return cached.reply, cached.status
+    started = time.perf_counter()
+    prompt_context = await coach_context.abuild(user)
+    reply = await utils.get_ai_coach_response_async(message, prompt_context)
+    store(user.pk, message, context, reply, time.perf_counter() - started, cached.vector,
+          shared=is_shareable(message, context, prompt_context))
+    return reply, cached.status
+
+
+def snapshot() -> dict:
+    """Hit rate and model time saved, for monitoring."""
+    cache = caches['default']
+    counts = {name: cache.get(f"coach:metrics:{name}") or 0 for name in COUNTERS}
+    lookups = counts['hits'] + counts['semantic_hits'] + counts['misses']
+    with _vector_lock:
+        indexed = len(_vector_index)
+    return {
+        **counts,
+        'hit_rate': round((counts['hits'] + counts['semantic_hits']) / lookups, 3) if lookups else None,
+        'saved_seconds': round(counts['saved_ms'] / 1000, 1),
+        'indexed_messages': indexed,
+    }
@@ -0,0 +1,210 @@
+"""
+Bounded context for AI coach prompts.
+
+``build(user)`` assembles what the coach is told besides the new message:
+the user's goal and lifestyle, what they have eaten today and over the
+last ``COACH_CONTEXT_INTAKE_DAYS`` (from the DailyNutritionSummary
+rollups), a rolling summary of older turns, and the latest turns verbatim.
+The parts are fitted into ``COACH_CONTEXT_MAX_TOKENS`` in that order of
+priority, newest turns first, so the prompt stops growing with the
+conversation.
+
+Older turns are not resent. Once ``COACH_CONTEXT_TURNS`` +
+``COACH_SUMMARY_BATCH`` turns are past the summary, the oldest batch is
+folded into the user's ChatSummary by the ``coach_summary`` route on a
+background thread. Until then the unsummarized turns still go out (budget
+permitting), so no turn drops out of the context in between. The summary
+is cached in the default cache, so a warm build costs two queries: the
+intake rollups and the latest turns.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import lru_cache
+from typing import Tuple
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .models import ChatMessage, ChatSummary, UserProfile
+from . import rollups, utils
+
+logger = logging.getLogger(__name__)
+
+# Rough average for English text; close enough to budget a prompt without a tokenizer
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def clip(text: str, tokens: int) -> str:
+    limit = max(0, tokens) * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    return text[:max(0, limit - 1)].rstrip() + "…"
+
+
+def _summary_key(user_id) -> str:
+    return f"coach:summary:{user_id}"
+
+
+def _lock_key(user_id) -> str:
+    return f"coach:summary-lock:{user_id}"
+
+
+def profile_lines(user):
+    if User.profile.is_cached(user):
+        # Already joined by CachedJWTAuthentication; a missing profile raises AttributeError
+        profile = getattr(user, 'profile', None)
+        goal, lifestyle = getattr(profile, 'goal', None), getattr(profile, 'lifestyle', None)
+    else:
+        goal, lifestyle = UserProfile.objects.filter(user=user).values_list(
+            'goal', 'lifestyle').first() or (None, None)
+    lines = []
+    if goal:
+        lines.append(f"Goal: {goal}")
+    if lifestyle:
+        lines.append(f"Lifestyle: {lifestyle}")
+    return lines
+
+
+def _intake(totals, days=1) -> str:
+    return (f"{totals['calories'] / days:.0f} kcal, {totals['protein'] / days:.0f} g protein, "
+            f"{totals['carbs'] / days:.0f} g carbs, {totals['fats'] / days:.0f} g fat")
+
+
+def intake_lines(user):
+    days = settings.COACH_CONTEXT_INTAKE_DAYS
+    today = timezone.localdate()
+    summary = rollups.summarize(user, today - timedelta(days=days - 1), today)
+    if not summary['totals']['scan_count']:
+        return []
+    return [
+        f"Eaten today: {_intake(summary['periods'][-1])}",
+        f"Daily average over the last {days} days: {_intake(summary['totals'], days)}",
+    ]
+
+
+def cached_summary(user_id) -> Tuple[str, int]:
+    """``(summary, last_message_id)`` of the user's rolling summary."""
+    cache = caches['default']
+    entry = cache.get(_summary_key(user_id))
+    if entry is None:
+        entry = ChatSummary.objects.filter(user_id=user_id).values_list(
+            'summary', 'last_message_id').first() or ('', 0)
+        cache.set(_summary_key(user_id), entry, settings.COACH_SUMMARY_CACHE_TTL)
+    return entry
+
+
+def _unsummarized(user_id, last_message_id):
+    """Newest first, at most the recent window plus one batch."""
+    window = settings.COACH_CONTEXT_TURNS + settings.COACH_SUMMARY_BATCH
+    return list(
+        ChatMessage.objects.filter(user_id=user_id, id__gt=last_message_id)
+        .order_by('-timestamp', '-id').values_list('id', 'message', 'response')[:window]
+    )
+
+
+def _turn(message: str, response: str) -> str:
+    return f"User: {message}\nCoach: {response}"
+
+
+def build(user) -> str:
+    """The context block for ``user``'s next coach prompt."""
+    budget = settings.COACH_CONTEXT_MAX_TOKENS
+    sections = []
+
+    def add(title, text):
+        nonlocal budget
+        room = budget - estimate_tokens(title) - 1
+        if room > 0:
+            sections.append(f"{title}\n{clip(text, room)}")
+            budget -= estimate_tokens(sections[-1]) + 1
+
+    about = profile_lines(user) + intake_lines(user)
+    if about:
+        add("About the user:", "\n".join(about))
+
+    summary, last_message_id = cached_summary(user.pk)
+    if summary:
+        add("Earlier in the conversation:", clip(summary, settings.COACH_SUMMARY_MAX_TOKENS))
+
+    turns = _unsummarized(user.pk, last_message_id)
+    if len(turns) == settings.COACH_CONTEXT_TURNS + settings.COACH_SUMMARY_BATCH:
+        schedule_fold(user.pk)
+    recent = []
+    budget -= estimate_tokens("Recent conversation:") + 1
+    for _, message, response in turns:
+        text = _turn(message, response)
+        if estimate_tokens(text) + 1 > budget:
+            if not recent and budget > 1:
+                # Always keep the latest turn, shortened if it must be
+                recent.append(clip(text, budget - 1))
+            break
+        recent.append(text)
+        budget -= estimate_tokens(text) + 1
+    if recent:
+        sections.append("Recent conversation:\n" + "\n".join(reversed(recent)))
+
+    return "\n\n".join(sections)
+
+
+def goal_only(goal) -> str:
+    """What build() returns for a user with a goal (or none) and nothing else on record."""
+    return f"About the user:\nGoal: {goal}" if goal else ""
+
+
+async def abuild(user) -> str:
+    return await sync_to_async(build)(user)
+
+
+@lru_cache(maxsize=None)
+def _executor():
+    return ThreadPoolExecutor(max_workers=settings.COACH_SUMMARY_WORKERS, thread_name_prefix='coach-summary')
+
+
+def schedule_fold(user_id) -> None:
+    """Fold older turns into the summary in the background, once at a time per user."""
+    if not utils.ai_configured():
+        return
+    # The lock expires on its own should the process die mid-fold
+    if caches['default'].add(_lock_key(user_id), True, timeout=300):
+        _executor().submit(_fold_in_background, user_id)
+
+
+def _fold_in_background(user_id):
+    try:
+        fold(user_id)
+    except Exception as e:
+        logger.warning("Chat summary update for user %s failed: %s", user_id, e)
+    finally:
+        caches['default'].delete(_lock_key(user_id))
+        close_old_connections()
+
+
+def fold(user_id) -> bool:
+    """Fold the turns before the recent window into the user's summary.
+
+    Only the batch just before the window is summarized; a backlog older
+    than that (history from before summaries existed) is skipped rather
+    than replayed through the model. Returns whether the summary changed.
+    """
+    summary, last_message_id = ChatSummary.objects.filter(user_id=user_id).values_list(
+        'summary', 'last_message_id').first() or ('', 0)
+    older = _unsummarized(user_id, last_message_id)[settings.COACH_CONTEXT_TURNS:]
+    if len(older) < settings.COACH_SUMMARY_BATCH:
+        return False
+    older.reverse()
+    summary = utils.summarize_conversation(summary, "\n".join(_turn(m, r) for _, m, r in older))
+    ChatSummary.objects.update_or_create(user_id=user_id, defaults={
+        'summary': clip(summary, settings.COACH_SUMMARY_MAX_TOKENS),
+        'last_message_id': max(pk for pk, _, _ in older),
+    })
+    caches['default'].delete(_summary_key(user_id))
+    return True
@@ -0,0 +1,175 @@
+"""
+Read-only fast path for the scan history and chat history.
+
+FoodScanSerializer and ChatMessageSerializer run DRF's field machinery for
+every row: an attribute lookup, a default check and a to_representation
+call per field. On a long history that is most of the request's CPU.
+Here the rows come from ``values_list()`` instead, and each tuple goes
+through an encoder compiled once per field selection: a generated function
+that builds the output dict in a single expression, with the serializer's
+conversions and defaults baked in. JSON columns are selected as text and
+decoded with orjson when it is installed.
+
+The dicts equal what the serializers produce (same keys, order and
+values), so the response bytes do not change. The serializers stay the
+definition of the format; keep ``SCAN_FIELDS`` and ``CHAT_FIELDS`` in step
+with them. Rows always start with ``(id, timestamp)``, which is what
+KeysetPagination needs for its cursor.
+"""
+import json
+from functools import lru_cache
+from typing import NamedTuple, Optional
+
+from django.db.models import JSONField, TextField
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from .models import ChatMessage, FoodScan
+from .renderers import orjson
+from .storage import resolve_url
+
+
+class Column(NamedTuple):
+    source: Optional[str]  # model field, or None for a constant
+    expression: str = "{}"  # Python expression turning the selected value {} into the output
+    constant: object = None
+
+
+SCAN_FIELDS = {
+    'id': Column('id'),
+    'image_url': Column('image_url', "_url({})"),
+    'thumbnail_url': Column('thumbnail_url', "_url({})"),
+    'detected_foods': Column('food_items'),
+    'total_calories': Column('calories', "float({})"),
+    'total_protein': Column('protein', "float({})"),
+    'total_carbs': Column('carbs', "float({})"),
+    'total_fats': Column('fats', "float({})"),
+    # Defaults of FoodScanSerializer fields with no model attribute behind them
+    'total_fiber': Column(None, constant=0.0),
+    'total_sugar': Column(None, constant=0.0),
+    'total_sodium': Column(None, constant=0.0),
+    'confidence_score': Column(None, constant=0.95),
+    'health_score': Column('health_score', "str({})"),
+    'dietary_tags': Column('dietary_tags', "_strings({})"),
+    'ai_insights': Column('ai_insights', "str({})"),
+    'analysis_time': Column(None, constant=1.2),
+    'created_at': Column('timestamp', "_datetime({})"),
+    'meal_type': Column('meal_type', "_optional_str({})"),
+    'status': Column('status', "str({})"),
+    'error': Column('error', "str({})"),
+}
+
+CHAT_FIELDS = {
+    'id': Column('id'),
+    'message': Column('message', "str({})"),
+    'response': Column('response', "str({})"),
+    'timestamp': Column('timestamp', "_datetime({})"),
+    'user': Column('user_id'),
+}
+
+SPECS = {
+    'scan': (FoodScan, SCAN_FIELDS),
+    'chat': (ChatMessage, CHAT_FIELDS),
+}
+
+
+def _url(value):
+    return resolve_url(value) if value else value
+
+
+def _strings(values):
+    # ListField(child=CharField())
+    return [None if value is None else str(value) for value in values]
+
+
+def _optional_str(value):
+    return None if value is None else str(value)
+
+
+def _datetime(value):
+    # DateTimeField: converted to the current time zone, ISO 8601, UTC as "Z"
+    if value is None:
+        return None
+    value = value.astimezone(timezone.get_current_timezone()).isoformat()
+    return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+
+def _json(text):
+    # JSON columns are selected as text: orjson decodes them to the same
+    # values as JSONField's json.loads, several times faster
+    if text is None:
+        return None
+    if orjson is not None:
+        try:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError:
+            pass  # NaN, integers beyond 64 bits, or not JSON at all
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return text
+
+
+_HELPERS = {'_url': _url, '_strings': _strings, '_optional_str': _optional_str, '_datetime': _datetime,
+            '_json': _json}
+
+
+class RowEncoder(NamedTuple):
+    columns: tuple  # for values_list(); always starts with id and timestamp
+    encode: object  # tuple -> dict
+
+
+@lru_cache(maxsize=64)
+def compile_encoder(spec_name: str, fields: tuple) -> RowEncoder:
+    """An encoder for ``fields`` (in the serializer's order) of a spec in ``SPECS``."""
+    model, spec = SPECS[spec_name]
+    sources = ['id', 'timestamp']
+    namespace = dict(_HELPERS)
+    items = []
+    for name in fields:
+        column = spec[name]
+        if column.source is None:
+            namespace[f'_const_{name}'] = column.constant
+            items.append(f"{name!r}: _const_{name}")
+            continue
+        if column.source not in sources:
+            sources.append(column.source)
+        value = f"row[{sources.index(column.source)}]"
+        if isinstance(model._meta.get_field(column.source), JSONField):
+            value = f"_json({value})"
+        items.append(f"{name!r}: {column.expression.format(value)}")
+    source = "def encode(row):\n    return {" + ", ".join(items) + "}\n"
+    exec(compile(source, f"<{spec_name} encoder>", 'exec'), namespace)
+    columns = tuple(
+        Cast(name, TextField()) if isinstance(model._meta.get_field(name), JSONField) else name
+        for name in sources
+    )
+    return RowEncoder(columns, namespace['encode'])
+
+
+def _encoder(spec_name, fields):
+    spec = SPECS[spec_name][1]
+    if fields is None:
+        return compile_encoder(spec_name, tuple(spec))
+    return compile_encoder(spec_name, tuple(name for name in spec if name in fields))
+
+
+def scan_values(queryset, fields=None):
+    """``queryset`` as values_list() rows for scan_dicts()."""
+    return queryset.values_list(*_encoder('scan', fields).columns)
+
+
+def scan_dicts(rows, fields=None):
+    """FoodScanSerializer(many=True, fields=fields).data for scan_values() rows."""
+    encode = _encoder('scan', fields).encode
+    return [encode(row) for row in rows]
+
+
+def chat_values(queryset):
+    return queryset.values_list(*_encoder('chat', None).columns)
+
+
+def chat_dicts(rows):
+    """ChatMessageSerializer(many=True).data for chat_values() rows."""
+    encode = _encoder('chat', None).encode
+    return [encode(row) for row in rows]
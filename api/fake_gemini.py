@@ -0,0 +1,152 @@
+"""
+A local stand-in for the Gemini REST API, for load tests.
+
+``AI_BACKEND=fake`` (api/ai_client.py) replaces the client inside the app.
+This server instead sits behind the real ``GeminiClient``, so a benchmark
+also covers the HTTP hop, the SDK, connection pooling and error handling.
+Point the app at it with ``GEMINI_API_BASE_URL=http://host:port/v1beta``
+and any ``GEMINI_API_KEY`` (see ``ai_client.configure_sdk``).
+
+It serves ``generateContent``, ``streamGenerateContent`` (SSE or the SDK's
+JSON array) and ``embedContent``. Requests with an image get the fake
+scan analysis, and other requests get the fake coach reply. Latency
+follows a ``FakeLatency`` distribution, and a share of requests fail with a
+429 (quota) or a 503 (overloaded). The random source is seeded, so runs are
+reproducible.
+"""
+import asyncio
+import json
+import math
+import random
+import threading
+from typing import NamedTuple
+
+from aiohttp import web
+
+from .ai_client import FAKE_ANALYSIS, FAKE_COACH_REPLY, FakeClient
+
+DISTRIBUTIONS = ('fixed', 'uniform', 'lognormal')
+
+
+class FakeLatency(NamedTuple):
+    """Model latency: ``fixed`` at ``median_ms``; ``uniform`` within
+    ``median_ms`` ± ``spread``; ``lognormal`` around ``median_ms`` with
+    sigma ``spread``. A ``tail_rate`` share of calls takes ``tail_ms``."""
+    distribution: str = 'lognormal'
+    median_ms: float = 1500
+    spread: float = 0.4
+    tail_rate: float = 0.0
+    tail_ms: float = 30000
+
+    def sample(self, rng: random.Random) -> float:
+        if self.tail_rate and rng.random() < self.tail_rate:
+            return self.tail_ms / 1000
+        if self.distribution == 'fixed':
+            ms = self.median_ms
+        elif self.distribution == 'uniform':
+            ms = self.median_ms + rng.uniform(-self.spread, self.spread)
+        else:
+            ms = self.median_ms * math.exp(rng.gauss(0, self.spread))
+        return max(0.0, ms) / 1000
+
+
+class FakeGemini:
+    def __init__(self, latency: FakeLatency = FakeLatency(), error_rate: float = 0.0,
+                 quota_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.quota_rate = quota_rate
+        self.rng = random.Random(seed)
+        self.embedder = FakeClient()
+        self.requests = 0
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_post(r'/v1beta/models/{model}:generateContent', self.generate)
+        app.router.add_post(r'/v1beta/models/{model}:streamGenerateContent', self.stream)
+        app.router.add_post(r'/v1beta/models/{model}:embedContent', self.embed)
+        return app
+
+    async def _wait(self):
+        """Sleep for a sampled latency; returns an error response or None."""
+        self.requests += 1
+        delay, roll = self.latency.sample(self.rng), self.rng.random()
+        await asyncio.sleep(delay)
+        if roll < self.quota_rate:
+            return _error(429, "RESOURCE_EXHAUSTED", "Resource has been exhausted (e.g. check quota).")
+        if roll < self.quota_rate + self.error_rate:
+            return _error(503, "UNAVAILABLE", "The model is overloaded. Please try again later.")
+        return None
+
+    @staticmethod
+    def _reply(body) -> str:
+        parts = [part for content in body.get('contents', []) for part in content.get('parts', [])]
+        if any('inline_data' in part or 'inlineData' in part for part in parts):
+            config = body.get('generationConfig') or body.get('generation_config') or {}
+            if config.get('responseMimeType') or config.get('response_mime_type'):
+                return json.dumps(FAKE_ANALYSIS)
+            return "```json\n" + json.dumps(FAKE_ANALYSIS) + "\n```"
+        return FAKE_COACH_REPLY
+
+    async def generate(self, request):
+        body = await request.json()
+        error = await self._wait()
+        return error or web.json_response(_candidate(self._reply(body), 'STOP'))
+
+    async def stream(self, request):
+        body = await request.json()
+        error = await self._wait()
+        if error is not None:
+            return error
+        words = self._reply(body).split(" ")
+        chunks = [_candidate(" ".join(words[i:i + 8]) + (" " if i + 8 < len(words) else ""))
+                  for i in range(0, len(words), 8)]
+        if request.query.get('alt') != 'sse':
+            # The SDK's REST transport reads one JSON array
+            return web.json_response(chunks)
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+        await response.prepare(request)
+        for chunk in chunks:
+            await response.write(b"data: " + json.dumps(chunk).encode() + b"\r\n\r\n")
+        await response.write_eof()
+        return response
+
+    async def embed(self, request):
+        body = await request.json()
+        error = await self._wait()
+        if error is not None:
+            return error
+        text = " ".join(part.get('text', '') for part in body.get('content', {}).get('parts', []))
+        dimensions = body.get('outputDimensionality') or body.get('output_dimensionality')
+        return web.json_response({'embedding': {'values': self.embedder.embed_content('', text, dimensions)}})
+
+    def start_in_thread(self, host: str = '127.0.0.1', port: int = 0) -> int:
+        """Serve on a daemon thread; returns the bound port."""
+        started = threading.Event()
+        bound = {}
+
+        def run():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            runner = web.AppRunner(self.app(), access_log=None)
+            loop.run_until_complete(runner.setup())
+            site = web.TCPSite(runner, host, port)
+            loop.run_until_complete(site.start())
+            bound['port'] = runner.addresses[0][1]
+            started.set()
+            loop.run_forever()
+
+        threading.Thread(target=run, name='fake-gemini', daemon=True).start()
+        started.wait()
+        return bound['port']
+
+
+def _candidate(text: str, finish_reason: str = None) -> dict:
+    candidate = {'content': {'role': 'model', 'parts': [{'text': text}]}, 'index': 0}
+    if finish_reason:
+        candidate['finishReason'] = finish_reason
+    return {'candidates': [candidate]}
+
+
+def _error(status: int, code: str, message: str):
+    return web.json_response({'error': {'code': status, 'message': message, 'status': code}}, status=status)
@@ -0,0 +1,109 @@
+"""
+Password hashing for the login path.
+
+Password hashes are deliberately expensive: Django's default PBKDF2 costs
+a few hundred milliseconds of CPU per login. The cost is tunable here:
+``PASSWORD_HASHER`` picks the algorithm new hashes use (``pbkdf2``,
+``bcrypt``, or ``argon2`` with argon2-cffi installed), and
+``PASSWORD_PBKDF2_ITERATIONS`` / ``PASSWORD_BCRYPT_ROUNDS`` /
+``PASSWORD_ARGON2_*`` set its work factor. Hashes made with any other
+algorithm or cost keep verifying and are re-hashed on the next successful
+login.
+
+Hashing runs on a small dedicated pool (``AUTH_HASH_MAX_THREADS``). The
+hash functions release the GIL, so a burst of logins (say, after a push
+notification) uses at most that many cores while every other endpoint
+keeps being served. Logins beyond ``AUTH_HASH_MAX_WAITING`` queued ones
+are shed with a 503 and ``Retry-After`` rather than piling up.
+"""
+import math
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    @property
+    def iterations(self):
+        return settings.PASSWORD_PBKDF2_ITERATIONS
+
+
+class BCryptSHA256PasswordHasher(hashers.BCryptSHA256PasswordHasher):
+    @property
+    def rounds(self):
+        return settings.PASSWORD_BCRYPT_ROUNDS
+
+
+class Argon2PasswordHasher(hashers.Argon2PasswordHasher):
+    @property
+    def time_cost(self):
+        return settings.PASSWORD_ARGON2_TIME_COST
+
+    @property
+    def memory_cost(self):
+        return settings.PASSWORD_ARGON2_MEMORY_COST
+
+    @property
+    def parallelism(self):
+        return settings.PASSWORD_ARGON2_PARALLELISM
+
+
+class LoginBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many sign-ins at once. Please retry shortly.'
+    default_code = 'login_busy'
+
+    def __init__(self, wait=1, detail=None):
+        self.wait = max(1, math.ceil(wait))
+        super().__init__(detail)
+
+
+@lru_cache(maxsize=None)
+def _executor():
+    return ThreadPoolExecutor(max_workers=settings.AUTH_HASH_MAX_THREADS, thread_name_prefix='password-hash')
+
+
+@lru_cache(maxsize=None)
+def _slots():
+    # Running plus waiting hashes
+    return threading.BoundedSemaphore(settings.AUTH_HASH_MAX_THREADS + settings.AUTH_HASH_MAX_WAITING)
+
+
+def _run(fn, *args):
+    if not _slots().acquire(blocking=False):
+        raise LoginBusy()
+    try:
+        return _executor().submit(fn, *args).result()
+    finally:
+        _slots().release()
+
+
+def make_password(password: str) -> str:
+    return _run(hashers.make_password, password)
+
+
+def needs_rehash(encoded: str) -> bool:
+    try:
+        hasher = hashers.identify_hasher(encoded)
+    except ValueError:
+        return False
+    preferred = hashers.get_hasher('default')
+    return hasher.algorithm != preferred.algorithm or preferred.must_update(encoded)
+
+
+def check_password(user, password: str) -> bool:
+    """``user.check_password`` with the hashing done on the pool.
+
+    A valid password stored with an outdated algorithm or cost is
+    re-hashed and saved, as Django does.
+    """
+    valid = _run(hashers.check_password, password, user.password)
+    if valid and needs_rehash(user.password):
+        user.password = make_password(password)
+        user.save(update_fields=['password'])
+    return valid
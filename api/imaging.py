@@ -0,0 +1,108 @@
+"""
+Image preprocessing for food scans.
+
+Phone photos arrive as multi-megabyte, often sideways JPEGs. Before an
+upload is stored or sent to the model it is decoded once, rotated
+according to its EXIF orientation, downscaled to ``SCAN_IMAGE_MAX_DIMENSION``
+and re-encoded as ``SCAN_IMAGE_FORMAT`` at ``SCAN_IMAGE_QUALITY``. A small
+thumbnail for history lists is produced from the same decode.
+"""
+import io
+import logging
+import math
+import mimetypes
+from typing import NamedTuple
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {
+    'JPEG': ('image/jpeg', '.jpg'),
+    'WEBP': ('image/webp', '.webp'),
+}
+
+
+class ProcessedImage(NamedTuple):
+    data: bytes
+    content_type: str
+    extension: str
+    width: int
+    height: int
+
+
+def _flatten(img):
+    """RGB copy of ``img``; transparency is composited onto white."""
+    from PIL import Image
+    if img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info):
+        rgba = img.convert('RGBA')
+        background = Image.new('RGB', rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel('A'))
+        return background
+    return img.convert('RGB') if img.mode != 'RGB' else img
+
+
+def _encode(img, image_format, quality) -> ProcessedImage:
+    content_type, extension = FORMATS[image_format]
+    buffer = io.BytesIO()
+    if image_format == 'JPEG':
+        img.save(buffer, 'JPEG', quality=quality, optimize=True, progressive=True)
+    else:
+        img.save(buffer, image_format, quality=quality, method=4)
+    return ProcessedImage(buffer.getvalue(), content_type, extension, img.width, img.height)
+
+
+def _read_all(fp) -> bytes:
+    fp.seek(0)
+    return fp.read()
+
+
+def prepare_scan_image(source, content_type: str):
+    """Return ``(image, thumbnail)`` ready for storage and the model.
+
+    ``source`` is the upload as bytes or a seekable binary file; passing the
+    upload's own file lets Pillow decode it without another in-memory copy.
+
+    If Pillow cannot decode the upload it is passed through untouched and
+    the thumbnail is None. A small, metadata-free image keeps its original
+    bytes when re-encoding would not shrink it.
+    """
+    from PIL import Image, ImageOps  # loaded with the first upload
+
+    max_dimension = settings.SCAN_IMAGE_MAX_DIMENSION
+    image_format = settings.SCAN_IMAGE_FORMAT
+    fp = io.BytesIO(source) if isinstance(source, (bytes, bytearray, memoryview)) else source
+    fp.seek(0)
+
+    try:
+        with Image.open(fp) as img:
+            original_format = img.format
+            has_exif = bool(img.getexif())
+            # For JPEGs, let libjpeg decode at a reduced scale (1/2, 1/4, 1/8)
+            # that still covers the target size.
+            scale = min(1.0, max_dimension / max(img.size))
+            img.draft('RGB', (math.ceil(img.width * scale), math.ceil(img.height * scale)))
+            oriented = _flatten(ImageOps.exif_transpose(img))
+    except Exception as e:
+        logger.warning("Image preprocessing skipped: %s", e)
+        extension = mimetypes.guess_extension(content_type or '') or '.bin'
+        return ProcessedImage(_read_all(fp), content_type, extension, 0, 0), None
+
+    resized = max(oriented.size) > max_dimension
+    if resized:
+        oriented.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+    processed = _encode(oriented, image_format, settings.SCAN_IMAGE_QUALITY)
+
+    # Re-encoding also strips EXIF (location included), so originals are
+    # only kept when they carry none. (mmap.seek() returns None, so the
+    # original's size comes from tell().)
+    if not resized and not has_exif and original_format == image_format:
+        fp.seek(0, io.SEEK_END)
+        if len(processed.data) >= fp.tell():
+            processed = processed._replace(data=_read_all(fp))
+
+    thumbnail_image = oriented.copy()
+    size = settings.SCAN_THUMBNAIL_SIZE
+    thumbnail_image.thumbnail((size, size), Image.Resampling.LANCZOS)
+    thumbnail = _encode(thumbnail_image, image_format, settings.SCAN_THUMBNAIL_QUALITY)
+    return processed, thumbnail
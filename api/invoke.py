@@ -0,0 +1,238 @@
+"""
+Deadlines, retries and hedging for model calls.
+
+``call(endpoint, fn)`` / ``acall(endpoint, afn)`` run a model request under
+the policy configured for ``endpoint`` in ``AI_CALL_POLICIES`` (or for
+``policy``, when several endpoints share one):
+
+* ``timeout`` - seconds one attempt may take; it is also passed to the
+  client so the underlying HTTP request is abandoned.
+* ``deadline`` - seconds for the whole call, retries included.
+* ``retries`` - extra attempts after a retryable failure (timeouts,
+  connection errors, 5xx), spaced by full-jitter exponential backoff from
+  ``backoff_base`` up to ``backoff_max`` seconds.
+* ``hedge`` - if an attempt has not answered after the endpoint's recent
+  ``hedge_quantile`` latency (at least ``hedge_min_delay``), a second
+  request is sent and whichever finishes first wins.
+
+Each request goes through ratelimit.model_call(), so hedges and retries
+take tokens from the global bucket and quota errors still trip the
+breaker; those are never retried here. When every attempt times out the
+caller gets ``ModelCallTimeout`` (504).
+"""
+import asyncio
+import logging
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import lru_cache
+
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from . import ratelimit
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POLICY = {
+    'timeout': 30.0,
+    'deadline': 60.0,
+    'retries': 2,
+    'backoff_base': 0.5,
+    'backoff_max': 8.0,
+    'hedge': False,
+    'hedge_quantile': 0.95,
+    'hedge_min_delay': 1.0,
+    'hedge_min_samples': 20,
+}
+RETRYABLE_STATUS = {500, 502, 503, 504}
+LATENCY_WINDOW = 200
+
+_latencies = defaultdict(lambda: deque(maxlen=LATENCY_WINDOW))
+_latency_lock = threading.Lock()
+
+
+class ModelCallTimeout(APIException):
+    status_code = status.HTTP_504_GATEWAY_TIMEOUT
+    default_detail = 'The AI service did not answer in time. Please try again.'
+    default_code = 'ai_timeout'
+
+
+def get_policy(endpoint):
+    return {**DEFAULT_POLICY, **settings.AI_CALL_POLICIES.get(endpoint, {})}
+
+
+@lru_cache(maxsize=None)
+def _executor():
+    # Attempts run here so a stuck request costs a pool thread, not the
+    # caller; the client-side timeout frees the thread eventually.
+    return ThreadPoolExecutor(max_workers=settings.AI_INVOKE_MAX_THREADS, thread_name_prefix="model-call")
+
+
+def is_retryable(exc):
+    if isinstance(exc, ratelimit.AIServiceUnavailable):
+        return False
+    if isinstance(exc, (TimeoutError, ConnectionError)) or getattr(exc, 'immediate_retry', False):
+        return True
+    # AIClientError.status, google.api_core errors' .code
+    code = getattr(exc, 'status', None) or getattr(exc, 'code', None)
+    if code in RETRYABLE_STATUS:
+        return True
+    return type(exc).__name__ in ('ClientConnectionError', 'ServerDisconnectedError', 'ServiceUnavailable',
+                                  'DeadlineExceeded', 'InternalServerError')
+
+
+def backoff(attempt, policy, exc=None):
+    """Full-jitter exponential backoff before retry number ``attempt + 1``.
+
+    Errors marked ``immediate_retry`` (a failover to another model) are
+    retried without waiting.
+    """
+    if getattr(exc, 'immediate_retry', False):
+        return 0.0
+    return random.uniform(0, min(policy['backoff_max'], policy['backoff_base'] * 2 ** attempt))
+
+
+def record_latency(endpoint, seconds):
+    with _latency_lock:
+        _latencies[endpoint].append(seconds)
+
+
+def latency_quantile(endpoint, quantile):
+    with _latency_lock:
+        samples = sorted(_latencies[endpoint])
+    if not samples:
+        return None
+    return samples[min(len(samples) - 1, int(quantile * len(samples)))]
+
+
+def hedge_delay(endpoint, policy):
+    """Seconds to wait before hedging, or None when hedging is off."""
+    if not policy['hedge']:
+        return None
+    with _latency_lock:
+        enough = len(_latencies[endpoint]) >= policy['hedge_min_samples']
+    if not enough:
+        return None
+    return max(policy['hedge_min_delay'], latency_quantile(endpoint, policy['hedge_quantile']))
+
+
+def _give_up(exc):
+    if isinstance(exc, TimeoutError):
+        return ModelCallTimeout()
+    return exc
+
+
+def call(endpoint, fn, policy=None):
+    """Run ``fn(timeout)`` (a blocking model request) under ``endpoint``'s policy.
+
+    ``policy`` names the AI_CALL_POLICIES entry when it is not ``endpoint``;
+    hedge latencies are still tracked per endpoint.
+    """
+    policy = get_policy(policy or endpoint)
+    deadline = time.monotonic() + policy['deadline']
+    attempt = 0
+    while True:
+        timeout = min(policy['timeout'], deadline - time.monotonic())
+        try:
+            return _run(endpoint, fn, timeout, policy)
+        except Exception as e:
+            delay = backoff(attempt, policy, e)
+            if not is_retryable(e) or attempt >= policy['retries'] \
+                    or time.monotonic() + delay >= deadline:
+                replacement = _give_up(e)
+                if replacement is e:
+                    raise
+                raise replacement from e
+            logger.info("Retrying %s model call in %.2fs after: %s", endpoint, delay, e)
+            time.sleep(delay)
+            attempt += 1
+
+
+def _run(endpoint, fn, timeout, policy):
+    """One attempt, plus a hedge if it is slow; returns the first success."""
+    def attempt():
+        started = time.monotonic()
+        with ratelimit.model_call():
+            result = fn(timeout)
+        record_latency(endpoint, time.monotonic() - started)
+        return result
+
+    ends_at = time.monotonic() + timeout
+    pending = {_executor().submit(attempt)}
+    delay = hedge_delay(endpoint, policy)
+    if delay is not None and delay < timeout:
+        done, _ = wait(pending, timeout=delay)
+        if not done:
+            logger.debug("Hedging %s model call after %.2fs", endpoint, delay)
+            pending.add(_executor().submit(attempt))
+
+    error = None
+    while pending:
+        done, pending = wait(pending, timeout=max(0.0, ends_at - time.monotonic()),
+                             return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+            error = future.exception()
+    raise error or TimeoutError(f"{endpoint} model call exceeded {timeout:.1f}s")
+
+
+async def acall(endpoint, afn, policy=None):
+    """Async counterpart of call(): ``afn(timeout)`` returns an awaitable."""
+    policy = get_policy(policy or endpoint)
+    deadline = time.monotonic() + policy['deadline']
+    attempt = 0
+    while True:
+        timeout = min(policy['timeout'], deadline - time.monotonic())
+        try:
+            return await _arun(endpoint, afn, timeout, policy)
+        except Exception as e:
+            delay = backoff(attempt, policy, e)
+            if not is_retryable(e) or attempt >= policy['retries'] \
+                    or time.monotonic() + delay >= deadline:
+                replacement = _give_up(e)
+                if replacement is e:
+                    raise
+                raise replacement from e
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+async def _arun(endpoint, afn, timeout, policy):
+    async def attempt():
+        started = time.monotonic()
+        async with ratelimit.amodel_call():
+            result = await afn(timeout)
+        record_latency(endpoint, time.monotonic() - started)
+        return result
+
+    ends_at = time.monotonic() + timeout
+    pending = {asyncio.ensure_future(attempt())}
+    try:
+        delay = hedge_delay(endpoint, policy)
+        if delay is not None and delay < timeout:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if not done:
+                pending.add(asyncio.ensure_future(attempt()))
+
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=max(0.0, ends_at - time.monotonic()),
+                                               return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+        raise error or TimeoutError(f"{endpoint} model call exceeded {timeout:.1f}s")
+    finally:
+        # The loser of a hedge, or attempts past the timeout
+        for task in pending:
+            task.cancel()
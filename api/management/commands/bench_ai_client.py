@@ -0,0 +1,80 @@
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from api.ai_client import FakeClient
+from api import utils
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = ("Measure model-call throughput against the fake AI backend: the async "
+            "client on one event loop versus the sync client on a thread pool.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, default=200,
+                            help="In-flight calls (async) and pool size (sync).")
+        parser.add_argument('--latency-ms', type=float, default=1500)
+        parser.add_argument('--jitter-ms', type=float, default=300)
+        parser.add_argument('--sync-threads', type=int, default=None,
+                            help="Thread pool size for the sync run, e.g. gunicorn's worker count. "
+                                 "Defaults to --concurrency.")
+
+    def handle(self, *args, **options):
+        client = FakeClient(options['latency_ms'], options['jitter_ms'])
+        contents = utils.build_coach_prompt("How much protein should I eat?")
+
+        async_stats = asyncio.run(self.run_async(client, contents, options['requests'], options['concurrency']))
+        self.report("async (1 event loop)", async_stats)
+
+        threads = options['sync_threads'] or options['concurrency']
+        sync_stats = self.run_sync(client, contents, options['requests'], threads)
+        self.report(f"sync ({threads} threads)", sync_stats)
+
+    async def run_async(self, client, contents, total, concurrency):
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies = []
+
+        async def one():
+            async with semaphore:
+                started = time.perf_counter()
+                await client.agenerate_content(utils.COACH_MODEL_NAME, contents)
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one() for _ in range(total)))
+        return latencies, time.perf_counter() - started
+
+    def run_sync(self, client, contents, total, threads):
+        latencies = []
+
+        def one(_):
+            started = time.perf_counter()
+            client.generate_content(utils.COACH_MODEL_NAME, contents)
+            latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(one, range(total)))
+        return latencies, time.perf_counter() - started
+
+    def report(self, label, stats):
+        latencies, elapsed = stats
+        self.stdout.write(
+            f"{label:<22} {len(latencies) / elapsed:8.1f} req/s  "
+            f"p50 {percentile(latencies, 50) * 1000:7.1f} ms  "
+            f"p95 {percentile(latencies, 95) * 1000:7.1f} ms  "
+            f"mean {statistics.mean(latencies) * 1000:7.1f} ms  "
+            f"wall {elapsed:6.2f} s"
+        )
@@ -0,0 +1,88 @@
+import glob
+import io
+import os
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+
+from api import imaging
+
+
+def synthetic_phone_photo(source: bytes, size=(4032, 3024), quality=92, noise=0.0) -> bytes:
+    """Upscale a sample to a 12 MP, EXIF-rotated JPEG like a phone camera's.
+
+    ``noise`` adds sensor-like grain so the file size approaches a real photo's.
+    """
+    with Image.open(io.BytesIO(source)) as img:
+        photo = img.convert('RGB').resize(size, Image.Resampling.BICUBIC)
+    if noise:
+        grain = Image.effect_noise(size, noise).convert('RGB')
+        photo = Image.blend(photo, grain, 0.15)
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Orientation: rotate 90 CW
+    buffer = io.BytesIO()
+    photo.save(buffer, 'JPEG', quality=quality, exif=exif)
+    return buffer.getvalue()
+
+
+class Command(BaseCommand):
+    help = ("Measure how much scan preprocessing shrinks images and what it costs. "
+            "Reports bytes stored/sent to the model and the estimated upload time saved.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='*', help="Image files (default: media/scans/*).")
+        parser.add_argument('--synthetic', action='store_true',
+                            help="Also test 12 MP EXIF-rotated phone photos generated from the samples.")
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--uplink-mbps', type=float, default=20.0,
+                            help="Server-to-model bandwidth used for the transfer estimate.")
+
+    def handle(self, *args, **options):
+        paths = options['paths'] or sorted(glob.glob(os.path.join(settings.MEDIA_ROOT, 'scans', '*')))
+        samples = {}
+        for path in paths:
+            if os.path.isfile(path) and not path.endswith('.part'):
+                with open(path, 'rb') as f:
+                    samples.setdefault(f.read(), os.path.basename(path))
+        if not samples:
+            raise CommandError("No images found.")
+
+        if options['synthetic']:
+            for data, name in list(samples.items()):
+                samples[synthetic_phone_photo(data)] = f"12MP({name})"
+
+        self.stdout.write(
+            f"max_dimension={settings.SCAN_IMAGE_MAX_DIMENSION} format={settings.SCAN_IMAGE_FORMAT} "
+            f"quality={settings.SCAN_IMAGE_QUALITY} uplink={options['uplink_mbps']} Mbit/s"
+        )
+        self.stdout.write(f"{'image':<44} {'original':>10} {'processed':>10} {'thumb':>8} "
+                          f"{'ratio':>6} {'prep ms':>8} {'xfer saved ms':>13}")
+
+        totals = {'original': 0, 'processed': 0, 'prep': 0.0, 'saved': 0.0}
+        bytes_per_ms = options['uplink_mbps'] * 1e6 / 8 / 1000
+        for data, name in samples.items():
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                processed, thumbnail = imaging.prepare_scan_image(data, 'image/jpeg')
+                timings.append((time.perf_counter() - started) * 1000)
+            prep_ms = statistics.median(timings)
+            # Images travel base64-encoded inside the model request
+            saved_ms = (len(data) - len(processed.data)) * 4 / 3 / bytes_per_ms
+            totals['original'] += len(data)
+            totals['processed'] += len(processed.data)
+            totals['prep'] += prep_ms
+            totals['saved'] += saved_ms
+            self.stdout.write(
+                f"{name[:44]:<44} {len(data):>10} {len(processed.data):>10} "
+                f"{len(thumbnail.data) if thumbnail else 0:>8} "
+                f"{len(processed.data) / len(data):>6.2f} {prep_ms:>8.1f} {saved_ms:>13.1f}"
+            )
+
+        self.stdout.write(
+            f"{'TOTAL':<44} {totals['original']:>10} {totals['processed']:>10} {'':>8} "
+            f"{totals['processed'] / totals['original']:>6.2f} {totals['prep']:>8.1f} {totals['saved']:>13.1f}"
+        )
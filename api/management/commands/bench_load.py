@@ -0,0 +1,381 @@
+import asyncio
+import io
+import json
+import os
+import random
+import re
+import secrets
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+import aiohttp
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from PIL import Image
+
+from api.management.commands.bench_ai_client import percentile
+from api.management.commands.fake_gemini_server import add_fake_gemini_arguments, fake_gemini_from_options
+
+PASSWORD = 'bench-load-password'
+DEFAULT_MIX = 'analyze=15,history=50,chat=20,auth=15'
+ROUTES = {
+    'analyze': 'api/food/analyze',
+    'history': 'api/food/history',
+    'chat': 'api/chat',
+    'auth': 'api/auth/authenticate',
+}
+COACH_MESSAGES = [
+    "How much protein should I eat?", "Is rice bad for weight loss?", "What is a good breakfast?",
+    "hi", "thanks!", "How many calories should I eat to lose weight?", "Are eggs healthy?",
+    "What should I eat after a workout?", "Is paneer a good source of protein?", "How much water should I drink?",
+    "What snacks are healthy?", "Can I eat fruit at night?", "How do I cut down on sugar?",
+    "Is dal enough protein for a vegetarian?", "What is a balanced dinner?",
+]
+METRIC_LINE = re.compile(r'^(\w+)\{([^}]*)\} (\S+)$')
+LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in ROUTES:
+            raise CommandError(f"Unknown operation {name!r} in --mix; use {', '.join(ROUTES)}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def meal_photos(count, size, seed):
+    """Distinct photo-sized JPEGs; repeats of one photo hit the scan cache."""
+    rng = random.Random(seed)
+    photos = []
+    for _ in range(count):
+        base = Image.new('RGB', size, tuple(rng.randrange(256) for _ in range(3)))
+        grain = Image.effect_noise(size, rng.uniform(20, 60)).convert('RGB')
+        buffer = io.BytesIO()
+        Image.blend(base, grain, 0.3).save(buffer, 'JPEG', quality=90)
+        photos.append(buffer.getvalue())
+    return photos
+
+
+def parse_metrics(text):
+    """``{(name, frozenset(labels)): value}`` for the _sum and _count series."""
+    values = {}
+    for line in text.splitlines():
+        match = METRIC_LINE.match(line)
+        if match and match.group(1).endswith(('_sum', '_count')):
+            labels = frozenset(LABEL.findall(match.group(2)))
+            values[(match.group(1), labels)] = float(match.group(3))
+    return values
+
+
+def metric_mean(before, after, name, **labels):
+    """Mean of a histogram over the samples observed between two scrapes."""
+    def total(snapshot, suffix):
+        wanted = set(labels.items())
+        return sum(value for (metric, series), value in snapshot.items()
+                   if metric == name + suffix and wanted <= series)
+    count = total(after, '_count') - total(before, '_count')
+    if not count:
+        return None
+    return (total(after, '_sum') - total(before, '_sum')) / count
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def git_revision():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                    cwd=settings.BASE_DIR, capture_output=True, text=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ('-dirty' if dirty else '')
+
+
+class Command(BaseCommand):
+    help = ("Load-test the whole app: boot it (gunicorn or runserver) on a throwaway database against a "
+            "fake Gemini server, drive a seeded mix of analyze/history/chat/auth requests and report "
+            "p50/p95/p99 latency, throughput and DB queries per request. --output saves the results and "
+            "--baseline compares against a saved run, e.g. one from another commit.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, default=32)
+        parser.add_argument('--mix', default=DEFAULT_MIX, help=f"Operation weights (default {DEFAULT_MIX}).")
+        parser.add_argument('--warmup', type=int, default=50, help="Requests before measuring.")
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--scans-per-user', type=int, default=200, help="History to seed per user.")
+        parser.add_argument('--images', type=int, default=8,
+                            help="Distinct photos to upload; repeats are scan cache hits.")
+        parser.add_argument('--image-size', default='1600x1200')
+        parser.add_argument('--server', choices=('gunicorn', 'runserver'), default='gunicorn')
+        parser.add_argument('--workers', type=int, default=1,
+                            help="gunicorn workers. Query counts come from the worker answering "
+                                 "the metrics scrape, so keep 1 to count every request.")
+        parser.add_argument('--threads', type=int, default=16, help="gunicorn threads per worker.")
+        parser.add_argument('--database-url', help="A throwaway database to migrate and seed "
+                                                   "(default: a temporary SQLite file).")
+        parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE',
+                            help="Extra settings for the app, e.g. --env AI_RATE_LIMIT_USER=.")
+        parser.add_argument('--timeout', type=float, default=120, help="Client timeout per request.")
+        parser.add_argument('--output', help="Write the results as JSON.")
+        parser.add_argument('--baseline', help="JSON results of an earlier run to compare with.")
+        parser.add_argument('--setup-only', action='store_true', help="Internal: migrate and seed, then exit.")
+        add_fake_gemini_arguments(parser)
+
+    def handle(self, *args, **options):
+        if options['setup_only']:
+            return self.setup_database(options)
+
+        mix = parse_mix(options['mix'])
+        workdir = tempfile.mkdtemp(prefix='bench-load-')
+        fake = fake_gemini_from_options(options)
+        fake_port = fake.start_in_thread()
+        port = free_port()
+        env = {
+            **os.environ,
+            'DATABASE_URL': options['database_url'] or f"sqlite:///{workdir}/bench.sqlite3",
+            'MEDIA_ROOT': os.path.join(workdir, 'media'),
+            'AI_BACKEND': 'gemini',
+            'GEMINI_API_KEY': 'bench',
+            'GEMINI_API_BASE_URL': f"http://127.0.0.1:{fake_port}/v1beta",
+            'METRICS_TOKEN': secrets.token_hex(16),
+            'LOG_LEVEL': 'WARNING',
+            'SLOW_REQUEST_MS': '0',
+            'PYTHONUNBUFFERED': '1',
+        }
+        env.update(item.split('=', 1) for item in options['env'])
+
+        server = None
+        try:
+            manage = [sys.executable, str(settings.BASE_DIR / 'manage.py')]
+            self.stdout.write(f"Seeding {options['users']} users x {options['scans_per_user']} scans...")
+            subprocess.run(manage + ['bench_load', '--setup-only', '--users', str(options['users']),
+                                     '--scans-per-user', str(options['scans_per_user'])],
+                           env=env, cwd=settings.BASE_DIR, check=True, capture_output=True)
+            log = open(os.path.join(workdir, 'server.log'), 'w')
+            server = subprocess.Popen(self.server_command(manage, port, options), env=env,
+                                      cwd=settings.BASE_DIR, stdout=log, stderr=subprocess.STDOUT)
+            results = asyncio.run(self.run(f"http://127.0.0.1:{port}", env['METRICS_TOKEN'], mix, options, server))
+        except subprocess.CalledProcessError as e:
+            raise CommandError(f"Seeding failed:\n{e.stderr.decode()[-2000:]}")
+        finally:
+            if server is not None:
+                server.terminate()
+                try:
+                    server.wait(10)
+                except subprocess.TimeoutExpired:
+                    server.kill()
+            if server is not None and server.returncode not in (0, -15) and not options['output']:
+                self.stderr.write(open(os.path.join(workdir, 'server.log')).read()[-2000:])
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        results.update(revision=git_revision(), fake_gemini_requests=fake.requests, options={
+            key: options[key] for key in ('requests', 'concurrency', 'mix', 'users', 'scans_per_user', 'images',
+                                          'image_size', 'server', 'workers', 'threads', 'latency', 'latency_ms',
+                                          'spread', 'tail_rate', 'error_rate', 'quota_rate', 'seed', 'env')
+        })
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as f:
+                baseline = json.load(f)
+        self.report(results, baseline)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+
+    def server_command(self, manage, port, options):
+        if options['server'] == 'runserver':
+            return manage + ['runserver', f"127.0.0.1:{port}", '--noreload']
+        return [sys.executable, '-m', 'gunicorn', 'backend.wsgi:application', '--bind', f"127.0.0.1:{port}",
+                '--workers', str(options['workers']), '--worker-class', 'gthread',
+                '--threads', str(options['threads']), '--timeout', '300', '--keep-alive', '75',
+                '--log-level', 'warning']
+
+    def setup_database(self, options):
+        from django.contrib.auth.hashers import make_password
+        from django.contrib.auth.models import User
+        from django.utils import timezone
+
+        from api import pipeline, rollups
+        from api.ai_client import FAKE_ANALYSIS
+        from api.models import FoodScan
+
+        call_command('migrate', verbosity=0)
+        encoded = make_password(PASSWORD)
+        users = User.objects.bulk_create([
+            User(username=f"bench{i}", email=f"bench{i}@example.com", password=encoded)
+            for i in range(options['users'])
+        ])
+        fields = pipeline.analysis_fields({**FAKE_ANALYSIS, 'calories': FAKE_ANALYSIS['total_calories'],
+                                           'protein': FAKE_ANALYSIS['total_protein'],
+                                           'carbs': FAKE_ANALYSIS['total_carbs'],
+                                           'fats': FAKE_ANALYSIS['total_fats']})
+        now = timezone.now()
+        for user in users:
+            scans = [
+                FoodScan(user=user, image_url='', timestamp=now - timedelta(hours=6 * i), **fields)
+                for i in range(options['scans_per_user'])
+            ]
+            FoodScan.objects.bulk_create(scans, batch_size=500)
+            rollups.add_scans(scans)
+
+    async def run(self, base, metrics_token, mix, options, server):
+        width, height = (int(n) for n in options['image_size'].split('x'))
+        photos = meal_photos(options['images'], (width, height), options['seed'])
+        rng = random.Random(options['seed'])
+        timeout = aiohttp.ClientTimeout(total=options['timeout'])
+        connector = aiohttp.TCPConnector(limit=options['concurrency'] + 4)
+        async with aiohttp.ClientSession(base, timeout=timeout, connector=connector) as session:
+            await self.wait_ready(session, server)
+            tokens = await self.sign_in(session, options)
+
+            def plan(count):
+                # Drawn up front from the seed, so every run sends the same requests
+                operations = rng.choices(list(mix), weights=list(mix.values()), k=count)
+                return [(op, rng.randrange(len(tokens)), rng.randrange(len(photos)),
+                         rng.choice(COACH_MESSAGES)) for op in operations]
+
+            await self.drive(session, plan(options['warmup']), tokens, photos, options['concurrency'])
+            before = parse_metrics(await self.scrape(session, metrics_token))
+            started = time.perf_counter()
+            samples = await self.drive(session, plan(options['requests']), tokens, photos, options['concurrency'])
+            elapsed = time.perf_counter() - started
+            after = parse_metrics(await self.scrape(session, metrics_token))
+
+        results = {'elapsed': elapsed, 'operations': {}, 'stages_ms': {}}
+        everything = []
+        for op in mix:
+            rows = samples.get(op, [])
+            everything.extend(rows)
+            results['operations'][op] = self.summarize(rows, elapsed, metric_mean(
+                before, after, 'http_request_db_queries', route=ROUTES[op]))
+        results['operations']['all'] = self.summarize(everything, elapsed, None)
+        for stage in ('upload', 'storage_write', 'model_call', 'parse', 'db_insert', 'serialize'):
+            mean = metric_mean(before, after, 'scan_stage_duration_seconds', stage=stage)
+            if mean is not None:
+                results['stages_ms'][stage] = round(mean * 1000, 2)
+        return results
+
+    async def wait_ready(self, session, server, limit=60):
+        deadline = time.monotonic() + limit
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f"The app server exited with status {server.returncode}")
+            try:
+                async with session.get('/api/metrics') as response:
+                    if response.status in (200, 403):
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+        raise CommandError("The app server did not start in time")
+
+    async def sign_in(self, session, options):
+        semaphore = asyncio.Semaphore(options['concurrency'])
+
+        async def one(i):
+            async with semaphore, session.post('/api/auth/authenticate', json={
+                'email': f"bench{i}@example.com", 'password': PASSWORD}) as response:
+                if response.status != 200:
+                    raise CommandError(f"Sign-in failed with {response.status}: {await response.text()}")
+                return (await response.json())['access_token']
+
+        return await asyncio.gather(*(one(i) for i in range(options['users'])))
+
+    async def scrape(self, session, token):
+        async with session.get('/api/metrics', headers={'Authorization': f"Bearer {token}"}) as response:
+            return await response.text()
+
+    async def drive(self, session, requests, tokens, photos, concurrency):
+        samples = defaultdict(list)
+        pending = iter(requests)
+
+        async def worker():
+            for op, user, photo, message in pending:
+                started = time.perf_counter()
+                try:
+                    status = await self.send(session, op, user, tokens[user], photos[photo], message)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    status = type(e).__name__
+                samples[op].append((status, time.perf_counter() - started))
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return samples
+
+    async def send(self, session, op, user, token, photo, message):
+        headers = {'Authorization': f"Bearer {token}"}
+        if op == 'analyze':
+            form = aiohttp.FormData()
+            form.add_field('image', photo, filename='meal.jpg', content_type='image/jpeg')
+            request = session.post('/api/food/analyze', data=form, headers=headers)
+        elif op == 'history':
+            request = session.get('/api/food/history?limit=20', headers=headers)
+        elif op == 'chat':
+            request = session.post('/api/chat', json={'message': message}, headers=headers)
+        else:
+            request = session.post('/api/auth/authenticate',
+                                   json={'email': f"bench{user}@example.com", 'password': PASSWORD})
+        async with request as response:
+            await response.read()
+            return response.status
+
+    def summarize(self, rows, elapsed, queries):
+        latencies = [seconds for status, seconds in rows]
+        statuses = defaultdict(int)
+        for status, _ in rows:
+            statuses[str(status)] += 1
+        ok = sum(count for status, count in statuses.items() if status.startswith('2'))
+        return {
+            'requests': len(rows),
+            'ok_pct': round(100 * ok / len(rows), 2) if rows else 0,
+            'statuses': dict(statuses),
+            'rps': round(len(rows) / elapsed, 2),
+            'p50_ms': round(percentile(latencies, 50) * 1000, 1),
+            'p95_ms': round(percentile(latencies, 95) * 1000, 1),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 1),
+            'queries': round(queries, 2) if queries is not None else None,
+        }
+
+    def report(self, results, baseline=None):
+        self.stdout.write(f"revision {results['revision']}  {results['options']['requests']} requests in "
+                          f"{results['elapsed']:.1f}s  ({results['fake_gemini_requests']} model calls)")
+        self.stdout.write(f"{'operation':<10} {'n':>6} {'ok %':>7} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} "
+                          f"{'p99 ms':>9} {'queries':>8}  statuses")
+        for op, row in results['operations'].items():
+            queries = '-' if row['queries'] is None else f"{row['queries']:.1f}"
+            self.stdout.write(
+                f"{op:<10} {row['requests']:>6} {row['ok_pct']:>7.1f} {row['rps']:>8.1f} {row['p50_ms']:>9.1f} "
+                f"{row['p95_ms']:>9.1f} {row['p99_ms']:>9.1f} {queries:>8}  "
+                + " ".join(f"{status}:{count}" for status, count in sorted(row['statuses'].items()))
+            )
+            previous = (baseline or {}).get('operations', {}).get(op)
+            if previous:
+                self.stdout.write(
+                    f"{'  vs base':<10} {'':>6} {row['ok_pct'] - previous['ok_pct']:>+7.1f} "
+                    + " ".join(f"{_change(row[key], previous[key]):>{width}}" for key, width in
+                               (('rps', 8), ('p50_ms', 9), ('p95_ms', 9), ('p99_ms', 9)))
+                    + f" {_change(row['queries'], previous['queries']):>8}"
+                )
+        if results['stages_ms']:
+            self.stdout.write("scan stages (mean ms): " + ", ".join(
+                f"{stage} {ms:.1f}" for stage, ms in results['stages_ms'].items()))
+
+
+def _change(value, previous):
+    if value is None or not previous:
+        return '-'
+    return f"{100 * (value - previous) / previous:+.0f}%"
@@ -0,0 +1,124 @@
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers as django_hashers
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api.management.commands.bench_ai_client import percentile
+
+PASSWORD = 'bench-login-password'
+
+
+HASHERS = {
+    'pbkdf2': ('api.hashers.PBKDF2PasswordHasher', 'PASSWORD_PBKDF2_ITERATIONS'),
+    'bcrypt': ('api.hashers.BCryptSHA256PasswordHasher', 'PASSWORD_BCRYPT_ROUNDS'),
+    'argon2': ('api.hashers.Argon2PasswordHasher', 'PASSWORD_ARGON2_TIME_COST'),
+}
+
+
+def hasher_settings(spec):
+    """Settings that make ``"name[:cost]"`` the hasher for new passwords."""
+    name, _, cost = spec.partition(':')
+    path, cost_setting = HASHERS[name]
+    values = {'PASSWORD_HASHERS': [path] + [other for other in settings.PASSWORD_HASHERS if other != path]}
+    if cost:
+        values[cost_setting] = int(cost)
+    return values
+
+
+class Command(BaseCommand):
+    help = ("Login throughput of /api/auth/authenticate under a burst of concurrent sign-ins, and the "
+            "latency of /api/auth/me served alongside it. Runs against a throwaway test database.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hasher', action='append',
+                            help="name[:cost], e.g. pbkdf2:1000000, pbkdf2:600000, bcrypt:12 or "
+                                 "argon2:2 (repeatable; default: the configured hasher)")
+        parser.add_argument('--users', type=int, default=5000, help="Accounts in the table.")
+        parser.add_argument('--logins', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=32)
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0)
+        try:
+            self.run_all(options)
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+    def run_all(self, options):
+        specs = options['hasher'] or [settings.PASSWORD_HASHER]
+
+        # Users beyond the ones logging in make the email lookup realistic
+        User.objects.bulk_create([
+            User(username=f'filler{i}', email=f'Filler{i}@example.com', password='!')
+            for i in range(options['users'])
+        ], batch_size=1000)
+        watcher = User.objects.create(username='watcher', email='watcher@example.com', password='!')
+        token = str(RefreshToken.for_user(watcher).access_token)
+
+        self.stdout.write(f"{options['users']} users, {options['logins']} logins, "
+                          f"concurrency {options['concurrency']}")
+        self.stdout.write(f"{'hasher':<18} {'hash ms':>8} {'logins/s':>9} {'p50 ms':>8} {'p95 ms':>8} "
+                          f"{'503s':>5} {'me p95 ms':>10}")
+        for spec in specs:
+            with override_settings(**hasher_settings(spec)):
+                self.stdout.write(self.run_config(spec, token, options))
+
+    def run_config(self, label, token, options):
+        started = time.perf_counter()
+        encoded = django_hashers.make_password(PASSWORD)
+        hash_ms = (time.perf_counter() - started) * 1000
+        logins = options['logins']
+        User.objects.filter(username__startswith='bench').delete()
+        User.objects.bulk_create([
+            User(username=f'bench{i}', email=f'Bench{i}@Example.com', password=encoded) for i in range(logins)
+        ])
+
+        done = threading.Event()
+        me_timings = []
+
+        def watch():
+            client = Client(HTTP_AUTHORIZATION=f'Bearer {token}')
+            while not done.is_set():
+                t = time.perf_counter()
+                client.get('/api/auth/me')
+                me_timings.append(time.perf_counter() - t)
+                time.sleep(0.01)
+
+        def login(i):
+            client = Client()
+            t = time.perf_counter()
+            response = client.post('/api/auth/authenticate',
+                                   {'email': f'bench{i}@example.com', 'password': PASSWORD},
+                                   content_type='application/json')
+            return response.status_code, time.perf_counter() - t
+
+        watcher = threading.Thread(target=watch)
+        watcher.start()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(options['concurrency']) as pool:
+            results = list(pool.map(login, range(logins)))
+        elapsed = time.perf_counter() - started
+        done.set()
+        watcher.join()
+
+        timings = [seconds for code, seconds in results if code == 200]
+        shed = sum(1 for code, _ in results if code == 503)
+        failed = [code for code, _ in results if code not in (200, 503)]
+        if failed:
+            self.stderr.write(f"{label}: unexpected responses {sorted(set(failed))}")
+        return (f"{label:<18} {hash_ms:>8.1f} {len(timings) / elapsed:>9.1f} "
+                f"{statistics.median(timings) * 1000 if timings else 0:>8.1f} "
+                f"{percentile(timings, 95) * 1000 if timings else 0:>8.1f} {shed:>5} "
+                f"{percentile(me_timings, 95) * 1000 if me_timings else 0:>10.1f}")
@@ -0,0 +1,128 @@
+import copy
+import glob
+import json
+import os
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import schemas
+from api.ai_client import FAKE_ANALYSIS
+from api.management.commands.bench_ai_client import percentile
+
+
+def legacy_parse(text):
+    """The previous parser: split on markdown fences, then json.loads."""
+    cleaned = text
+    if "```json" in cleaned:
+        cleaned = cleaned.split("```json")[1].split("```")[0].strip()
+    elif "```" in cleaned:
+        cleaned = cleaned.split("```")[1].split("```")[0].strip()
+    data = json.loads(cleaned)
+    return {
+        "items": data.get("items", []),
+        "calories": float(data.get("total_calories", 0)),
+        "protein": float(data.get("total_protein", 0)),
+        "carbs": float(data.get("total_carbs", 0)),
+        "fats": float(data.get("total_fats", 0)),
+    }
+
+
+def with_units(analysis):
+    analysis = copy.deepcopy(analysis)
+    for item in analysis["items"]:
+        item["calories"] = f"{item['calories']:.0f} kcal"
+        item["protein"] = f"{item['protein']}g"
+    analysis["total_calories"] = f"~{analysis['total_calories']:,.0f} kcal"
+    analysis["health_score"] = analysis["health_score"] + "+"
+    analysis["dietary_tags"] = ", ".join(analysis["dietary_tags"])
+    return analysis
+
+
+VARIANTS = {
+    'structured': lambda a: json.dumps(a),
+    'fenced': lambda a: "```json\n" + json.dumps(a, indent=2) + "\n```",
+    'fenced_plain': lambda a: "```\n" + json.dumps(a, indent=2) + "\n```",
+    'prose_fenced': lambda a: "Here is the analysis of your meal:\n```json\n" + json.dumps(a) + "\n```\nEnjoy!",
+    'prose_bare': lambda a: "Sure! " + json.dumps(a) + " Let me know if you need more.",
+    'trailing_comma': lambda a: json.dumps(a, indent=2).replace("\n  ]", ",\n  ]").replace("\n}", ",\n}"),
+    'units': lambda a: "```json\n" + json.dumps(with_units(a)) + "\n```",
+    'truncated': lambda a: "```json\n" + json.dumps(a)[:int(len(json.dumps(a)) * 0.85)],
+    'python_repr': lambda a: repr(a),
+}
+
+
+def synthetic_corpus(size, seed=0):
+    """Replies shaped like the ones Gemini returns, in a realistic mix."""
+    rng = random.Random(seed)
+    weights = {
+        'structured': 0, 'fenced': 60, 'fenced_plain': 6, 'prose_fenced': 10, 'prose_bare': 4,
+        'trailing_comma': 5, 'units': 8, 'truncated': 4, 'python_repr': 3,
+    }
+    names = rng.choices(list(weights), weights=list(weights.values()), k=size)
+    corpus = []
+    for name in names:
+        analysis = copy.deepcopy(FAKE_ANALYSIS)
+        for item in analysis["items"]:
+            item["calories"] = round(item["calories"] * rng.uniform(0.5, 1.5), 1)
+        corpus.append((name, VARIANTS[name](analysis)))
+    return corpus
+
+
+class Command(BaseCommand):
+    help = ("Compare parse cost and failure rate of the fence-splitting parser and the "
+            "validating parser (api/schemas.py) on a corpus of model replies.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corpus', help="Directory of recorded raw replies (*.txt, *.json). "
+                                             "Defaults to a synthetic corpus.")
+        parser.add_argument('--size', type=int, default=5000, help="Synthetic corpus size.")
+        parser.add_argument('--structured', action='store_true',
+                            help="Synthetic corpus of structured-output replies only.")
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        if options['corpus']:
+            paths = sorted(glob.glob(os.path.join(options['corpus'], '*.txt'))
+                           + glob.glob(os.path.join(options['corpus'], '*.json')))
+            if not paths:
+                raise CommandError("No recorded replies found.")
+            corpus = []
+            for path in paths:
+                with open(path, encoding='utf-8') as f:
+                    corpus.append(('recorded', f.read()))
+        elif options['structured']:
+            corpus = [('structured', VARIANTS['structured'](FAKE_ANALYSIS))] * options['size']
+        else:
+            corpus = synthetic_corpus(options['size'])
+
+        self.stdout.write(f"{len(corpus)} replies")
+        self.stdout.write(f"{'parser':<10} {'failed %':>9} {'mean us':>9} {'p99 us':>9}")
+        for label, parse in (('legacy', legacy_parse), ('validated', schemas.parse_analysis)):
+            timings, failures = self.run(parse, corpus, options['repeat'])
+            self.stdout.write(
+                f"{label:<10} {100 * len(failures) / len(corpus):>9.2f} "
+                f"{statistics.mean(timings) * 1e6:>9.1f} {percentile(timings, 99) * 1e6:>9.1f}"
+            )
+            if failures:
+                by_kind = {}
+                for kind in failures:
+                    by_kind[kind] = by_kind.get(kind, 0) + 1
+                self.stdout.write("           failures: " + ", ".join(
+                    f"{kind} {count}" for kind, count in sorted(by_kind.items())
+                ))
+
+    def run(self, parse, corpus, repeat):
+        timings, failures = [], []
+        for attempt in range(repeat):
+            for kind, text in corpus:
+                started = time.perf_counter()
+                try:
+                    parse(text)
+                except Exception:
+                    if attempt == 0:
+                        failures.append(kind)
+                timings.append(time.perf_counter() - started)
+        return timings, failures
@@ -0,0 +1,99 @@
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from api import encoders, renderers
+from api.ai_client import FAKE_ANALYSIS
+from api.models import ChatMessage, FoodScan
+from api.serializers import ChatMessageSerializer, FoodScanSerializer
+
+TAGS = ["High Protein", "Vegetarian", "Low Carb", "Spicy", "Gluten Free", "Café ☕"]
+
+
+class Command(BaseCommand):
+    help = ("Rows/sec of the scan and chat history read path: FoodScanSerializer/ChatMessageSerializer "
+            "with DRF's JSONRenderer versus api/encoders.py with ORJSONRenderer. Checks that both "
+            "produce the same bytes. Runs against a throwaway test database.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=5, help="Best of this many runs.")
+        parser.add_argument('--fields', help="Comma-separated scan fields, as in ?fields= on the history.")
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0)
+        try:
+            self.run_all(options)
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+    def run_all(self, options):
+        rng = random.Random(0)
+        user = User.objects.create(username='bench', email='bench@example.com')
+        now = timezone.now()
+        scans = FoodScan.objects.bulk_create([
+            FoodScan(
+                user=user, image_url=f'/media/scans/{i:064x}.jpg', thumbnail_url=f'/media/scans/{i:064x}_t.jpg',
+                food_items=FAKE_ANALYSIS['items'][:rng.randint(1, 2)],
+                calories=round(rng.uniform(100, 1200), 1), protein=round(rng.uniform(0, 80), 2),
+                carbs=round(rng.uniform(0, 150), 2), fats=round(rng.uniform(0, 60), 2),
+                meal_type=rng.choice([None, 'breakfast', 'lunch', 'dinner']),
+                dietary_tags=rng.sample(TAGS, rng.randint(0, 3)), ai_insights=FAKE_ANALYSIS['ai_insights'],
+            )
+            for i in range(options['rows'])
+        ], batch_size=1000)
+        # auto_now_add ignores bulk values; spread the timestamps out afterwards
+        for i, scan in enumerate(scans):
+            scan.timestamp = now - timedelta(minutes=37 * i, microseconds=rng.randrange(1000000))
+        FoodScan.objects.bulk_update(scans, ['timestamp'], batch_size=1000)
+        ChatMessage.objects.bulk_create([
+            ChatMessage(user=user, message=f"Question {i} about lunch?", response="Great question! " * 20)
+            for i in range(options['rows'])
+        ], batch_size=1000)
+
+        fields = None
+        if options['fields']:
+            fields = [name.strip() for name in options['fields'].split(',')]
+        queryset = FoodScan.objects.filter(user=user).order_by('-timestamp', '-id')
+        chats = ChatMessage.objects.filter(user=user).order_by('timestamp')
+
+        paths = [
+            ('scans', 'serializer', lambda: FoodScanSerializer(queryset, many=True, fields=fields).data,
+             JSONRenderer()),
+            ('scans', 'encoder', lambda: encoders.scan_dicts(encoders.scan_values(queryset, fields), fields),
+             renderers.ORJSONRenderer()),
+            ('chat', 'serializer', lambda: ChatMessageSerializer(chats, many=True).data, JSONRenderer()),
+            ('chat', 'encoder', lambda: encoders.chat_dicts(encoders.chat_values(chats)),
+             renderers.ORJSONRenderer()),
+        ]
+        rows = options['rows']
+        self.stdout.write(f"{rows} rows, best of {options['repeat']}"
+                          + ("" if renderers.orjson else " (orjson not installed: stdlib json)"))
+        self.stdout.write(f"{'history':<8} {'path':<11} {'fetch+encode':>13} {'render':>10} {'rows/s':>10}")
+        output = {}
+        for history, path, encode, renderer in paths:
+            best_encode = best_render = float('inf')
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                data = encode()
+                encoded = time.perf_counter()
+                body = renderer.render(data)
+                best_encode = min(best_encode, encoded - started)
+                best_render = min(best_render, time.perf_counter() - encoded)
+            output.setdefault(history, set()).add(body)
+            self.stdout.write(f"{history:<8} {path:<11} {best_encode * 1000:>10.1f} ms {best_render * 1000:>7.1f} ms "
+                              f"{rows / (best_encode + best_render):>10.0f}")
+        for history, bodies in output.items():
+            if len(bodies) != 1:
+                raise CommandError(f"The {history} responses differ between the two paths")
+        self.stdout.write("Responses are byte-identical.")
@@ -0,0 +1,163 @@
+import argparse
+import glob
+import json
+import os
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile, TemporaryUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+
+from api import imaging, pipeline, scan_cache, storage
+from api.management.commands.bench_image_preprocess import synthetic_phone_photo
+
+STRATEGIES = ('reread', 'buffer')
+
+
+def uploaded_file(path):
+    """Build the object Django's upload handlers would produce for ``path``."""
+    size = os.path.getsize(path)
+    if size <= settings.FILE_UPLOAD_MAX_MEMORY_SIZE:
+        with open(path, 'rb') as f:
+            return SimpleUploadedFile('meal.jpg', f.read(), 'image/jpeg')
+    upload = TemporaryUploadedFile('meal.jpg', 'image/jpeg', size, None)
+    with open(path, 'rb') as f:
+        shutil.copyfileobj(f, upload.file, 64 * 1024)
+    upload.file.seek(0)
+    return upload
+
+
+def _proc_status_kb(field):
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith(field + ':'):
+                return int(line.split()[1])
+    raise KeyError(field)
+
+
+def reset_peak_rss():
+    """Start a fresh peak-RSS window; returns the RSS baseline in KiB.
+
+    On Linux the high-water mark (VmHWM) can be reset, so the peak excludes
+    startup. Elsewhere ru_maxrss is used and the result is an upper bound.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return _proc_status_kb('VmRSS')
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def peak_rss():
+    try:
+        return _proc_status_kb('VmHWM')
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def reread_upload(image, scans_dir):
+    """The previous upload path: stream to disk, read the file back, then process."""
+    file_path = os.path.join(scans_dir, image.name)
+    with open(file_path, 'wb+') as destination:
+        for chunk in image.chunks():
+            destination.write(chunk)
+    with open(file_path, 'rb') as f:
+        image_bytes = f.read()
+    processed, thumbnail = imaging.prepare_scan_image(image_bytes, image.content_type)
+    digest = scan_cache.content_digest(image_bytes)
+    storage.put(storage.scan_key(digest, processed.extension), processed.data)
+    if thumbnail is not None:
+        storage.put(storage.scan_key(digest, thumbnail.extension, suffix="_thumb"), thumbnail.data)
+    return processed
+
+
+def buffered_upload(image, scans_dir):
+    upload = pipeline.prepare_upload(image)
+    upload.wait_stored()
+    return upload.image
+
+
+class Command(BaseCommand):
+    help = ("Measure peak memory and time per scan upload for the write-then-reread path "
+            "versus the single-buffer path. Each run happens in a fresh process so the "
+            "peak RSS (ru_maxrss) belongs to one request.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', help="Image to upload (default: first of media/scans/*).")
+        parser.add_argument('--synthetic', action='store_true',
+                            help="Upload a 12 MP EXIF-rotated phone photo generated from the image.")
+        parser.add_argument('--repeat', type=int, default=3)
+        parser.add_argument('--child', choices=STRATEGIES, help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options['child']:
+            return self.run_child(options['child'], options['path'])
+
+        path = options['path'] or next(iter(sorted(
+            p for p in glob.glob(os.path.join(settings.MEDIA_ROOT, 'scans', '*')) if not p.endswith('.part')
+        )), None)
+        if not path or not os.path.isfile(path):
+            raise CommandError("No image found.")
+
+        with tempfile.TemporaryDirectory() as workdir:
+            if options['synthetic']:
+                with open(path, 'rb') as f:
+                    data = synthetic_phone_photo(f.read(), noise=64)
+                path = os.path.join(workdir, 'synthetic.jpg')
+                with open(path, 'wb') as f:
+                    f.write(data)
+
+            size = os.path.getsize(path)
+            spooled = size > settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+            self.stdout.write(f"upload {size} bytes ({'temporary file' if spooled else 'in memory'})")
+            self.stdout.write(f"{'strategy':<10} {'peak RSS MB':>12} {'py peak MB':>11} {'ms':>8}")
+            for strategy in STRATEGIES:
+                runs = [self.spawn(strategy, path) for _ in range(options['repeat'])]
+                self.stdout.write(
+                    f"{strategy:<10} "
+                    f"{statistics.median(r['rss_kb'] for r in runs) / 1024:>12.1f} "
+                    f"{statistics.median(r['traced_bytes'] for r in runs) / 2 ** 20:>11.1f} "
+                    f"{statistics.median(r['ms'] for r in runs):>8.1f}"
+                )
+
+    def spawn(self, strategy, path):
+        manage_py = os.path.join(settings.BASE_DIR, 'manage.py')
+        output = subprocess.run(
+            [sys.executable, manage_py, 'bench_upload', path, '--child', strategy],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        return json.loads(output.strip().splitlines()[-1])
+
+    def run_child(self, strategy, path):
+        image = uploaded_file(path)
+        with tempfile.TemporaryDirectory() as scans_dir, override_settings(STORAGES={
+            **settings.STORAGES,
+            'scans': {'BACKEND': 'api.storage.ScanFileSystemStorage', 'OPTIONS': {'location': scans_dir}},
+        }):
+            run = reread_upload if strategy == 'reread' else buffered_upload
+
+            # Peak RSS growth over the process baseline; tracemalloc adds the
+            # Python-level allocations (Pillow's decode buffers are not traced)
+            baseline = reset_peak_rss()
+            tracemalloc.start()
+            started = time.perf_counter()
+            run(image, scans_dir)
+            elapsed = time.perf_counter() - started
+            _, traced_peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            peak = peak_rss()
+
+        self.stdout.write(json.dumps({
+            'rss_kb': peak - baseline,
+            'traced_bytes': traced_peak,
+            'ms': elapsed * 1000,
+        }))
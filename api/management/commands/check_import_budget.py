@@ -0,0 +1,100 @@
+import json
+import os
+import subprocess
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+# What a process pays before it can do anything, each probe in a fresh
+# interpreter: a gunicorn worker loads the WSGI application and, on its
+# first request, the URLconf and every view; a management command such as
+# migrate runs django.setup() and the system checks, which import the
+# URLconf too.
+PROBES = {
+    'worker': (
+        "from backend.wsgi import application\n"
+        "from django.conf import settings\n"
+        "from django.urls import get_resolver\n"
+        "get_resolver(settings.ROOT_URLCONF).url_patterns\n"
+    ),
+    'command': (
+        "import django\n"
+        "django.setup()\n"
+        "from django.core import checks\n"
+        "checks.run_checks()\n"
+    ),
+}
+
+PROBE = """
+import json, os, sys, time
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+started = time.perf_counter()
+exec(compile({code!r}, '<probe>', 'exec'))
+elapsed = time.perf_counter() - started
+with open('/proc/self/statm') as statm:
+    rss = int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+print(json.dumps({{'seconds': elapsed, 'rss': rss, 'modules': sorted(sys.modules)}}))
+"""
+
+# Optional or heavy packages that requests should only pay for when used
+HEAVY = ('google.generativeai', 'grpc', 'jose', 'passlib', 'bcrypt', 'argon2', 'PIL', 'aiohttp', 'pydantic',
+         'boto3', 'IPython')
+
+
+def run_probe(code, importtime=False):
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', PROBE.format(code=code)]
+    result = subprocess.run(command, capture_output=True, text=True, env={**os.environ, 'PYTHONUNBUFFERED': '1'})
+    if result.returncode:
+        raise CommandError(f"Probe failed:\n{result.stderr[-2000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+def slowest_imports(importtime_log, count):
+    """Packages (and HEAVY modules) by cumulative import microseconds, from ``python -X importtime``.
+
+    Nesting is ignored: google.generativeai counts for itself even when it
+    was pulled in by api.utils.
+    """
+    imports = {}
+    for line in importtime_log.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        name = name.strip()
+        if '.' not in name or name in HEAVY:
+            imports[name] = max(imports.get(name, 0), int(cumulative))
+    return sorted(((cumulative, name) for name, cumulative in imports.items()), reverse=True)[:count]
+
+
+class Command(BaseCommand):
+    help = ("Startup time and RSS of a fresh web worker and of a management command, with the heavy "
+            "packages they import and the slowest packages to import. Fails when over budget.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--probe', choices=sorted(PROBES), action='append',
+                            help="Probe to run (repeatable; default: all).")
+        parser.add_argument('--repeat', type=int, default=3, help="Best of this many fresh processes.")
+        parser.add_argument('--top', type=int, default=10, help="Slowest packages to list.")
+        parser.add_argument('--max-seconds', type=float, help="Fail when a probe takes longer.")
+        parser.add_argument('--max-rss-mb', type=float, help="Fail when a probe's RSS is larger.")
+
+    def handle(self, *args, **options):
+        over_budget = []
+        for name in options['probe'] or sorted(PROBES):
+            runs = [run_probe(PROBES[name])[0] for _ in range(max(1, options['repeat']))]
+            seconds = min(run['seconds'] for run in runs)
+            rss_mb = min(run['rss'] for run in runs) / 2 ** 20
+            heavy = [package for package in HEAVY if package in runs[0]['modules']]
+            self.stdout.write(f"{name}: {seconds * 1000:.0f} ms, {rss_mb:.1f} MB RSS, "
+                              f"{len(runs[0]['modules'])} modules")
+            self.stdout.write(f"  heavy packages loaded: {', '.join(heavy) or 'none'}")
+            if options['top']:
+                _, log = run_probe(PROBES[name], importtime=True)
+                for cumulative, module in slowest_imports(log, options['top']):
+                    self.stdout.write(f"  {cumulative / 1000:8.1f} ms  {module}")
+            if options['max_seconds'] is not None and seconds > options['max_seconds']:
+                over_budget.append(f"{name} took {seconds:.2f} s (budget {options['max_seconds']} s)")
+            if options['max_rss_mb'] is not None and rss_mb > options['max_rss_mb']:
+                over_budget.append(f"{name} used {rss_mb:.1f} MB (budget {options['max_rss_mb']} MB)")
+        if over_budget:
+            raise CommandError("Over the import budget: " + "; ".join(over_budget))
@@ -0,0 +1,39 @@
+from aiohttp import web
+from django.core.management.base import BaseCommand
+
+from api.fake_gemini import DISTRIBUTIONS, FakeGemini, FakeLatency
+
+
+def add_fake_gemini_arguments(parser):
+    parser.add_argument('--latency', choices=DISTRIBUTIONS, default='lognormal',
+                        help="Latency distribution of model calls.")
+    parser.add_argument('--latency-ms', type=float, default=1500, help="Median latency.")
+    parser.add_argument('--spread', type=float, default=0.4,
+                        help="Sigma for lognormal, +/- ms for uniform.")
+    parser.add_argument('--tail-rate', type=float, default=0.0, help="Share of calls that hang for --tail-ms.")
+    parser.add_argument('--tail-ms', type=float, default=30000)
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Share of calls failing with a 503.")
+    parser.add_argument('--quota-rate', type=float, default=0.0, help="Share of calls failing with a 429.")
+    parser.add_argument('--seed', type=int, default=0)
+
+
+def fake_gemini_from_options(options) -> FakeGemini:
+    latency = FakeLatency(options['latency'], options['latency_ms'], options['spread'],
+                          options['tail_rate'], options['tail_ms'])
+    return FakeGemini(latency, options['error_rate'], options['quota_rate'], options['seed'])
+
+
+class Command(BaseCommand):
+    help = ("Serve a fake Gemini REST API (api/fake_gemini.py) for load tests. Point the app at it with "
+            "GEMINI_API_BASE_URL=http://<host>:<port>/v1beta and any GEMINI_API_KEY.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        add_fake_gemini_arguments(parser)
+
+    def handle(self, *args, **options):
+        server = fake_gemini_from_options(options)
+        self.stdout.write(f"Fake Gemini on http://{options['host']}:{options['port']}/v1beta "
+                          f"({server.latency.distribution}, median {server.latency.median_ms:g} ms)")
+        web.run_app(server.app(), host=options['host'], port=options['port'], print=None, access_log=None)
@@ -0,0 +1,21 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from api import rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily nutrition rollups from the scans table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help="Only rebuild this user's rollups (username or email).")
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first() \
+                or User.objects.filter(email=options['user']).first()
+            if user is None:
+                raise CommandError(f"No user {options['user']!r}")
+        rollups.rebuild(user)
+        self.stdout.write(self.style.SUCCESS("Nutrition summaries rebuilt."))
@@ -0,0 +1,32 @@
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.queues import DatabaseScanQueue, get_scan_queue, run_workers
+
+
+class Command(BaseCommand):
+    help = "Run background workers that analyze scans uploaded in async mode."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=settings.SCAN_WORKER_CONCURRENCY,
+                            help="Number of scans analyzed in parallel.")
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help="Seconds to wait between polls when the queue is empty.")
+        parser.add_argument('--once', action='store_true',
+                            help="Exit once the queue is drained instead of polling forever.")
+
+    def handle(self, *args, **options):
+        queue = get_scan_queue()
+        if not isinstance(queue, DatabaseScanQueue):
+            raise CommandError(f"{settings.SCAN_QUEUE_BACKEND} cannot be drained by database workers.")
+
+        stop_event = threading.Event()
+        self.stdout.write(f"Starting {options['concurrency']} scan worker(s)...")
+        try:
+            run_workers(queue, options['concurrency'], options['poll_interval'], stop_event,
+                        once=options['once'])
+        except KeyboardInterrupt:
+            stop_event.set()
+            self.stdout.write("Stopping scan workers.")
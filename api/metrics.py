@@ -0,0 +1,133 @@
+"""
+Latency histograms, per-request timing spans and structured log output.
+
+``span(stage)`` times one step of serving a scan (``upload``,
+``storage_write``, ``model_call``, ``parse``, ``db_insert``,
+``serialize``) into the ``scan_stage_duration_seconds`` histogram.
+``RequestMetricsMiddleware`` (api/middleware.py) records every request in
+``http_request_duration_seconds`` (and its query count in
+``http_request_db_queries``) and, when a request takes longer than
+``SLOW_REQUEST_MS``, logs it with the spans it went through. That log line
+tells whether a slow scan waited on Gemini or on us.
+
+``render()`` produces the Prometheus text format served at
+``/api/metrics``. Histograms live in process memory, as with
+prometheus_client outside its multiprocess mode: with several server
+processes, each scrape sees the process that answered it.
+"""
+import bisect
+import json
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_request_spans = ContextVar('request_spans', default=None)
+_registry = []
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labelnames=(), buckets=BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts, sum]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        # Index len(buckets) is the +Inf bucket
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {key: (list(counts), total) for key, (counts, total) in self._series.items()}
+        for key, (counts, total) in sorted(series.items()):
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else f"{bound:g}"
+                lines.append(f"{self.name}_bucket{_labels(labels + [('le', le)])} {cumulative}")
+            lines.append(f"{self.name}_count{_labels(labels)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(labels)} {total:.6f}")
+        return lines
+
+    def reset(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+
+def _labels(pairs) -> str:
+    if not pairs:
+        return ""
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+REQUEST_DURATION = Histogram('http_request_duration_seconds', "Time to serve an HTTP request.",
+                             ('method', 'route', 'status'))
+REQUEST_QUERIES = Histogram('http_request_db_queries', "Database queries run by a (sync) request.",
+                            ('method', 'route'), buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100))
+STAGE_DURATION = Histogram('scan_stage_duration_seconds', "Time spent in each step of serving a scan.",
+                           ('stage',))
+
+
+@contextmanager
+def span(stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_DURATION.observe(elapsed, stage=stage)
+        spans = _request_spans.get()
+        if spans is not None:
+            spans.append((stage, elapsed))
+
+
+@contextmanager
+def collect_spans():
+    """Collect the spans recorded in this context (one request) into a list."""
+    spans = []
+    token = _request_spans.set(spans)
+    try:
+        yield spans
+    finally:
+        _request_spans.reset(token)
+
+
+def render() -> str:
+    lines = []
+    for histogram in _registry:
+        lines.extend(histogram.render())
+    return "\n".join(lines) + "\n"
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line; ``extra={...}`` fields are included."""
+    RESERVED = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in self.RESERVED})
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
@@ -0,0 +1,68 @@
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connection
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class RequestMetricsMiddleware:
+    """Time every request into metrics.REQUEST_DURATION and log slow ones
+    (over SLOW_REQUEST_MS) with the stages they spent their time in."""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        started = time.perf_counter()
+        queries = QueryCounter()
+        with metrics.collect_spans() as spans, connection.execute_wrapper(queries):
+            response = self.get_response(request)
+        self.record(request, response, time.perf_counter() - started, spans, queries.count)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        with metrics.collect_spans() as spans:
+            response = await self.get_response(request)
+        self.record(request, response, time.perf_counter() - started, spans)
+        return response
+
+    def record(self, request, response, elapsed, spans, queries=None):
+        match = getattr(request, 'resolver_match', None)
+        # The URL pattern, not the path, keeps the label set small
+        route = match.route if match is not None else 'unmatched'
+        metrics.REQUEST_DURATION.observe(elapsed, method=request.method, route=route,
+                                         status=response.status_code)
+        if queries is not None:
+            # Async views query from worker threads, which are not counted
+            metrics.REQUEST_QUERIES.observe(queries, method=request.method, route=route)
+        if settings.SLOW_REQUEST_MS and elapsed * 1000 >= settings.SLOW_REQUEST_MS:
+            stages = {}
+            for stage, seconds in spans:
+                stages[stage] = stages.get(stage, 0) + round(seconds * 1000, 1)
+            logger.warning(
+                "Slow request %s %s %s in %.0f ms (%s)", request.method, request.path, response.status_code,
+                elapsed * 1000, ", ".join(f"{stage} {ms:.0f} ms" for stage, ms in stages.items()) or "no stages",
+                extra={'duration_ms': round(elapsed * 1000, 1), 'route': route, 'stages_ms': stages},
+            )
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:33
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_foodscan_meal_type'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='foodscan',
+            name='ai_insights',
+            field=models.TextField(default='This meal looks balanced!'),
+        ),
+        migrations.AddField(
+            model_name='foodscan',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='foodscan',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='foodscan',
+            name='content_type',
+            field=models.CharField(blank=True, default='', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='foodscan',
+            name='dietary_tags',
+            field=models.JSONField(default=list),
+        ),
+        migrations.AddField(
+            model_name='foodscan',
+            name='error',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='foodscan',
+            name='health_score',
+            field=models.CharField(default='A', max_length=2),
+        ),
+        migrations.AddField(
+            model_name='foodscan',
+            name='image_path',
+            field=models.CharField(blank=True, default='', max_length=500),
+        ),
+        migrations.AddField(
+            model_name='foodscan',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('processing', 'Processing'), ('done', 'Done'), ('failed', 'Failed')], default='done', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='foodscan',
+            index=models.Index(fields=['status', 'id'], name='foodscan_status_idx'),
+        ),
+    ]
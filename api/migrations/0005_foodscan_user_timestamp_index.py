@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:39
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_foodscan_async_analysis'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='foodscan',
+            index=models.Index(fields=['user', 'timestamp', 'id'], name='foodscan_user_ts_idx'),
+        ),
+    ]
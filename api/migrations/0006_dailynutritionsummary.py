@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+
+
+def backfill_summaries(apps, schema_editor):
+    FoodScan = apps.get_model('api', 'FoodScan')
+    DailyNutritionSummary = apps.get_model('api', 'DailyNutritionSummary')
+    rows = (
+        FoodScan.objects.filter(status='done')
+        .annotate(day=TruncDate('timestamp'), meal=Coalesce('meal_type', Value('')))
+        .values('user_id', 'day', 'meal')
+        .annotate(scan_count=Count('id'), calories=Sum('calories'), protein=Sum('protein'),
+                  carbs=Sum('carbs'), fats=Sum('fats'))
+        .order_by()
+    )
+    DailyNutritionSummary.objects.bulk_create([
+        DailyNutritionSummary(
+            user_id=row['user_id'], date=row['day'], meal_type=row['meal'],
+            scan_count=row['scan_count'], calories=row['calories'] or 0,
+            protein=row['protein'] or 0, carbs=row['carbs'] or 0, fats=row['fats'] or 0,
+        )
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_foodscan_user_timestamp_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyNutritionSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('meal_type', models.CharField(blank=True, default='', max_length=50)),
+                ('scan_count', models.PositiveIntegerField(default=0)),
+                ('calories', models.FloatField(default=0)),
+                ('protein', models.FloatField(default=0)),
+                ('carbs', models.FloatField(default=0)),
+                ('fats', models.FloatField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_summaries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'date', 'meal_type'), name='unique_daily_summary')],
+            },
+        ),
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 17:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_dailynutritionsummary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='foodscan',
+            name='image_digest',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='foodscan',
+            name='thumbnail_url',
+            field=models.CharField(blank=True, default='', max_length=500),
+        ),
+    ]
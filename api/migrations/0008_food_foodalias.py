@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-17 18:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_foodscan_thumbnail'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Food',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('calories', models.FloatField()),
+                ('protein', models.FloatField()),
+                ('carbs', models.FloatField()),
+                ('fats', models.FloatField()),
+                ('fiber', models.FloatField(default=0)),
+                ('sugar', models.FloatField(default=0)),
+                ('sodium', models.FloatField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='FoodAlias',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('alias', models.CharField(db_index=True, max_length=100)),
+                ('source', models.CharField(choices=[('seed', 'Seed data'), ('feedback', 'User feedback')], default='seed', max_length=20)),
+                ('votes', models.PositiveIntegerField(default=1)),
+                ('food', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='aliases', to='api.food')),
+            ],
+            options={
+                'verbose_name_plural': 'food aliases',
+                'constraints': [models.UniqueConstraint(fields=('alias', 'food'), name='unique_food_alias')],
+            },
+        ),
+    ]
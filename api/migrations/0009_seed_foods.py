@@ -0,0 +1,53 @@
+import csv
+import re
+import unicodedata
+from pathlib import Path
+
+from django.db import migrations
+
+FOODS_CSV = Path(__file__).resolve().parent.parent / 'data' / 'foods.csv'
+
+# Frozen copies of api.nutrition's helpers as of this migration, so later
+# changes there (or its model imports) cannot change what was seeded
+NUTRIENTS = ('calories', 'protein', 'carbs', 'fats', 'fiber', 'sugar', 'sodium')
+
+
+def normalize_name(name):
+    name = unicodedata.normalize('NFKC', name or '').casefold()
+    name = re.sub(r"\(.*?\)", " ", name)
+    return " ".join(re.sub(r"[^\w\s]", " ", name).split())
+
+
+def read_food_csv(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            values = {'name': normalize_name(row['name'])}
+            values.update({nutrient: float(row[nutrient] or 0) for nutrient in NUTRIENTS})
+            aliases = [normalize_name(alias) for alias in (row.get('aliases') or '').split('|')]
+            yield values, [alias for alias in aliases if alias and alias != values['name']]
+
+
+def seed_foods(apps, schema_editor):
+    Food = apps.get_model('api', 'Food')
+    FoodAlias = apps.get_model('api', 'FoodAlias')
+    aliases = []
+    for values, names in read_food_csv(FOODS_CSV):
+        food, _ = Food.objects.update_or_create(name=values.pop('name'), defaults=values)
+        aliases.extend(FoodAlias(alias=name, food=food, source='seed') for name in names)
+    FoodAlias.objects.bulk_create(aliases, ignore_conflicts=True)
+
+
+def unseed_foods(apps, schema_editor):
+    Food = apps.get_model('api', 'Food')
+    Food.objects.filter(name__in=[values['name'] for values, _ in read_food_csv(FOODS_CSV)]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_food_foodalias'),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_foods, unseed_foods),
+    ]
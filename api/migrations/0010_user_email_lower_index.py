@@ -0,0 +1,26 @@
+from django.db import migrations, models
+from django.db.models.functions import Lower
+
+# AuthenticateView looks users up by LOWER(email); auth.User has no index
+# on email, so it is added here.
+EMAIL_INDEX = models.Index(Lower('email'), name='auth_user_email_lower_idx')
+
+
+def add_email_index(apps, schema_editor):
+    schema_editor.add_index(apps.get_model('auth', 'User'), EMAIL_INDEX)
+
+
+def remove_email_index(apps, schema_editor):
+    schema_editor.remove_index(apps.get_model('auth', 'User'), EMAIL_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_seed_foods'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_email_index, remove_email_index),
+    ]
@@ -0,0 +1,133 @@
+import sqlite3
+
+from django.db import migrations, models
+
+# Full-text indexes for api/search.py. Postgres gets generated tsvector
+# columns with GIN indexes (adding them rewrites the tables once); SQLite
+# gets FTS5 tables kept in step by triggers. Other databases get nothing
+# and search falls back to icontains.
+#
+# On SQLite, Django rebuilds a table to alter it, which drops the table's
+# triggers: a later migration that alters api_foodscan or api_chatmessage
+# there must recreate them (the CREATE TRIGGER statements below).
+
+POSTGRES_FORWARD = [
+    """
+    ALTER TABLE api_foodscan ADD COLUMN search_document tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', jsonb_path_query_array(food_items, '$[*].name')), 'A')
+        || setweight(to_tsvector('english', coalesce(meal_type, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX foodscan_search_idx ON api_foodscan USING gin (search_document)",
+    """
+    ALTER TABLE api_chatmessage ADD COLUMN search_document tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', message), 'A')
+        || setweight(to_tsvector('english', response), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX chatmessage_search_idx ON api_chatmessage USING gin (search_document)",
+]
+
+POSTGRES_BACKWARD = [
+    "ALTER TABLE api_foodscan DROP COLUMN search_document",
+    "ALTER TABLE api_chatmessage DROP COLUMN search_document",
+]
+
+# Item names of a scan row; food_items entries that are not objects are skipped
+SCAN_NAMES = ("coalesce((SELECT group_concat(json_extract(value, '$.name'), ' ') "
+              "FROM json_each({row}.food_items) WHERE type = 'object'), '')")
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE api_foodscan_fts USING fts5("
+    "names, meal_type, user_id UNINDEXED, tokenize = 'porter unicode61 remove_diacritics 2')",
+    f"""
+    CREATE TRIGGER api_foodscan_fts_insert AFTER INSERT ON api_foodscan BEGIN
+        INSERT INTO api_foodscan_fts (rowid, names, meal_type, user_id)
+        VALUES (new.id, {SCAN_NAMES.format(row='new')}, coalesce(new.meal_type, ''), new.user_id);
+    END
+    """,
+    f"""
+    CREATE TRIGGER api_foodscan_fts_update AFTER UPDATE OF food_items, meal_type ON api_foodscan BEGIN
+        UPDATE api_foodscan_fts SET names = {SCAN_NAMES.format(row='new')}, meal_type = coalesce(new.meal_type, '')
+        WHERE rowid = new.id;
+    END
+    """,
+    """
+    CREATE TRIGGER api_foodscan_fts_delete AFTER DELETE ON api_foodscan BEGIN
+        DELETE FROM api_foodscan_fts WHERE rowid = old.id;
+    END
+    """,
+    f"""
+    INSERT INTO api_foodscan_fts (rowid, names, meal_type, user_id)
+    SELECT id, {SCAN_NAMES.format(row='api_foodscan')}, coalesce(meal_type, ''), user_id FROM api_foodscan
+    """,
+    "CREATE VIRTUAL TABLE api_chatmessage_fts USING fts5("
+    "message, response, user_id UNINDEXED, tokenize = 'porter unicode61 remove_diacritics 2')",
+    """
+    CREATE TRIGGER api_chatmessage_fts_insert AFTER INSERT ON api_chatmessage BEGIN
+        INSERT INTO api_chatmessage_fts (rowid, message, response, user_id)
+        VALUES (new.id, new.message, new.response, new.user_id);
+    END
+    """,
+    """
+    CREATE TRIGGER api_chatmessage_fts_update AFTER UPDATE OF message, response ON api_chatmessage BEGIN
+        UPDATE api_chatmessage_fts SET message = new.message, response = new.response WHERE rowid = new.id;
+    END
+    """,
+    """
+    CREATE TRIGGER api_chatmessage_fts_delete AFTER DELETE ON api_chatmessage BEGIN
+        DELETE FROM api_chatmessage_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    INSERT INTO api_chatmessage_fts (rowid, message, response, user_id)
+    SELECT id, message, response, user_id FROM api_chatmessage
+    """,
+]
+
+SQLITE_BACKWARD = [
+    f"DROP TRIGGER IF EXISTS {table}_fts_{event}"
+    for table in ('api_foodscan', 'api_chatmessage') for event in ('insert', 'update', 'delete')
+] + [
+    "DROP TABLE IF EXISTS api_foodscan_fts",
+    "DROP TABLE IF EXISTS api_chatmessage_fts",
+]
+
+
+def _statements(connection, forward):
+    if connection.vendor == 'postgresql':
+        return POSTGRES_FORWARD if forward else POSTGRES_BACKWARD
+    if connection.vendor == 'sqlite':
+        with sqlite3.connect(':memory:') as db:
+            if ('ENABLE_FTS5',) in db.execute('PRAGMA compile_options').fetchall():
+                return SQLITE_FORWARD if forward else SQLITE_BACKWARD
+    return []
+
+
+def create_search_index(apps, schema_editor):
+    for statement in _statements(schema_editor.connection, forward=True):
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    for statement in _statements(schema_editor.connection, forward=False):
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_chatsummary_chatmessage_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='foodscan',
+            index=models.Index(fields=['timestamp', 'id'], name='foodscan_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['timestamp', 'id'], name='chatmessage_ts_idx'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
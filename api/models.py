@@ -14,19 +14,117 @@ class UserProfile(models.Model):
         return f"{self.user.email}'s profile"
 
 class FoodScan(models.Model):
+    STATUS_PENDING = 'pending'
+    STATUS_PROCESSING = 'processing'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_PROCESSING, 'Processing'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='scans')
     image_url = models.CharField(max_length=500)
+    thumbnail_url = models.CharField(max_length=500, blank=True, default='')
     food_items = models.JSONField()  # List of detected items
     calories = models.FloatField()
     protein = models.FloatField()
     carbs = models.FloatField()
     fats = models.FloatField()
     meal_type = models.CharField(max_length=50, null=True, blank=True)
+    health_score = models.CharField(max_length=2, default='A')
+    dietary_tags = models.JSONField(default=list)
+    ai_insights = models.TextField(default='This meal looks balanced!')
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    # Asynchronous analysis state (see api/queues.py)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_DONE)
+    error = models.TextField(blank=True, default='')
+    image_path = models.CharField(max_length=500, blank=True, default='')
+    image_digest = models.CharField(max_length=64, blank=True, default='')  # SHA-256 of the upload
+    content_type = models.CharField(max_length=100, blank=True, default='')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id'], name='foodscan_status_idx'),
+            # History pages are range scans on (user, timestamp, id)
+            models.Index(fields=['user', 'timestamp', 'id'], name='foodscan_user_ts_idx'),
+            # Admin list ordering and date hierarchy across all users
+            models.Index(fields=['timestamp', 'id'], name='foodscan_ts_idx'),
+        ]
+
     def __str__(self):
         return f"Scan {self.id} by {self.user.email}"
 
+class DailyNutritionSummary(models.Model):
+    """Per-user, per-day, per-meal-type totals of completed scans.
+
+    Maintained incrementally by the FoodScan signals in api/signals.py;
+    ``manage.py rebuild_nutrition_summaries`` recomputes it from scratch.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='daily_summaries')
+    date = models.DateField()
+    meal_type = models.CharField(max_length=50, blank=True, default='')  # '' when unset
+    scan_count = models.PositiveIntegerField(default=0)
+    calories = models.FloatField(default=0)
+    protein = models.FloatField(default=0)
+    carbs = models.FloatField(default=0)
+    fats = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'date', 'meal_type'], name='unique_daily_summary'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.email} {self.date} {self.meal_type or 'all meals'}"
+
+class Food(models.Model):
+    """Reference nutrition for one canonical food, per 100 g.
+
+    Scan items are matched to foods by name (api/nutrition.py) so their
+    nutrition can be computed locally from ``weight_grams``.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    calories = models.FloatField()
+    protein = models.FloatField()
+    carbs = models.FloatField()
+    fats = models.FloatField()
+    fiber = models.FloatField(default=0)
+    sugar = models.FloatField(default=0)
+    sodium = models.FloatField(default=0)  # mg
+
+    def __str__(self):
+        return self.name
+
+class FoodAlias(models.Model):
+    """Another name for a Food: seeded synonyms, or ones learned from Feedback."""
+    SOURCE_SEED = 'seed'
+    SOURCE_FEEDBACK = 'feedback'
+    SOURCE_CHOICES = [
+        (SOURCE_SEED, 'Seed data'),
+        (SOURCE_FEEDBACK, 'User feedback'),
+    ]
+
+    alias = models.CharField(max_length=100, db_index=True)  # normalized, see nutrition.normalize_name
+    food = models.ForeignKey(Food, on_delete=models.CASCADE, related_name='aliases')
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES, default=SOURCE_SEED)
+    # Feedback corrections pointing this alias at this food
+    votes = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['alias', 'food'], name='unique_food_alias'),
+        ]
+        verbose_name_plural = 'food aliases'
+
+    def __str__(self):
+        return f"{self.alias} -> {self.food.name}"
+
 class Feedback(models.Model):
     scan = models.OneToOneField(FoodScan, on_delete=models.CASCADE, related_name='feedback')
     is_accurate = models.BooleanField()
@@ -42,5 +140,26 @@ class ChatMessage(models.Model):
     response = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Chat history pages and the coach's recent turns are range scans
+            models.Index(fields=['user', 'timestamp', 'id'], name='chatmessage_user_ts_idx'),
+            models.Index(fields=['timestamp', 'id'], name='chatmessage_ts_idx'),
+        ]
+
     def __str__(self):
         return f"Chat message by {self.user.email}"
+
+class ChatSummary(models.Model):
+    """Rolling summary of a user's older coach turns (see api/coach_context.py)."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='chat_summary')
+    summary = models.TextField(blank=True, default='')
+    # Newest ChatMessage folded into the summary
+    last_message_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = 'chat summaries'
+
+    def __str__(self):
+        return f"Chat summary for {self.user.email}"
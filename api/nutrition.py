@@ -0,0 +1,209 @@
+"""
+Local nutrition database for scan items.
+
+The model names the foods on a plate and estimates their weight; their
+nutrition is then computed here from the ``Food`` table (per 100 g)
+instead of trusting the model's numbers. This keeps results consistent
+between scans, and edits made through ``FoodScanDetailView`` are
+recomputed instantly without another model call.
+
+Item names are matched against food names and aliases with an in-process
+trigram index (Dice similarity of character trigrams, at least
+``NUTRITION_MATCH_THRESHOLD``). The index is rebuilt when ``Food`` or
+``FoodAlias`` rows change, which every process notices through a version
+key in the default cache.
+
+``Feedback.correct_food_name`` teaches the index: the scan's main item name
+becomes an alias of the corrected food. It is used for everyone's scans
+once ``NUTRITION_ALIAS_MIN_VOTES`` corrections agree, so one bad
+correction cannot relabel a food for all users.
+"""
+import re
+import threading
+import time
+import unicodedata
+from collections import Counter, defaultdict
+from typing import NamedTuple, Optional
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import F
+
+from .models import Food, FoodAlias
+
+NUTRIENTS = ('calories', 'protein', 'carbs', 'fats', 'fiber', 'sugar', 'sodium')
+TOTAL_FIELDS = ('calories', 'protein', 'carbs', 'fats')
+VERSION_KEY = 'nutrition:index_version'
+MATCH_FIELDS = ('food_id', 'canonical_name', 'match_score', 'nutrition_source')
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def normalize_name(name: Optional[str]) -> str:
+    """``"Steamed Rice (1 cup)"`` -> ``"steamed rice"``."""
+    name = unicodedata.normalize('NFKC', name or '').casefold()
+    name = re.sub(r"\(.*?\)", " ", name)
+    return " ".join(re.sub(r"[^\w\s]", " ", name).split())
+
+
+def trigrams(text: str) -> set:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class Match(NamedTuple):
+    food_id: int
+    name: str
+    score: float
+
+
+class FoodIndex:
+    def __init__(self, foods, aliases):
+        # food id -> {'name': ..., nutrient: per 100 g}
+        self.foods = {food['id']: food for food in foods}
+        self.names = {food['name']: food['id'] for food in foods}
+        self.foods_by_name = set(self.names)
+        min_votes = settings.NUTRITION_ALIAS_MIN_VOTES
+        best_votes = {}
+        for alias in aliases:
+            votes = max(alias['votes'], min_votes) if alias['source'] == FoodAlias.SOURCE_SEED else alias['votes']
+            name = alias['alias']
+            # Food names themselves are never re-pointed
+            if votes < min_votes or name in self.foods_by_name:
+                continue
+            if votes > best_votes.get(name, 0):
+                best_votes[name] = votes
+                self.names[name] = alias['food_id']
+
+        self.trigrams = defaultdict(list)
+        self.sizes = {}
+        for name in self.names:
+            grams = trigrams(name)
+            self.sizes[name] = len(grams)
+            for gram in grams:
+                self.trigrams[gram].append(name)
+
+    @classmethod
+    def load(cls):
+        foods = list(Food.objects.values('id', 'name', *NUTRIENTS))
+        aliases = list(FoodAlias.objects.values('alias', 'food_id', 'source', 'votes'))
+        return cls(foods, aliases)
+
+    def match(self, name: str, threshold: Optional[float] = None) -> Optional[Match]:
+        key = normalize_name(name)
+        if not key:
+            return None
+        food_id = self.names.get(key)
+        if food_id is not None:
+            return Match(food_id, self.foods[food_id]['name'], 1.0)
+
+        grams = trigrams(key)
+        shared = Counter()
+        for gram in grams:
+            for candidate in self.trigrams.get(gram, ()):
+                shared[candidate] += 1
+        best, best_score = None, threshold if threshold is not None else settings.NUTRITION_MATCH_THRESHOLD
+        for candidate, count in shared.items():
+            score = 2 * count / (len(grams) + self.sizes[candidate])
+            if score >= best_score:
+                best, best_score = candidate, score
+        if best is None:
+            return None
+        food_id = self.names[best]
+        return Match(food_id, self.foods[food_id]['name'], best_score)
+
+
+def invalidate():
+    caches['default'].set(VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def get_index() -> FoodIndex:
+    global _index
+    version = caches['default'].get(VERSION_KEY)
+    with _index_lock:
+        if _index is None or _index[0] != version:
+            _index = (version, FoodIndex.load())
+        return _index[1]
+
+
+def _number(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def reconcile_item(item: dict, index: FoodIndex) -> dict:
+    """``item`` with its nutrition computed from the matched food, if any."""
+    item = {key: value for key, value in item.items() if key not in MATCH_FIELDS}
+    grams = _number(item.get('weight_grams'))
+    match = index.match(item.get('name', '')) if grams and grams > 0 else None
+    if match is None:
+        item['nutrition_source'] = 'model'
+        return item
+    food = index.foods[match.food_id]
+    for nutrient in NUTRIENTS:
+        item[nutrient] = round(food[nutrient] * grams / 100, 1)
+    item.update(food_id=match.food_id, canonical_name=match.name, match_score=round(match.score, 2),
+                nutrition_source='database')
+    return item
+
+
+def _unchanged(item: dict, previous: Optional[dict]) -> bool:
+    return previous is not None and normalize_name(item.get('name')) == normalize_name(previous.get('name')) \
+        and _number(item.get('weight_grams')) == _number(previous.get('weight_grams'))
+
+
+def reconcile_fields(items, previous_items=None) -> dict:
+    """FoodScan fields for ``items`` with nutrition recomputed locally.
+
+    With ``previous_items`` (an edit), items whose name and weight did not
+    change are kept as given, so hand-edited numbers survive.
+    """
+    index = get_index()
+    previous_items = previous_items or []
+    reconciled = []
+    for position, item in enumerate(items):
+        if not isinstance(item, dict):
+            continue
+        previous = previous_items[position] if position < len(previous_items) else None
+        reconciled.append(dict(item) if _unchanged(item, previous) else reconcile_item(item, index))
+
+    fields = {'food_items': reconciled}
+    if any(item.get('nutrition_source') == 'database' for item in reconciled) or previous_items:
+        for total in TOTAL_FIELDS:
+            fields[total] = round(sum(_number(item.get(total)) or 0 for item in reconciled), 1)
+    return fields
+
+
+def main_item_index(items) -> Optional[int]:
+    """The item a scan-level correction refers to: the only one, or the largest."""
+    candidates = [i for i, item in enumerate(items) if isinstance(item, dict)]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda i: _number(items[i].get('calories')) or 0)
+
+
+def learn_from_feedback(feedback) -> None:
+    """Record ``correct_food_name`` as an alias and fix the scan it corrects."""
+    match = get_index().match(feedback.correct_food_name, threshold=settings.NUTRITION_FEEDBACK_THRESHOLD)
+    scan = feedback.scan
+    items = list(scan.food_items or [])
+    position = main_item_index(items)
+    if match is None or position is None:
+        return
+
+    alias = normalize_name(items[position].get('name'))
+    if alias and alias != match.name:
+        learned, created = FoodAlias.objects.get_or_create(
+            alias=alias, food_id=match.food_id, defaults={'source': FoodAlias.SOURCE_FEEDBACK},
+        )
+        if not created and learned.source == FoodAlias.SOURCE_FEEDBACK:
+            FoodAlias.objects.filter(pk=learned.pk).update(votes=F('votes') + 1)
+            invalidate()
+
+    items[position] = {**items[position], 'name': match.name}
+    for field, value in reconcile_fields(items, scan.food_items).items():
+        setattr(scan, field, value)
+    scan.save()
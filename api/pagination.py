@@ -0,0 +1,95 @@
+import base64
+
+from django.db.models import Model, Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Keyset (cursor) pagination on ``(timestamp, id)``.
+
+    Unlike DRF's CursorPagination, the cursor holds the exact position of
+    the last row, so each page is a single index range scan with no OFFSET
+    however deep the client pages. Responses look like
+    ``{"next": <url or null>, "results": [...]}``.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    page_size = 50
+    max_page_size = 200
+    descending = True
+
+    def __init__(self, descending=None):
+        if descending is not None:
+            self.descending = descending
+
+    def is_requested(self, request):
+        """Endpoints that predate pagination only paginate when asked to."""
+        return (self.cursor_query_param in request.query_params
+                or self.page_size_query_param in request.query_params)
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def encode_cursor(self, row):
+        # A model instance, or a values_list() row starting with (id, timestamp)
+        # as produced by api/encoders.py
+        pk, timestamp = (row.pk, row.timestamp) if isinstance(row, Model) else row[:2]
+        raw = f"{timestamp.isoformat()}|{pk}"
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            timestamp, pk = base64.urlsafe_b64decode(padded).decode().split('|')
+            timestamp = parse_datetime(timestamp)
+            pk = int(pk)
+        except (ValueError, UnicodeDecodeError):
+            raise NotFound('Invalid cursor')
+        if timestamp is None:
+            raise NotFound('Invalid cursor')
+        return timestamp, pk
+
+    def order(self, queryset):
+        if self.descending:
+            return queryset.order_by('-timestamp', '-id')
+        return queryset.order_by('timestamp', 'id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        queryset = self.order(queryset)
+
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            timestamp, pk = self.decode_cursor(cursor)
+            if self.descending:
+                queryset = queryset.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=pk))
+            else:
+                queryset = queryset.filter(Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=pk))
+
+        # One extra row tells us whether there is a next page
+        rows = list(queryset[:page_size + 1])
+        self.has_next = len(rows) > page_size
+        page = rows[:page_size]
+        self.next_cursor = self.encode_cursor(page[-1]) if self.has_next else None
+        return page
+
+    def get_next_link(self):
+        if not self.next_cursor:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
@@ -0,0 +1,314 @@
+"""
+Shared steps of the food scan pipeline.
+
+``FoodAnalyzeView`` runs them inline; background workers (api/queues.py)
+run ``process_scan`` for scans uploaded in async mode. Images are kept in
+the ``scans`` storage (api/storage.py); ``FoodScan.image_path`` holds the
+storage key.
+"""
+import io
+import logging
+import mmap
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import NamedTuple
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from . import utils, scan_cache, imaging, storage, rollups, ratelimit, nutrition, metrics
+from .models import FoodScan
+from .serializers import FoodScanSerializer
+
+logger = logging.getLogger(__name__)
+
+# Scans stored before api/storage.py recorded paths relative to the project
+LEGACY_SCANS_DIR = "media/scans"
+
+
+class PreparedUpload(NamedTuple):
+    digest: str                  # SHA-256 of the uploaded bytes; the cache key
+    size: int                    # bytes received from the client
+    image: imaging.ProcessedImage  # what is stored and sent to the model
+    key: str                     # storage key of the processed image
+    thumbnail_key: str           # "" when no thumbnail could be made
+    stored: Future               # resolves once both are in storage
+
+    def wait_stored(self):
+        """Block until the image and thumbnail are stored; re-raises write errors."""
+        self.stored.result()
+
+
+@lru_cache(maxsize=None)
+def _storage_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=settings.SCAN_STORAGE_WORKERS,
+                              thread_name_prefix="scan-storage")
+
+
+@contextmanager
+def upload_buffer(image):
+    """Yield ``(view, fp)`` over an uploaded file's bytes without copying them.
+
+    ``view`` is a read-only memoryview for hashing and ``fp`` a seekable
+    reader over the same memory. Small uploads are held in a BytesIO by
+    Django's MemoryFileUploadHandler and its buffer is exported directly;
+    larger ones were spooled to a temporary file and are memory-mapped.
+    """
+    f = image.file
+    if hasattr(f, "getbuffer"):
+        view = f.getbuffer()
+        try:
+            yield view, f
+        finally:
+            view.release()
+    elif image.size and hasattr(f, "fileno"):
+        f.flush()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            view = memoryview(mapped)
+            try:
+                yield view, mapped
+            finally:
+                view.release()
+    else:
+        image.seek(0)
+        data = image.read()
+        yield memoryview(data), io.BytesIO(data)
+
+
+def _store_files(files) -> None:
+    with metrics.span('storage_write'):
+        for key, data in files:
+            storage.put(key, data)
+
+
+def prepare_upload(image) -> PreparedUpload:
+    """Preprocess an uploaded image and start storing it and its thumbnail.
+
+    The upload is read in place (see ``upload_buffer``) and the processed
+    bytes are shared by the storage write and the model call, so the image
+    is never written and read back. Files are stored on a background
+    thread; call ``wait_stored()`` before handing the keys to anyone else.
+    Keys are derived from the hash of the uploaded bytes, so re-uploads of
+    the same photo share one stored object.
+    """
+    with metrics.span('upload'), upload_buffer(image) as (view, fp):
+        digest = scan_cache.content_digest(view)
+        size = len(view)
+        processed, thumbnail = imaging.prepare_scan_image(fp, image.content_type)
+
+    key = storage.scan_key(digest, processed.extension)
+    files = [(key, processed.data)]
+    thumbnail_key = ""
+    if thumbnail is not None:
+        thumbnail_key = storage.scan_key(digest, thumbnail.extension, suffix="_thumb")
+        files.append((thumbnail_key, thumbnail.data))
+    stored = _storage_executor().submit(_store_files, files)
+    return PreparedUpload(digest, size, processed, key, thumbnail_key, stored)
+
+
+def media_url(request, key: str) -> str:
+    """URL of a stored scan file to save on its FoodScan row.
+
+    The storage backend decides the URL (see ``storage.stored_url``); a
+    relative base URL (local storage without SCAN_MEDIA_URL) is made
+    absolute against the request host.
+    """
+    if not key:
+        return ""
+    url = storage.stored_url(key)
+    if url.startswith("/") and request is not None:
+        url = request.build_absolute_uri(url)
+    return url
+
+
+def upload_fields(request, upload: PreparedUpload) -> dict:
+    """FoodScan fields describing a stored upload."""
+    return {
+        "image_url": media_url(request, upload.key),
+        "thumbnail_url": media_url(request, upload.thumbnail_key),
+        "image_path": upload.key,
+        "image_digest": upload.digest,
+        "content_type": upload.image.content_type or "",
+    }
+
+
+def wants_async(request) -> bool:
+    """Async mode is requested with ?mode=async or `Prefer: respond-async`."""
+    mode = request.GET.get('mode')
+    if mode:
+        return mode == 'async'
+    if 'respond-async' in request.headers.get('Prefer', ''):
+        return True
+    return settings.SCAN_ASYNC_DEFAULT
+
+
+def analyze_image(image_bytes: bytes, content_type: str, digest=None):
+    """Analyze an image, reusing a cached result when one exists.
+
+    Returns ``(analysis_result, cache_status)`` where cache_status is
+    ``"hit"`` or ``"miss"``.
+    """
+    analysis_result = scan_cache.lookup(image_bytes, digest)
+    if analysis_result is not None:
+        return analysis_result, "hit"
+    return run_analysis(image_bytes, content_type, digest), "miss"
+
+
+def run_analysis(image_bytes: bytes, content_type: str, digest=None) -> dict:
+    """Call the model unconditionally and cache a successful result."""
+    logger.debug("Sending scan to the model")
+    analysis_result = utils.analyze_food_image(image_bytes, content_type)
+    scan_cache.store(image_bytes, analysis_result, digest)
+    return analysis_result
+
+
+async def arun_analysis(image_bytes: bytes, content_type: str, digest=None) -> dict:
+    """Async counterpart of run_analysis for the async views."""
+    logger.debug("Sending scan to the model (async)")
+    analysis_result = await utils.analyze_food_image_async(image_bytes, content_type)
+    scan_cache.store(image_bytes, analysis_result, digest)
+    return analysis_result
+
+
+def analyze_upload(image):
+    """Prepare, analyze and store one image of a batch.
+
+    Returns ``(upload, analysis_result, cache_status)``; failures come back
+    as an ``{"error": ...}`` result instead of raising, so one bad image
+    does not sink the rest of the batch.
+    """
+    try:
+        upload = prepare_upload(image)
+        analysis_result, cache_status = analyze_image(
+            upload.image.data, upload.image.content_type, upload.digest
+        )
+        if analysis_result and "error" not in analysis_result:
+            upload.wait_stored()
+        return upload, analysis_result, cache_status
+    except ratelimit.AIServiceUnavailable as exc:
+        return None, unavailable_result(exc), "miss"
+    except Exception as e:
+        return None, {"error": f"AI Analysis failed: {e}"}, "miss"
+
+
+def unavailable_result(exc) -> dict:
+    """Batch item result for an image that was shed by admission control."""
+    return {"error": str(exc.detail), "retry_after": exc.wait}
+
+
+def record_batch(request, images, outcomes):
+    """Save the successful items of a batch with one bulk insert.
+
+    ``outcomes`` are ``analyze_upload`` results in the order of ``images``.
+    Returns the per-item results for the response and whether every item
+    succeeded.
+    """
+    results, created = [], []
+    for index, (image, (upload, analysis_result, cache_status)) in enumerate(zip(images, outcomes)):
+        item = {"index": index, "name": image.name}
+        if upload is None or not analysis_result or "error" in analysis_result:
+            analysis_result = analysis_result or {}
+            item["status"] = 503 if "retry_after" in analysis_result else 400
+            item["error"] = analysis_result.get("error", "Analysis failed")
+            if "retry_after" in analysis_result:
+                item["retry_after"] = analysis_result["retry_after"]
+        else:
+            item["status"] = 201
+            item["cache"] = cache_status
+            scan = FoodScan(user=request.user, **upload_fields(request, upload),
+                            **analysis_fields(analysis_result))
+            created.append((item, scan))
+        results.append(item)
+
+    scans = [scan for _, scan in created]
+    with transaction.atomic(), metrics.span('db_insert'):
+        FoodScan.objects.bulk_create(scans)
+        # bulk_create skips the signals that maintain the rollups
+        rollups.add_scans(scans)
+    for item, scan in created:
+        item["scan"] = FoodScanSerializer(scan).data
+    return results, len(created) == len(results)
+
+
+def analysis_fields(analysis_result: dict) -> dict:
+    """Map an analysis result onto FoodScan model fields.
+
+    With NUTRITION_RECONCILE, item nutrition and the totals are recomputed
+    from the local food database (api/nutrition.py).
+    """
+    fields = {
+        "food_items": analysis_result.get("items", []),
+        "calories": analysis_result.get("calories", 0),
+        "protein": analysis_result.get("protein", 0),
+        "carbs": analysis_result.get("carbs", 0),
+        "fats": analysis_result.get("fats", 0),
+        "health_score": analysis_result.get("health_score", "B"),
+        "dietary_tags": analysis_result.get("dietary_tags", []),
+        "ai_insights": analysis_result.get("ai_insights", "Your meal is analyzed."),
+    }
+    if settings.NUTRITION_RECONCILE and fields["food_items"]:
+        fields.update(nutrition.reconcile_fields(fields["food_items"]))
+    return fields
+
+
+def read_stored_image(image_path: str) -> bytes:
+    """Bytes of a scan's stored image, given its ``image_path``."""
+    if image_path.startswith(LEGACY_SCANS_DIR + "/"):
+        with open(image_path, "rb") as f:
+            return f.read()
+    with storage.get_scan_storage().open(image_path, "rb") as f:
+        return f.read()
+
+
+def process_scan(scan_id: int) -> FoodScan:
+    """Analyze a queued scan's stored image and fill in its row.
+
+    Raises AIServiceUnavailable, with the scan back in the queue, when the
+    model call was shed; the caller should wait ``exc.wait`` seconds.
+    """
+    scan = FoodScan.objects.get(pk=scan_id)
+    try:
+        image_bytes = read_stored_image(scan.image_path)
+        analysis_result, _ = analyze_image(image_bytes, scan.content_type, scan.image_digest or None)
+    except ratelimit.AIServiceUnavailable:
+        # Not the scan's fault: put it back without using up an attempt
+        FoodScan.objects.filter(pk=scan.pk).update(
+            status=FoodScan.STATUS_PENDING, claimed_at=None, attempts=F('attempts') - 1
+        )
+        raise
+    except Exception as e:
+        analysis_result = {"error": f"AI Analysis failed: {e}"}
+
+    if not analysis_result or "error" in analysis_result:
+        fields = {"status": FoodScan.STATUS_FAILED,
+                  "error": (analysis_result or {}).get("error", "Analysis failed")}
+    else:
+        fields = {**analysis_fields(analysis_result), "status": FoodScan.STATUS_DONE, "error": ""}
+    with metrics.span('db_insert'):
+        return _finish_scan(scan.pk, fields)
+
+
+def _finish_scan(scan_id: int, fields: dict) -> FoodScan:
+    """Write a claimed scan's outcome without undoing edits made meanwhile.
+
+    Only the analysis columns are written, and only while the row is still
+    ``processing``; items the owner entered during the analysis are kept.
+    Raises FoodScan.DoesNotExist if the scan was deleted. A queryset
+    update sends no signals, so the rollups are updated here.
+    """
+    with transaction.atomic():
+        current = FoodScan.objects.select_for_update().filter(pk=scan_id).first()
+        if current is None:
+            raise FoodScan.DoesNotExist(f"Scan {scan_id} was deleted during analysis")
+        if current.status != FoodScan.STATUS_PROCESSING:
+            return current
+        if current.food_items and "food_items" in fields:
+            for field in ("food_items",) + rollups.TOTAL_FIELDS:
+                fields.pop(field, None)
+        previous = rollups.contribution(current)
+        FoodScan.objects.filter(pk=scan_id, status=FoodScan.STATUS_PROCESSING).update(**fields)
+        current.refresh_from_db()
+        rollups.replace(previous, rollups.contribution(current))
+    return current
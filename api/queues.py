@@ -0,0 +1,151 @@
+"""
+Pluggable queues for asynchronous scan analysis.
+
+A scan uploaded in async mode is saved as a ``pending`` FoodScan row and
+handed to the queue configured by ``SCAN_QUEUE_BACKEND``:
+
+* ``DatabaseScanQueue`` (default) treats the pending rows themselves as the
+  queue. ``manage.py run_scan_workers`` drains it; no broker is needed.
+* ``ThreadPoolScanQueue`` runs scans on an in-process thread pool, which is
+  handy for local development. Because the rows are still in the database,
+  a database worker picks up anything lost when the process exits.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import FoodScan
+from .ratelimit import AIServiceUnavailable
+from . import pipeline, ratelimit
+
+logger = logging.getLogger(__name__)
+
+
+class BaseScanQueue:
+    def enqueue(self, scan: FoodScan) -> None:
+        raise NotImplementedError
+
+
+class DatabaseScanQueue(BaseScanQueue):
+    def enqueue(self, scan):
+        # The pending row is the queue entry; workers poll for it.
+        pass
+
+    def _claimable(self):
+        stale = timezone.now() - timedelta(seconds=settings.SCAN_QUEUE_VISIBILITY_TIMEOUT)
+        return Q(status=FoodScan.STATUS_PENDING) | Q(
+            status=FoodScan.STATUS_PROCESSING, claimed_at__lt=stale
+        )
+
+    def claim(self):
+        """Atomically claim the oldest runnable scan and return its id, or None.
+
+        Scans whose worker died mid-analysis become claimable again once
+        ``SCAN_QUEUE_VISIBILITY_TIMEOUT`` has passed.
+        """
+        claimable = self._claimable()
+        candidates = list(
+            FoodScan.objects.filter(claimable).order_by('id').values_list('id', 'attempts')[:20]
+        )
+        for scan_id, attempts in candidates:
+            if attempts >= settings.SCAN_QUEUE_MAX_ATTEMPTS:
+                FoodScan.objects.filter(claimable, pk=scan_id).update(
+                    status=FoodScan.STATUS_FAILED,
+                    error="Analysis failed: worker gave up after repeated attempts",
+                )
+                continue
+            if self._claim_one(scan_id, claimable):
+                return scan_id
+        return None
+
+    def _claim_one(self, scan_id, claimable):
+        # The conditional UPDATE is the lock: only one worker sees rowcount 1.
+        return FoodScan.objects.filter(claimable, pk=scan_id).update(
+            status=FoodScan.STATUS_PROCESSING,
+            claimed_at=timezone.now(),
+            attempts=F('attempts') + 1,
+        )
+
+
+class ThreadPoolScanQueue(DatabaseScanQueue):
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.SCAN_WORKER_CONCURRENCY, thread_name_prefix='scan-worker'
+        )
+
+    def enqueue(self, scan):
+        self._executor.submit(self._run, scan.pk)
+
+    def _run(self, scan_id):
+        try:
+            if self._claim_one(scan_id, self._claimable()):
+                pipeline.process_scan(scan_id)
+        except FoodScan.DoesNotExist:
+            pass
+        except AIServiceUnavailable as exc:
+            retry = threading.Timer(exc.wait, self._executor.submit, (self._run, scan_id))
+            retry.daemon = True
+            retry.start()
+        finally:
+            close_old_connections()
+
+
+@lru_cache(maxsize=None)
+def get_scan_queue() -> BaseScanQueue:
+    return import_string(settings.SCAN_QUEUE_BACKEND)()
+
+
+def run_workers(queue: DatabaseScanQueue, concurrency: int, poll_interval: float,
+                stop_event: threading.Event, once: bool = False):
+    """Drain ``queue`` with ``concurrency`` worker threads until ``stop_event`` is set.
+
+    With ``once=True`` each thread exits as soon as the queue is empty.
+    """
+    def work():
+        while not stop_event.is_set():
+            try:
+                # Leave scans queued while the model quota breaker is open
+                backoff = ratelimit.breaker.open_for()
+                if backoff:
+                    stop_event.wait(backoff)
+                    continue
+                scan_id = queue.claim()
+                if scan_id is None:
+                    if once:
+                        return
+                    stop_event.wait(poll_interval)
+                    continue
+                logger.debug("Worker %s processing scan %s", threading.current_thread().name, scan_id)
+                started = time.monotonic()
+                scan = pipeline.process_scan(scan_id)
+                logger.info("Scan %s %s in %.2fs", scan_id, scan.status, time.monotonic() - started)
+            except FoodScan.DoesNotExist:
+                # Deleted by its owner while queued
+                continue
+            except AIServiceUnavailable as exc:
+                stop_event.wait(exc.wait)
+            except Exception:
+                # Keep the worker alive through transient database errors
+                logger.exception("Scan worker error")
+                stop_event.wait(poll_interval)
+            finally:
+                close_old_connections()
+
+    threads = [
+        threading.Thread(target=work, name=f"scan-worker-{i}", daemon=True)
+        for i in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        while thread.is_alive():
+            thread.join(timeout=1.0)
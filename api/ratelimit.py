@@ -0,0 +1,350 @@
+"""
+Admission control for model calls.
+
+Three layers, all kept in the ``AI_RATE_LIMIT_CACHE`` cache so every
+process sees the same state:
+
+* ``AIRateThrottle`` - a DRF throttle with a token bucket per user. Over
+  the limit the client gets 429 with ``Retry-After``.
+* A global token bucket shared by everyone, sized to the Gemini quota.
+  ``model_call()`` reserves a token before each call; if the next token is
+  at most ``AI_RATE_LIMIT_MAX_WAIT`` seconds away the call waits for it,
+  otherwise it is shed.
+* ``QuotaBreaker`` - opens after ``AI_BREAKER_THRESHOLD`` quota errors
+  (429 / ResourceExhausted) within ``AI_BREAKER_WINDOW`` seconds. While
+  open, calls are shed for ``AI_BREAKER_COOLDOWN`` seconds (or the API's
+  retry hint); then a single probe call decides whether it closes.
+
+Shed calls raise ``AIServiceUnavailable`` (503 with ``Retry-After``).
+Scan uploads queue themselves for the background workers instead, and the
+workers wait out an open breaker. ``snapshot()`` reports the state and
+counters for ``/api/admin/ai-limits``.
+
+The generic cache API has no compare-and-set, so updates are serialized
+per process only; concurrent processes may overshoot a bucket slightly.
+"""
+import asyncio
+import math
+import re
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.throttling import BaseThrottle
+
+_lock = threading.Lock()
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+COUNTERS = (
+    'admitted', 'queued', 'shed_breaker', 'shed_global', 'throttled_user',
+    'quota_errors', 'breaker_opened',
+)
+RETRY_HINT_PATTERNS = (
+    re.compile(r'retry in ([\d.]+)\s*s', re.IGNORECASE),
+    re.compile(r'retry_?delay\W+(?:seconds\W+)?([\d.]+)', re.IGNORECASE),
+)
+
+
+class AIServiceUnavailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'The AI service is at capacity. Please retry later.'
+    default_code = 'ai_unavailable'
+
+    def __init__(self, wait, detail=None):
+        self.wait = max(1, math.ceil(wait))
+        super().__init__(detail)
+
+
+def _cache():
+    return caches[settings.AI_RATE_LIMIT_CACHE]
+
+
+def parse_rate(rate):
+    """``"30/min"`` -> tokens per second, or None when the limit is disabled."""
+    if not rate:
+        return None
+    num, period = rate.split('/')
+    return int(num) / PERIODS[period[0]]
+
+
+def count(name, amount=1):
+    key = f'ai:metrics:{name}'
+    cache = _cache()
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key, amount)
+    except ValueError:
+        # Evicted between add() and incr()
+        cache.set(key, amount, timeout=None)
+
+
+class TokenBucket:
+    """Token bucket refilling at ``rate`` tokens/s up to ``burst`` tokens.
+
+    Stored as a single timestamp, the time at which the bucket will be full
+    again (GCRA), so a check is one cache read and at most one write.
+    """
+
+    def __init__(self, key, rate, burst):
+        self.key = f'ai:bucket:{key}'
+        self.interval = 1.0 / rate
+        self.burst = max(1, burst)
+
+    def reserve(self, cost=1, max_wait=0.0):
+        """Take ``cost`` tokens, waiting at most ``max_wait`` seconds for them.
+
+        Returns ``(admitted, wait)``: when admitted the caller must sleep
+        ``wait`` seconds before using the tokens; otherwise ``wait`` is how
+        long until they would be available.
+        """
+        cost = min(cost, self.burst)
+        cache = _cache()
+        with _lock:
+            now = time.time()
+            full_at = max(cache.get(self.key) or now, now)
+            new_full_at = full_at + cost * self.interval
+            wait = new_full_at - self.burst * self.interval - now
+            if wait > max_wait:
+                return False, wait
+            cache.set(self.key, new_full_at, timeout=math.ceil(new_full_at - now) + 1)
+        return True, max(wait, 0.0)
+
+    def available(self):
+        full_at = _cache().get(self.key)
+        if full_at is None:
+            return float(self.burst)
+        return max(0.0, self.burst - max(full_at - time.time(), 0.0) / self.interval)
+
+
+class QuotaBreaker:
+    OPEN_KEY = 'ai:breaker:open_until'
+    PROBE_KEY = 'ai:breaker:probe'
+
+    def _errors_key(self, now):
+        return f'ai:breaker:errors:{int(now // settings.AI_BREAKER_WINDOW)}'
+
+    def open_for(self):
+        """Seconds until the breaker half-opens; 0 when closed or half-open."""
+        open_until = _cache().get(self.OPEN_KEY)
+        if open_until is None:
+            return 0.0
+        return max(0.0, open_until - time.time())
+
+    def before_call(self):
+        """Seconds the caller should back off, or 0 if the call may go ahead."""
+        cache = _cache()
+        open_until = cache.get(self.OPEN_KEY)
+        if open_until is None:
+            return 0.0
+        now = time.time()
+        if now < open_until:
+            return open_until - now
+        # Half-open: let one probe through at a time
+        if cache.add(self.PROBE_KEY, 1, timeout=settings.AI_HTTP_TIMEOUT):
+            return 0.0
+        return 1.0
+
+    def release_probe(self):
+        """Let the next half-open call probe after this one failed without a 429.
+
+        Timeouts, 5xx errors and cancelled hedges say nothing about the
+        quota; the probe slot would otherwise stay taken for
+        ``AI_HTTP_TIMEOUT``. While half-open only the probe is admitted, so
+        the failing call is nearly always the one holding the slot; at worst
+        a call admitted before the breaker opened lets one extra probe in.
+        """
+        _cache().delete(self.PROBE_KEY)
+
+    def record_success(self):
+        cache = _cache()
+        if cache.get(self.OPEN_KEY) is not None and self.open_for() == 0:
+            cache.delete_many([self.OPEN_KEY, self.PROBE_KEY])
+
+    def record_quota_error(self, retry_hint=None):
+        """Count a 429 and open the breaker if needed; returns the back-off in seconds."""
+        cache = _cache()
+        now = time.time()
+        key = self._errors_key(now)
+        cache.add(key, 0, timeout=settings.AI_BREAKER_WINDOW * 2)
+        try:
+            errors = cache.incr(key)
+        except ValueError:
+            errors = 1
+        count('quota_errors')
+
+        cooldown = max(settings.AI_BREAKER_COOLDOWN, retry_hint or 0)
+        half_open = cache.get(self.OPEN_KEY) is not None
+        if half_open or errors >= settings.AI_BREAKER_THRESHOLD:
+            cache.set(self.OPEN_KEY, now + cooldown, timeout=None)
+            cache.delete(self.PROBE_KEY)
+            count('breaker_opened')
+            return cooldown
+        return retry_hint or 1.0
+
+    def state(self):
+        if _cache().get(self.OPEN_KEY) is None:
+            return 'closed'
+        return 'open' if self.open_for() > 0 else 'half_open'
+
+    def recent_errors(self):
+        return _cache().get(self._errors_key(time.time())) or 0
+
+
+breaker = QuotaBreaker()
+
+
+def user_bucket(user_key):
+    rate = parse_rate(settings.AI_RATE_LIMIT_USER)
+    return TokenBucket(f'user:{user_key}', rate, settings.AI_RATE_LIMIT_USER_BURST) if rate else None
+
+
+def global_bucket():
+    rate = parse_rate(settings.AI_RATE_LIMIT_GLOBAL)
+    return TokenBucket('global', rate, settings.AI_RATE_LIMIT_GLOBAL_BURST) if rate else None
+
+
+def retry_hint(error_str):
+    for pattern in RETRY_HINT_PATTERNS:
+        match = pattern.search(error_str)
+        if match:
+            return float(match.group(1))
+    return None
+
+
+def is_quota_error(error_str):
+    return "429" in error_str or "Quota exceeded" in error_str or "ResourceExhausted" in error_str
+
+
+def _admit():
+    """Sleep needed before the call, or raise AIServiceUnavailable."""
+    wait = breaker.before_call()
+    if wait:
+        count('shed_breaker')
+        raise AIServiceUnavailable(wait)
+    bucket = global_bucket()
+    if bucket is not None:
+        admitted, wait = bucket.reserve(max_wait=settings.AI_RATE_LIMIT_MAX_WAIT)
+        if not admitted:
+            count('shed_global')
+            raise AIServiceUnavailable(wait)
+        if wait:
+            count('queued')
+    count('admitted')
+    return wait
+
+
+def _failed(exc):
+    """Record a failed call; returns the exception to raise in its place, if any."""
+    error_str = str(exc)
+    if not is_quota_error(error_str):
+        return None
+    return AIServiceUnavailable(breaker.record_quota_error(retry_hint(error_str)))
+
+
+@contextmanager
+def model_call():
+    """Wrap one blocking model call with admission control and 429 tracking."""
+    wait = _admit()
+    if wait:
+        time.sleep(wait)
+    succeeded = False
+    try:
+        yield
+        succeeded = True
+    except AIServiceUnavailable:
+        raise
+    except Exception as e:
+        replacement = _failed(e)
+        if replacement is not None:
+            raise replacement from e
+        raise
+    finally:
+        if not succeeded:
+            breaker.release_probe()
+    breaker.record_success()
+
+
+@asynccontextmanager
+async def amodel_call():
+    """Async counterpart of model_call()."""
+    wait = await sync_to_async(_admit, thread_sensitive=False)()
+    if wait:
+        await asyncio.sleep(wait)
+    succeeded = False
+    try:
+        yield
+        succeeded = True
+    except AIServiceUnavailable:
+        raise
+    except Exception as e:
+        replacement = await sync_to_async(_failed, thread_sensitive=False)(e)
+        if replacement is not None:
+            raise replacement from e
+        raise
+    finally:
+        if not succeeded:
+            # Also reached when a hedged call is cancelled
+            await sync_to_async(breaker.release_probe, thread_sensitive=False)()
+    await sync_to_async(breaker.record_success, thread_sensitive=False)()
+
+
+class AIRateThrottle(BaseThrottle):
+    """Per-user token bucket for endpoints that call the model.
+
+    Safe methods are never throttled. Views may define
+    ``ai_call_cost(request)`` (e.g. the number of images in a batch) and
+    ``ai_overflow = 'queue'`` to be let through while the breaker is open
+    because they can defer the work instead of calling the model.
+    """
+
+    def __init__(self):
+        self.wait_seconds = None
+
+    def allow_request(self, request, view):
+        if request.method in SAFE_METHODS:
+            return True
+        open_for = breaker.open_for()
+        if open_for and getattr(view, 'ai_overflow', None) != 'queue':
+            count('shed_breaker')
+            raise AIServiceUnavailable(open_for)
+
+        user = getattr(request, 'user', None)
+        key = user.pk if user is not None and user.is_authenticated else self.get_ident(request)
+        bucket = user_bucket(key)
+        if bucket is None:
+            return True
+        cost = view.ai_call_cost(request) if hasattr(view, 'ai_call_cost') else 1
+        admitted, self.wait_seconds = bucket.reserve(cost)
+        if not admitted:
+            count('throttled_user')
+        return admitted
+
+    def wait(self):
+        return self.wait_seconds
+
+
+def snapshot():
+    """Current limiter state and counters, for monitoring."""
+    bucket = global_bucket()
+    return {
+        'breaker': {
+            'state': breaker.state(),
+            'open_for_seconds': round(breaker.open_for(), 1),
+            'recent_quota_errors': breaker.recent_errors(),
+            'threshold': settings.AI_BREAKER_THRESHOLD,
+            'window_seconds': settings.AI_BREAKER_WINDOW,
+        },
+        'global_bucket': None if bucket is None else {
+            'rate': settings.AI_RATE_LIMIT_GLOBAL,
+            'burst': bucket.burst,
+            'available_tokens': round(bucket.available(), 2),
+        },
+        'user_rate': settings.AI_RATE_LIMIT_USER or None,
+        'counters': {name: _cache().get(f'ai:metrics:{name}') or 0 for name in COUNTERS},
+    }
@@ -0,0 +1,79 @@
+import json
+import re
+from itertools import chain
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # optional; ORJSONRenderer falls back to DRF's encoder
+    orjson = None
+
+# orjson writes floats below 1e-4 as 0.0000… and uses exponents without a
+# sign or zero padding (1e16, 1e-7) where json.dumps writes 1e-05, 1e+16 and
+# 1e-07. Both searches start on a literal, which keeps them fast on large
+# responses.
+_SMALL_FLOAT = re.compile(rb'0\.0000')
+_EXPONENT = re.compile(rb'e[-0-9]')
+_NUMBER_CHARS = frozenset(b'0123456789.-')
+_BEFORE_NUMBER = frozenset(b':,[')
+
+
+def _float_mismatch(ret: bytes) -> bool:
+    """Whether orjson wrote a float that json.dumps formats differently.
+
+    A look-alike inside a string (a timestamp, a hex digest) only counts
+    when it is placed like a JSON number, and then it only costs a fallback.
+    """
+    for match in chain(_SMALL_FLOAT.finditer(ret), _EXPONENT.finditer(ret)):
+        start = match.start()
+        while start and ret[start - 1] in _NUMBER_CHARS:
+            start -= 1
+        if not start or ret[start] == ord('e') or ret[start - 1] not in _BEFORE_NUMBER:
+            continue
+        # After a colon only as an object value, which rules out times of day
+        if ret[start - 1] != ord(':') or ret[start - 2:start - 1] == b'"':
+            return True
+    return False
+
+
+class ORJSONRenderer(JSONRenderer):
+    """DRF's JSONRenderer output, byte for byte, encoded with orjson.
+
+    Matches DRF's default settings: compact separators, unescaped unicode
+    with U+2028/U+2029 still escaped. Values orjson has no native encoding
+    for (dates and times, Decimal, lazy strings) go through DRF's
+    JSONEncoder.default as before. Indented output, ASCII-only settings,
+    anything orjson cannot encode and the rare float that it formats
+    differently are rendered by JSONRenderer itself. One difference: NaN
+    and Infinity render as null instead of failing the request.
+    """
+    options = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS if orjson else 0
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (orjson is None or data is None or self.ensure_ascii or not self.compact
+                or self.get_indent(accepted_media_type, renderer_context or {})):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self.encoder_class().default, option=self.options)
+        except (TypeError, orjson.JSONEncodeError):
+            return super().render(data, accepted_media_type, renderer_context)
+        if _float_mismatch(ret):
+            return super().render(data, accepted_media_type, renderer_context)
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+
+class EventStreamRenderer(BaseRenderer):
+    """Lets clients negotiate `Accept: text/event-stream` on streaming views.
+
+    Streamed replies bypass rendering entirely; this only renders the
+    non-streamed responses of such a request (e.g. a 400) as one SSE event.
+    """
+    media_type = 'text/event-stream'
+    format = 'event-stream'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response = (renderer_context or {}).get('response')
+        event = 'error' if response is not None and response.status_code >= 400 else 'message'
+        return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode(self.charset)
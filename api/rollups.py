@@ -0,0 +1,144 @@
+"""
+Incremental maintenance of DailyNutritionSummary.
+
+Every completed scan contributes its calories and macros to one
+``(user, local date, meal_type)`` row. Saves and deletes apply the
+difference between a scan's old and new contribution, so dashboard reads
+cost O(days) and never re-aggregate scans.
+"""
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, F, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+from django.utils import timezone
+
+from .models import DailyNutritionSummary, FoodScan
+
+TOTAL_FIELDS = ('calories', 'protein', 'carbs', 'fats')
+
+
+def contribution(scan):
+    """``(key, amounts)`` a scan adds to the rollups, or None if it adds nothing."""
+    if scan.status != FoodScan.STATUS_DONE or scan.timestamp is None:
+        return None
+    key = (scan.user_id, timezone.localdate(scan.timestamp), scan.meal_type or '')
+    amounts = {'scan_count': 1}
+    amounts.update({field: float(getattr(scan, field) or 0) for field in TOTAL_FIELDS})
+    return key, amounts
+
+
+def apply(entry, sign=1):
+    """Add (sign=1) or remove (sign=-1) a contribution from its summary row."""
+    if entry is None:
+        return
+    (user_id, date, meal_type), amounts = entry
+    rows = DailyNutritionSummary.objects.filter(user_id=user_id, date=date, meal_type=meal_type)
+    with transaction.atomic():
+        if sign > 0:
+            rows.get_or_create(user_id=user_id, date=date, meal_type=meal_type)
+        # Removals never create rows: during a cascading user delete the
+        # summary may already be gone.
+        rows.update(**{field: F(field) + sign * amount for field, amount in amounts.items()})
+        if sign < 0:
+            rows.filter(scan_count__lte=0).delete()
+
+
+def add_scans(scans):
+    """Add the contributions of rows inserted with bulk_create, which skips signals.
+
+    Scans landing on the same summary row are merged into a single update.
+    """
+    merged = {}
+    for scan in scans:
+        entry = contribution(scan)
+        if entry is None:
+            continue
+        key, amounts = entry
+        totals = merged.setdefault(key, dict.fromkeys(amounts, 0))
+        for field, amount in amounts.items():
+            totals[field] += amount
+    for key, amounts in merged.items():
+        apply((key, amounts))
+
+
+def replace(previous, current):
+    """Move a scan's contribution from ``previous`` to ``current``."""
+    if previous == current:
+        return
+    apply(previous, -1)
+    apply(current, 1)
+
+
+def rebuild(user=None):
+    """Recompute summaries from the scans table (for backfills and drift repair)."""
+    scans = FoodScan.objects.filter(status=FoodScan.STATUS_DONE)
+    summaries = DailyNutritionSummary.objects.all()
+    if user is not None:
+        scans = scans.filter(user=user)
+        summaries = summaries.filter(user=user)
+
+    rows = (
+        scans.annotate(day=TruncDate('timestamp'), meal=Coalesce('meal_type', Value('')))
+        .values('user_id', 'day', 'meal')
+        .annotate(scan_count=Count('id'), **{field: Sum(field) for field in TOTAL_FIELDS})
+        .order_by()
+    )
+    with transaction.atomic():
+        summaries.delete()
+        DailyNutritionSummary.objects.bulk_create([
+            DailyNutritionSummary(
+                user_id=row['user_id'], date=row['day'], meal_type=row['meal'],
+                scan_count=row['scan_count'], **{field: row[field] or 0 for field in TOTAL_FIELDS}
+            )
+            for row in rows
+        ], batch_size=1000)
+
+
+def _empty_totals():
+    return {'scan_count': 0, **{field: 0.0 for field in TOTAL_FIELDS}}
+
+
+def _add(totals, row):
+    totals['scan_count'] += row.scan_count
+    for field in TOTAL_FIELDS:
+        totals[field] += getattr(row, field)
+
+
+def _rounded(totals):
+    return {key: round(value, 2) if key != 'scan_count' else value for key, value in totals.items()}
+
+
+def summarize(user, start, end, group='day'):
+    """Totals for ``start``..``end`` (inclusive dates), bucketed by day or by
+    ISO week (Monday start), each with a per-meal-type breakdown."""
+    def bucket_start(day):
+        return day - timedelta(days=day.weekday()) if group == 'week' else day
+
+    buckets = {}
+    day = start
+    while day <= end:
+        buckets.setdefault(bucket_start(day), {'totals': _empty_totals(), 'meals': {}})
+        day += timedelta(days=1)
+
+    totals = _empty_totals()
+    for row in DailyNutritionSummary.objects.filter(user=user, date__range=(start, end)):
+        bucket = buckets[bucket_start(row.date)]
+        meal = bucket['meals'].setdefault(row.meal_type or 'unspecified', _empty_totals())
+        for target in (totals, bucket['totals'], meal):
+            _add(target, row)
+
+    return {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'group': group,
+        'totals': _rounded(totals),
+        'periods': [
+            {
+                'start': period.isoformat(),
+                **_rounded(bucket['totals']),
+                'meals': {name: _rounded(meal) for name, meal in sorted(bucket['meals'].items())},
+            }
+            for period, bucket in sorted(buckets.items())
+        ],
+    }
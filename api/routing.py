@@ -0,0 +1,249 @@
+"""
+Model selection and failover across the Gemini family.
+
+Each call names a route (``scan``, ``scan_review``, ``coach``,
+``coach_small_talk``, ``coach_summary``); ``AI_MODEL_ROUTES`` maps it to a
+tier and ``AI_MODEL_TIERS`` lists the tier's models, primary first:
+
+* ``lite`` answers chat small talk and summarizes older chat turns,
+* ``flash`` analyzes scans and answers nutrition questions,
+* ``pro`` re-analyzes scans whose item confidence is below
+  ``AI_REANALYZE_CONFIDENCE``.
+
+``call(route, send)`` / ``acall(route, send)`` run ``send(model, timeout)``
+through invoke.call() with the route's policy, so every retry or hedge goes
+to the next sibling that has not been tried yet. ``AI_ROUTE_POLICIES``
+runs ``scan_review`` under the ``scan`` policy and the other coach routes
+under ``coach``. A quota error puts the model on cooldown (shared through
+the rate-limit cache) and fails over to a sibling immediately; it only
+reaches the circuit breaker once the whole tier is exhausted.
+
+Per-process stats (latency EWMA and recent success rate) order the
+siblings: healthy, fast models first, then configuration order.
+"""
+import logging
+import re
+import threading
+import time
+from collections import deque
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+
+from . import invoke, ratelimit
+
+logger = logging.getLogger(__name__)
+
+STATS_WINDOW = 50
+EWMA_ALPHA = 0.2
+SMALL_TALK_PATTERN = re.compile(
+    r"^\W*(hi|hello|hey|yo|thanks|thank you|thx|ok|okay|cool|great|nice|bye|goodbye|good (morning|afternoon|evening|night)"
+    r"|how are you|who are you|what can you do)\b",
+    re.IGNORECASE,
+)
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+class ModelFailover(Exception):
+    """Raised in place of a sibling-recoverable error so invoke retries at once."""
+    immediate_retry = True
+
+    def __init__(self, model, error):
+        self.model = model
+        self.error = error
+        # Keep the quota error's text out of the message so model_call()
+        # does not count it against the breaker
+        super().__init__(f"failing over from {model}")
+
+
+class ModelStats:
+    def __init__(self):
+        self.latency = None
+        self.outcomes = deque(maxlen=STATS_WINDOW)
+
+    def record(self, ok, seconds=None):
+        self.outcomes.append(ok)
+        if ok and seconds is not None:
+            self.latency = seconds if self.latency is None \
+                else EWMA_ALPHA * seconds + (1 - EWMA_ALPHA) * self.latency
+
+    def success_rate(self):
+        return sum(self.outcomes) / len(self.outcomes) if self.outcomes else 1.0
+
+
+def _model_stats(model):
+    with _stats_lock:
+        return _stats.setdefault(model, ModelStats())
+
+
+def _cache():
+    return caches[settings.AI_RATE_LIMIT_CACHE]
+
+
+def _cooldown_key(model):
+    return f'ai:model:cooldown:{model}'
+
+
+def cooling_down(model):
+    return bool(_cache().get(_cooldown_key(model)))
+
+
+def start_cooldown(model, seconds):
+    _cache().set(_cooldown_key(model), 1, timeout=max(1, int(seconds)))
+
+
+def tier_for(route):
+    return settings.AI_MODEL_ROUTES.get(route, settings.AI_MODEL_ROUTES['scan'])
+
+
+def models_for(route):
+    """The route's models, best candidate first."""
+    models = settings.AI_MODEL_TIERS[tier_for(route)]
+    with _stats_lock:
+        stats = {model: _stats.get(model) for model in models}
+    latencies = [s.latency for s in stats.values() if s is not None and s.latency is not None]
+    best_latency = min(latencies) if latencies else None
+
+    def rank(item):
+        position, model = item
+        s = stats[model]
+        unhealthy = s is not None and s.success_rate() < settings.AI_ROUTER_MIN_SUCCESS_RATE
+        slow = s is not None and s.latency is not None and best_latency is not None \
+            and s.latency > settings.AI_ROUTER_SLOW_FACTOR * best_latency
+        return (cooling_down(model), unhealthy, slow, position)
+
+    return [model for _, model in sorted(enumerate(models), key=rank)]
+
+
+def policy_for(route):
+    """The invoke.py policy ``route`` runs under."""
+    return settings.AI_ROUTE_POLICIES.get(route, route)
+
+
+def primary_model(route):
+    return models_for(route)[0]
+
+
+def chat_route(message):
+    """``coach_small_talk`` for greetings and pleasantries, ``coach`` otherwise."""
+    if len(message.split()) <= settings.AI_SMALL_TALK_MAX_WORDS and SMALL_TALK_PATTERN.match(message):
+        return 'coach_small_talk'
+    return 'coach'
+
+
+def needs_review(analysis_result):
+    """True when a scan analysis should be redone by the ``scan_review`` tier."""
+    items = analysis_result.get("items") or []
+    confidences = [item.get("confidence") for item in items if isinstance(item, dict)]
+    confidences = [c for c in confidences if isinstance(c, (int, float))]
+    return bool(confidences) and min(confidences) < settings.AI_REANALYZE_CONFIDENCE
+
+
+def is_failover_error(exc):
+    """Errors another model may not share: quota, timeouts and 5xx."""
+    return ratelimit.is_quota_error(str(exc)) or invoke.is_retryable(exc)
+
+
+class _Attempts:
+    """Hands each attempt of one call the next untried model."""
+
+    def __init__(self, route, send):
+        self.route = route
+        self.send = send
+        self.tried = []
+        self.lock = threading.Lock()
+
+    def next_model(self):
+        with self.lock:
+            candidates = models_for(self.route)
+            untried = [m for m in candidates if m not in self.tried]
+            model = (untried or candidates)[0]
+            self.tried.append(model)
+            return model, bool(untried[1:])
+
+    def failed(self, model, exc, has_sibling):
+        _model_stats(model).record(False)
+        quota = ratelimit.is_quota_error(str(exc))
+        if quota:
+            start_cooldown(model, ratelimit.retry_hint(str(exc)) or settings.AI_BREAKER_COOLDOWN)
+        logger.info("%s call to %s failed: %s", self.route, model, exc)
+        if has_sibling and is_failover_error(exc):
+            # Quota errors would trip the breaker inside model_call(); a
+            # sibling may still have quota, so wrap them until none is left
+            return ModelFailover(model, exc) if quota else exc
+        return exc
+
+    def __call__(self, timeout):
+        model, has_sibling = self.next_model()
+        started = time.monotonic()
+        try:
+            result = self.send(model, timeout)
+        except Exception as e:
+            replacement = self.failed(model, e, has_sibling)
+            if replacement is e:
+                raise
+            raise replacement from e
+        _model_stats(model).record(True, time.monotonic() - started)
+        return result
+
+
+class _AsyncAttempts(_Attempts):
+    # Cooldowns live in the rate-limit cache, which may be a database or a
+    # remote server: read and write them off the event loop
+    async def __call__(self, timeout):
+        model, has_sibling = await sync_to_async(self.next_model, thread_sensitive=False)()
+        started = time.monotonic()
+        try:
+            result = await self.send(model, timeout)
+        except Exception as e:
+            replacement = await sync_to_async(self.failed, thread_sensitive=False)(model, e, has_sibling)
+            if replacement is e:
+                raise
+            raise replacement from e
+        _model_stats(model).record(True, time.monotonic() - started)
+        return result
+
+
+def _exhausted(exc):
+    """Out of retries mid-failover: report the quota error as model_call() would."""
+    replacement = ratelimit._failed(exc.error)
+    return replacement if replacement is not None else exc.error
+
+
+def call(route, send):
+    """Run ``send(model, timeout)`` for ``route`` with failover across its tier."""
+    try:
+        return invoke.call(route, _Attempts(route, send), policy_for(route))
+    except ModelFailover as e:
+        raise _exhausted(e) from e.error
+
+
+async def acall(route, send):
+    """Async counterpart of call(); ``send`` returns an awaitable."""
+    try:
+        return await invoke.acall(route, _AsyncAttempts(route, send), policy_for(route))
+    except ModelFailover as e:
+        raise await sync_to_async(_exhausted, thread_sensitive=False)(e) from e.error
+
+
+def snapshot():
+    """Routes, model order and per-model stats, for monitoring."""
+    models = {}
+    for tier in settings.AI_MODEL_TIERS.values():
+        for model in tier:
+            with _stats_lock:
+                s = _stats.get(model)
+            models[model] = {
+                'cooling_down': cooling_down(model),
+                'latency_ms': None if s is None or s.latency is None else round(s.latency * 1000),
+                'success_rate': None if s is None or not s.outcomes else round(s.success_rate(), 3),
+                'calls': 0 if s is None else len(s.outcomes),
+            }
+    return {
+        'routes': {route: {'tier': tier, 'order': models_for(route)}
+                   for route, tier in settings.AI_MODEL_ROUTES.items()},
+        'models': models,
+    }
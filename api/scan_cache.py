@@ -0,0 +1,115 @@
+"""
+Content-addressed cache for food image analyses.
+
+Entries are keyed on the SHA-256 of the uploaded bytes plus
+``utils.ANALYSIS_CACHE_VERSION``, so a prompt, model or output format
+change never serves a stale analysis. Storage, TTL and LRU eviction come
+from the ``scan_results`` cache alias (see ``CACHES`` in settings).
+
+Near-duplicate lookup (a re-shot of the same plate) is optional: when
+``SCAN_CACHE_NEAR_DUPLICATE_DISTANCE`` is greater than zero, a 64-bit
+difference hash of each cached image is kept in a bounded in-process index
+and a miss on the exact key falls back to the closest hash within that
+Hamming distance.
+"""
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import utils
+
+CACHE_ALIAS = 'scan_results'
+
+_phash_index = OrderedDict()  # perceptual hash -> content digest
+_phash_lock = threading.Lock()
+
+
+def content_digest(image_bytes: bytes) -> str:
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def perceptual_hash(image_bytes: bytes) -> Optional[int]:
+    """64-bit dHash of the image, or None if Pillow cannot decode it."""
+    from PIL import Image
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            # JPEG draft mode decodes at a fraction of the size, which is all
+            # a 9x8 thumbnail needs.
+            img.draft('L', (64, 64))
+            pixels = list(img.convert('L').resize((9, 8), Image.Resampling.LANCZOS).getdata())
+    except Exception:
+        return None
+
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            value = (value << 1) | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return value
+
+
+def _cache_key(digest: str) -> str:
+    return f"scan:{utils.ANALYSIS_CACHE_VERSION}:{digest}"
+
+
+def _near_duplicate_distance() -> int:
+    return getattr(settings, 'SCAN_CACHE_NEAR_DUPLICATE_DISTANCE', 0)
+
+
+def _nearest_digest(phash: int, max_distance: int) -> Optional[str]:
+    best_hash, best_distance = None, max_distance + 1
+    with _phash_lock:
+        for candidate in _phash_index:
+            distance = (candidate ^ phash).bit_count()
+            if distance < best_distance:
+                best_hash, best_distance = candidate, distance
+        if best_hash is None:
+            return None
+        _phash_index.move_to_end(best_hash)
+        return _phash_index[best_hash]
+
+
+def _remember_phash(phash: int, digest: str) -> None:
+    limit = getattr(settings, 'SCAN_CACHE_MAX_ENTRIES', 1000)
+    with _phash_lock:
+        _phash_index[phash] = digest
+        _phash_index.move_to_end(phash)
+        while len(_phash_index) > limit:
+            _phash_index.popitem(last=False)
+
+
+def lookup(image_bytes: bytes, digest: Optional[str] = None) -> Optional[dict]:
+    """Return the cached analysis for these image bytes, if any."""
+    cache = caches[CACHE_ALIAS]
+    digest = digest or content_digest(image_bytes)
+    result = cache.get(_cache_key(digest))
+    if result is not None:
+        return result
+
+    max_distance = _near_duplicate_distance()
+    if max_distance <= 0:
+        return None
+    phash = perceptual_hash(image_bytes)
+    if phash is None:
+        return None
+    similar = _nearest_digest(phash, max_distance)
+    if similar is None:
+        return None
+    return cache.get(_cache_key(similar))
+
+
+def store(image_bytes: bytes, result: dict, digest: Optional[str] = None) -> None:
+    """Cache a successful analysis. Error results are never cached."""
+    if not result or "error" in result:
+        return
+    digest = digest or content_digest(image_bytes)
+    caches[CACHE_ALIAS].set(_cache_key(digest), result)
+
+    if _near_duplicate_distance() > 0:
+        phash = perceptual_hash(image_bytes)
+        if phash is not None:
+            _remember_phash(phash, digest)
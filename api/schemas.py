@@ -0,0 +1,214 @@
+"""
+Typed scan analysis results and their parser.
+
+``FoodAnalysis`` mirrors the JSON that ``utils.FOOD_ANALYSIS_PROMPT`` asks
+for. It doubles as the response schema sent to Gemini
+(``analysis_response_schema()``), so with structured output on the model
+returns bare JSON that ``parse_analysis`` validates in one pass with
+pydantic-core.
+
+The models are lenient where model output tends to drift: numbers may
+arrive as ``"12 g"`` or ``"1,200"``, health scores as ``"b+"``, and missing
+totals are summed from the items. Replies that still do not validate
+(markdown fences, prose around the JSON, trailing commas, Python literals,
+a truncated tail) get one cheap textual repair pass before giving up.
+"""
+import json
+import re
+from functools import lru_cache
+from typing import Annotated, Any, List, Optional
+
+from pydantic import BaseModel, BeforeValidator, ConfigDict, ValidationError, model_validator
+
+NUMBER_PATTERN = re.compile(r"-?\d+(?:\.\d+)?")
+TRAILING_COMMA = re.compile(r",\s*([}\]])")
+PYTHON_LITERALS = re.compile(r"\b(True|False|None)\b")
+HEALTH_SCORES = ('A', 'B', 'C', 'D')
+
+
+def _number(value: Any) -> Any:
+    """``12``, ``"12"``, ``"12 g"``, ``"~1,200 kcal"`` -> float; None -> 0."""
+    if value is None:
+        return 0.0
+    if isinstance(value, str):
+        match = NUMBER_PATTERN.search(value.replace(',', ''))
+        return float(match.group()) if match else 0.0
+    return value
+
+
+def _optional_number(value: Any) -> Any:
+    return None if value is None else _number(value)
+
+
+def _health_score(value: Any) -> str:
+    letter = str(value or '').strip().upper()[:1]
+    return letter if letter in HEALTH_SCORES else 'B'
+
+
+def _string_list(value: Any) -> Any:
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [part.strip() for part in value.split(',') if part.strip()]
+    return value
+
+
+Number = Annotated[float, BeforeValidator(_number)]
+OptionalNumber = Annotated[Optional[float], BeforeValidator(_optional_number)]
+
+
+class FoodItem(BaseModel):
+    model_config = ConfigDict(extra='allow')
+
+    name: str = 'Unknown'
+    confidence: OptionalNumber = None
+    calories: Number = 0.0
+    protein: Number = 0.0
+    carbs: Number = 0.0
+    fats: Number = 0.0
+    fiber: Number = 0.0
+    sugar: Number = 0.0
+    sodium: Number = 0.0
+    portion: Optional[str] = None
+    weight_grams: OptionalNumber = None
+
+
+class FoodAnalysis(BaseModel):
+    items: List[FoodItem] = []
+    total_calories: OptionalNumber = None
+    total_protein: OptionalNumber = None
+    total_carbs: OptionalNumber = None
+    total_fats: OptionalNumber = None
+    health_score: Annotated[str, BeforeValidator(_health_score)] = 'B'
+    dietary_tags: Annotated[List[str], BeforeValidator(_string_list)] = []
+    ai_insights: str = 'Balanced meal.'
+
+    @model_validator(mode='after')
+    def _fill_totals(self):
+        for total, field in (('total_calories', 'calories'), ('total_protein', 'protein'),
+                             ('total_carbs', 'carbs'), ('total_fats', 'fats')):
+            if getattr(self, total) is None:
+                setattr(self, total, sum(getattr(item, field) for item in self.items))
+        return self
+
+
+class AnalysisParseError(ValueError):
+    pass
+
+
+def _scan(text: str):
+    """Walk a JSON object from its opening brace.
+
+    Returns ``(end, open_brackets, in_string)``: ``end`` is the index just
+    past the matching closing brace, or None when the text is cut off.
+    """
+    stack, in_string, escaped = [], False, False
+    for index, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in '{[':
+            stack.append('}' if char == '{' else ']')
+        elif char in '}]' and stack:
+            stack.pop()
+            if not stack:
+                return index + 1, [], False
+    return None, stack, in_string
+
+
+def extract_json(text: str) -> str:
+    """The reply from its first ``{``, without markdown fences or leading prose."""
+    if "```" in text:
+        fenced = text.split("```")[1]
+        text = fenced[4:] if fenced.startswith("json") else fenced
+    start = text.find("{")
+    if start == -1:
+        raise AnalysisParseError("No JSON object in the model response")
+    return text[start:]
+
+
+def repair_json(text: str) -> str:
+    """Best-effort fix-up of a reply that is almost, but not quite, JSON."""
+    text = extract_json(text).replace('\u201c', '"').replace('\u201d', '"').replace('\u2019', "'")
+    text = PYTHON_LITERALS.sub(lambda m: {'True': 'true', 'False': 'false', 'None': 'null'}[m.group()], text)
+    if '"' not in text and "'" in text:
+        text = text.replace("'", '"')
+
+    end, open_brackets, in_string = _scan(text)
+    if end is not None:
+        # Drop any prose after the object
+        return TRAILING_COMMA.sub(r"\1", text[:end])
+    # Cut off mid-reply: close the open string, then every open bracket
+    if in_string:
+        text += '"'
+    text = text.rstrip().rstrip(',').rstrip(':').rstrip()
+    if text.endswith('"'):
+        before = text[:text.rfind('"', 0, len(text) - 1)].rstrip()
+        if before.endswith((',', '{', '[')):
+            # A dangling key (or a cut-off list entry): drop it
+            text = before.rstrip(',')
+    return TRAILING_COMMA.sub(r"\1", text) + ''.join(reversed(open_brackets))
+
+
+def parse_analysis(text: Optional[str]) -> FoodAnalysis:
+    """Validate a model reply, unwrapping or repairing it if needed.
+
+    Raises AnalysisParseError when the reply cannot be salvaged.
+    """
+    if not text:
+        raise AnalysisParseError("Empty model response")
+    try:
+        return FoodAnalysis.model_validate_json(text)
+    except ValidationError:
+        pass
+    # Usually it is only wrapped in fences or prose
+    candidate = extract_json(text)
+    try:
+        return FoodAnalysis.model_validate_json(candidate[:candidate.rfind("}") + 1])
+    except ValidationError:
+        pass
+    try:
+        return FoodAnalysis.model_validate_json(repair_json(text))
+    except ValidationError as e:
+        raise AnalysisParseError(f"Model response is not a valid analysis: {e.errors()[0]['msg']}") from e
+
+
+def _gemini_schema(schema: dict, defs: dict) -> dict:
+    """Rewrite a pydantic JSON schema into the OpenAPI subset Gemini accepts."""
+    if '$ref' in schema:
+        return _gemini_schema(defs[schema['$ref'].rsplit('/', 1)[-1]], defs)
+    if 'anyOf' in schema:
+        # Optional[X] -> nullable X
+        options = [option for option in schema['anyOf'] if option.get('type') != 'null']
+        return {**_gemini_schema(options[0], defs), 'nullable': True}
+    result = {'type': schema.get('type', 'string').upper()}
+    if result['type'] == 'INTEGER':
+        result['type'] = 'NUMBER'
+    if 'enum' in schema:
+        result['enum'] = schema['enum']
+    if 'items' in schema:
+        result['items'] = _gemini_schema(schema['items'], defs)
+    if 'properties' in schema:
+        result['properties'] = {name: _gemini_schema(prop, defs) for name, prop in schema['properties'].items()}
+    return result
+
+
+@lru_cache(maxsize=None)
+def _analysis_response_schema_json() -> str:
+    schema = FoodAnalysis.model_json_schema()
+    result = _gemini_schema(schema, schema.get('$defs', {}))
+    result['properties']['health_score']['enum'] = list(HEALTH_SCORES)
+    result['properties']['items']['items']['required'] = ['name', 'calories']
+    result['required'] = ['items', 'total_calories', 'health_score']
+    return json.dumps(result)
+
+
+def analysis_response_schema() -> dict:
+    """``responseSchema`` for a structured-output scan analysis request."""
+    return json.loads(_analysis_response_schema_json())
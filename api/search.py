@@ -0,0 +1,134 @@
+"""
+Full-text search over scans and coach conversations.
+
+A scan is indexed by the names of its food items and its meal type; a
+chat message by the user's message and the coach's response. The index
+is kept up to date by the database on every write (migration 0012):
+
+- Postgres: a generated ``search_document`` tsvector column on each table
+  with a GIN index, queried with ``to_tsquery``.
+- SQLite: an FTS5 table per model (``api_foodscan_fts``,
+  ``api_chatmessage_fts``) filled by insert/update/delete triggers,
+  queried with ``MATCH``.
+- Anything else, or SQLite built without FTS5: ``icontains`` over the same
+  fields, which is correct but scans the table.
+
+Both indexes stem English words, and every term of a query matches as a
+prefix, so "chick curr" finds "Chicken Curry". All terms must match.
+``matches()`` filters a queryset (the admin); ``ranked()`` returns one
+user's best matches (the /api/search endpoint). Item names and chat
+messages weigh more than meal types and coach responses.
+"""
+import re
+import sqlite3
+from functools import lru_cache
+
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import ChatMessage, FoodScan
+
+# Longer queries are cut rather than rejected
+MAX_TERMS = 8
+
+_TERM = re.compile(r'\w+')
+
+# Fields searched by the icontains fallback
+FALLBACK_FIELDS = {
+    FoodScan: ('food_items', 'meal_type'),
+    ChatMessage: ('message', 'response'),
+}
+
+
+def terms(text: str):
+    return _TERM.findall(text.lower())[:MAX_TERMS]
+
+
+@lru_cache(maxsize=None)
+def _sqlite_has_fts5() -> bool:
+    with sqlite3.connect(':memory:') as db:
+        return ('ENABLE_FTS5',) in db.execute('PRAGMA compile_options').fetchall()
+
+
+def backend(using='default'):
+    """'postgresql', 'fts5', or None when only the icontains fallback works."""
+    vendor = connections[using].vendor
+    if vendor == 'postgresql':
+        return 'postgresql'
+    if vendor == 'sqlite' and _sqlite_has_fts5():
+        return 'fts5'
+    return None
+
+
+def tsquery(words) -> str:
+    # \w+ terms need no quoting in tsquery syntax
+    return ' & '.join(f'{word}:*' for word in words)
+
+
+def fts5_query(words) -> str:
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def matches(model, text: str, using='default'):
+    """A Q selecting the ``model`` rows that match ``text``, or None if it has no terms."""
+    words = terms(text)
+    if not words:
+        return None
+    table = model._meta.db_table
+    engine = backend(using)
+    if engine == 'postgresql':
+        return Q(id__in=RawSQL(
+            f"SELECT id FROM {table} WHERE search_document @@ to_tsquery('english', %s)", [tsquery(words)]))
+    if engine == 'fts5':
+        return Q(id__in=RawSQL(f"SELECT rowid FROM {table}_fts WHERE {table}_fts MATCH %s", [fts5_query(words)]))
+    q = Q()
+    for word in words:
+        any_field = Q()
+        for field in FALLBACK_FIELDS[model]:
+            any_field |= Q(**{f'{field}__icontains': word})
+        q &= any_field
+    return q
+
+
+# bm25() column weights of the FTS5 tables, in the spirit of the Postgres
+# setweight() A/B labels; user_id is not indexed and gets no weight
+FTS5_WEIGHTS = {
+    FoodScan: (2.0, 1.0, 0.0),  # names, meal_type, user_id
+    ChatMessage: (2.0, 1.0, 0.0),  # message, response, user_id
+}
+
+
+def ranked(model, text: str, user_id, limit: int, using='default'):
+    """Up to ``limit`` ``(rank, id)`` pairs of the user's matching rows, best first.
+
+    Ranks are comparable within one database engine (higher is better),
+    so results from both models can be merged. Without a full-text index
+    every match ranks 0 and newer rows come first.
+    """
+    words = terms(text)
+    if not words:
+        return []
+    table = model._meta.db_table
+    engine = backend(using)
+    if engine == 'postgresql':
+        sql = (f"SELECT ts_rank(search_document, query) AS score, id "
+               f"FROM {table}, to_tsquery('english', %s) query "
+               f"WHERE user_id = %s AND search_document @@ query ORDER BY score DESC, id DESC LIMIT %s")
+        params = [tsquery(words), user_id, limit]
+    elif engine == 'fts5':
+        weights = ', '.join(map(str, FTS5_WEIGHTS[model]))
+        # bm25() is lower for better matches
+        # The user is restricted through the model table's own user_id,
+        # joined on the rowid, not the FTS table's unindexed copy
+        sql = (f"SELECT -bm25({table}_fts, {weights}) AS score, {table}.id FROM {table}_fts "
+               f"JOIN {table} ON {table}.id = {table}_fts.rowid "
+               f"WHERE {table}_fts MATCH %s AND {table}.user_id = %s ORDER BY score DESC, {table}.id DESC LIMIT %s")
+        params = [fts5_query(words), user_id, limit]
+    else:
+        ids = (model._default_manager.using(using).filter(user_id=user_id).filter(matches(model, text, using))
+               .order_by('-id').values_list('id', flat=True)[:limit])
+        return [(0.0, pk) for pk in ids]
+    with connections[using].cursor() as cursor:
+        cursor.execute(sql, params)
+        return [(float(rank), pk) for rank, pk in cursor.fetchall()]
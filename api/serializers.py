@@ -1,6 +1,7 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from .models import UserProfile, FoodScan, Feedback, ChatMessage
+from .storage import resolve_url
 
 class UserSerializer(serializers.ModelSerializer):
     name = serializers.CharField(source='first_name')
@@ -27,6 +28,7 @@ class UserSerializer(serializers.ModelSerializer):
         return None
 
 class FoodScanSerializer(serializers.ModelSerializer):
+    """Pass ``fields=[...]`` to serialize only a subset of the fields."""
     total_calories = serializers.FloatField(source='calories', default=0.0)
     total_protein = serializers.FloatField(source='protein', default=0.0)
     total_carbs = serializers.FloatField(source='carbs', default=0.0)
@@ -45,12 +47,27 @@ class FoodScanSerializer(serializers.ModelSerializer):
     class Meta:
         model = FoodScan
         fields = [
-            'id', 'image_url', 'detected_foods', 
+            'id', 'image_url', 'thumbnail_url', 'detected_foods', 
             'total_calories', 'total_protein', 'total_carbs', 'total_fats',
             'total_fiber', 'total_sugar', 'total_sodium',
             'confidence_score', 'health_score', 'dietary_tags', 
-            'ai_insights', 'analysis_time', 'created_at', 'meal_type'
+            'ai_insights', 'analysis_time', 'created_at', 'meal_type',
+            'status', 'error'
         ]
+        read_only_fields = ['thumbnail_url', 'status', 'error']
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        for name in ('image_url', 'thumbnail_url'):
+            if data.get(name):
+                data[name] = resolve_url(data[name])
+        return data
 
 class FeedbackSerializer(serializers.ModelSerializer):
     class Meta:
@@ -0,0 +1,67 @@
+from django.contrib.auth.models import User
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import FoodScan, Food, FoodAlias, Feedback, UserProfile
+from . import authentication, nutrition, rollups
+
+
+@receiver(pre_save, sender=FoodScan)
+def remember_rollup_contribution(sender, instance, raw=False, **kwargs):
+    # The row as it is in the database, before this save changes it
+    instance._rollup_previous = None
+    if instance.pk and not raw:
+        previous = FoodScan.objects.filter(pk=instance.pk).only(
+            'user', 'timestamp', 'meal_type', 'status', *rollups.TOTAL_FIELDS
+        ).first()
+        if previous is not None:
+            instance._rollup_previous = rollups.contribution(previous)
+
+
+@receiver(post_save, sender=FoodScan)
+def update_rollups_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    rollups.replace(getattr(instance, '_rollup_previous', None), rollups.contribution(instance))
+
+
+@receiver(post_delete, sender=FoodScan)
+def update_rollups_on_delete(sender, instance, **kwargs):
+    rollups.apply(rollups.contribution(instance), -1)
+
+
+@receiver(post_save, sender=Food)
+@receiver(post_delete, sender=Food)
+@receiver(post_save, sender=FoodAlias)
+@receiver(post_delete, sender=FoodAlias)
+def invalidate_food_index(sender, **kwargs):
+    nutrition.invalidate()
+
+
+@receiver(pre_save, sender=Feedback)
+def remember_food_correction(sender, instance, raw=False, **kwargs):
+    instance._previous_correction = None
+    if instance.pk and not raw:
+        instance._previous_correction = Feedback.objects.filter(pk=instance.pk).values_list(
+            'correct_food_name', flat=True
+        ).first()
+
+
+@receiver(post_save, sender=Feedback)
+def learn_food_alias(sender, instance, raw=False, **kwargs):
+    if raw or not instance.correct_food_name:
+        return
+    if instance.correct_food_name != getattr(instance, '_previous_correction', None):
+        nutrition.learn_from_feedback(instance)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    authentication.invalidate_user(instance.pk)
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def invalidate_cached_profile(sender, instance, **kwargs):
+    authentication.invalidate_user(instance.user_id)
@@ -0,0 +1,216 @@
+"""
+Storage backends for scan images.
+
+Scans are stored through the ``scans`` alias in ``STORAGES`` so every app
+instance reads and writes the same place. Keys are content addressed and
+sharded by the SHA-256 of the upload (``ab/cd/abcd….jpg``), so identical
+uploads share one object and no directory grows unbounded.
+
+* ``ScanFileSystemStorage`` keeps files under ``MEDIA_ROOT/scans``.
+* ``S3ScanStorage`` talks to any S3-compatible service (AWS, MinIO, moto's
+  server mode for local testing) and uses multipart uploads for large
+  objects. It needs boto3.
+"""
+import mimetypes
+import os
+import tempfile
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, Storage, storages
+from django.utils.deconstruct import deconstructible
+from django.utils.encoding import filepath_to_uri
+
+STORAGE_ALIAS = 'scans'
+
+
+def get_scan_storage():
+    return storages[STORAGE_ALIAS]
+
+
+def scan_key(digest: str, extension: str, suffix: str = "") -> str:
+    """Content-addressed, sharded key for a scan file."""
+    return f"{digest[:2]}/{digest[2:4]}/{digest}{suffix}{extension}"
+
+
+def stored_url(key: str) -> str:
+    """URL to save on a FoodScan row for ``key``.
+
+    Presigned URLs expire, so storages that sign them save an ``s3://``
+    reference instead and ``resolve_url`` signs it when the row is read.
+    """
+    storage = get_scan_storage()
+    if getattr(storage, 'signs_urls', False):
+        return storage.reference(key)
+    return storage.url(key)
+
+
+def resolve_url(value: str) -> str:
+    """Turn a saved image URL into one a client can fetch."""
+    if value.startswith(S3ScanStorage.REFERENCE_PREFIX):
+        return get_scan_storage().url_for_reference(value)
+    return value
+
+
+def put(key: str, data: bytes) -> str:
+    """Store ``data`` under ``key`` unless an object is already there."""
+    storage = get_scan_storage()
+    if not storage.exists(key):
+        storage.save(key, ContentFile(data))
+    return key
+
+
+@deconstructible(path='api.storage.ScanFileSystemStorage')
+class ScanFileSystemStorage(FileSystemStorage):
+    """Local storage whose writes are atomic and never renamed.
+
+    Two requests storing the same content race harmlessly: each writes a
+    temporary file and renames it over the key.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def _save(self, name, content):
+        full_path = self.path(name)
+        directory = os.path.dirname(full_path)
+        os.makedirs(directory, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=directory, suffix=".part", delete=False) as buffer:
+            try:
+                for chunk in content.chunks():
+                    buffer.write(chunk)
+            except BaseException:
+                os.unlink(buffer.name)
+                raise
+        if self.file_permissions_mode is not None:
+            os.chmod(buffer.name, self.file_permissions_mode)
+        os.replace(buffer.name, full_path)
+        return name
+
+
+@deconstructible(path='api.storage.S3ScanStorage')
+class S3ScanStorage(Storage):
+    """Scan storage on an S3-compatible bucket.
+
+    Objects at or above ``multipart_threshold`` bytes are uploaded in
+    ``multipart_chunksize`` parts, ``max_concurrency`` at a time. URLs use
+    ``public_url`` (a CDN or public bucket endpoint) when set and are
+    presigned for ``querystring_expire`` seconds otherwise.
+    """
+    REFERENCE_PREFIX = 's3://'
+
+    def __init__(self, bucket_name=None, location='scans', endpoint_url=None, region_name=None,
+                 access_key=None, secret_key=None, public_url=None, querystring_expire=3600,
+                 multipart_threshold=8 * 1024 * 1024, multipart_chunksize=8 * 1024 * 1024,
+                 max_concurrency=4):
+        if not bucket_name:
+            raise ImproperlyConfigured("S3ScanStorage needs a bucket_name.")
+        self.bucket_name = bucket_name
+        self.location = location.strip('/')
+        self.endpoint_url = endpoint_url or None
+        self.region_name = region_name or None
+        self.access_key = access_key or None
+        self.secret_key = secret_key or None
+        self.public_url = public_url.rstrip('/') + '/' if public_url else None
+        self.querystring_expire = querystring_expire
+        self.multipart_threshold = multipart_threshold
+        self.multipart_chunksize = multipart_chunksize
+        self.max_concurrency = max_concurrency
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            try:
+                import boto3
+            except ImportError:
+                raise ImproperlyConfigured("S3ScanStorage requires boto3 (pip install boto3).")
+            self._client = boto3.client(
+                's3',
+                endpoint_url=self.endpoint_url,
+                region_name=self.region_name,
+                aws_access_key_id=self.access_key,
+                aws_secret_access_key=self.secret_key,
+            )
+        return self._client
+
+    def _transfer_config(self):
+        from boto3.s3.transfer import TransferConfig
+        return TransferConfig(
+            multipart_threshold=self.multipart_threshold,
+            multipart_chunksize=self.multipart_chunksize,
+            max_concurrency=self.max_concurrency,
+        )
+
+    def _object_key(self, name):
+        name = name.replace('\\', '/').lstrip('/')
+        return f"{self.location}/{name}" if self.location else name
+
+    def _is_missing(self, error):
+        return error.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound')
+
+    def _save(self, name, content):
+        content.seek(0)
+        content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        self.client.upload_fileobj(
+            content, self.bucket_name, self._object_key(name),
+            ExtraArgs={'ContentType': content_type},
+            Config=self._transfer_config(),
+        )
+        return name
+
+    def _open(self, name, mode='rb'):
+        if 'w' in mode:
+            raise ValueError("S3ScanStorage files are written with save().")
+        from botocore.exceptions import ClientError
+        try:
+            response = self.client.get_object(Bucket=self.bucket_name, Key=self._object_key(name))
+        except ClientError as e:
+            if self._is_missing(e):
+                raise FileNotFoundError(name)
+            raise
+        return ContentFile(response['Body'].read(), name=name)
+
+    def get_available_name(self, name, max_length=None):
+        return name
+
+    def exists(self, name):
+        from botocore.exceptions import ClientError
+        try:
+            self.client.head_object(Bucket=self.bucket_name, Key=self._object_key(name))
+        except ClientError as e:
+            if self._is_missing(e):
+                return False
+            raise
+        return True
+
+    def delete(self, name):
+        self.client.delete_object(Bucket=self.bucket_name, Key=self._object_key(name))
+
+    def size(self, name):
+        response = self.client.head_object(Bucket=self.bucket_name, Key=self._object_key(name))
+        return response['ContentLength']
+
+    @property
+    def signs_urls(self):
+        return self.public_url is None
+
+    def reference(self, name):
+        return f"{self.REFERENCE_PREFIX}{self.bucket_name}/{self._object_key(name)}"
+
+    def url_for_reference(self, reference):
+        bucket, _, object_key = reference[len(self.REFERENCE_PREFIX):].partition('/')
+        return self._presign(bucket, object_key)
+
+    def _presign(self, bucket, object_key):
+        return self.client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': bucket, 'Key': object_key},
+            ExpiresIn=self.querystring_expire,
+        )
+
+    def url(self, name):
+        if self.public_url:
+            return self.public_url + filepath_to_uri(self._object_key(name))
+        return self._presign(self.bucket_name, self._object_key(name))
+
@@ -0,0 +1,31 @@
+import io
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.test import override_settings
+from PIL import Image
+
+
+def use_temporary_scan_storage(test) -> str:
+    """Store scans under a temporary directory for the rest of ``test``; returns the directory."""
+    media = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, media, ignore_errors=True)
+    storages = override_settings(STORAGES={
+        **settings.STORAGES,
+        'scans': {
+            'BACKEND': 'api.storage.ScanFileSystemStorage',
+            'OPTIONS': {'location': media, 'base_url': '/media/scans/'},
+        },
+    })
+    storages.enable()
+    test.addCleanup(storages.disable)
+    return media
+
+
+def noise_jpeg(size: int) -> bytes:
+    """A JPEG without EXIF that re-encoding cannot shrink much."""
+    buffer = io.BytesIO()
+    Image.frombytes('RGB', (size, size), os.urandom(size * size * 3)).save(buffer, 'JPEG', quality=95)
+    return buffer.getvalue()
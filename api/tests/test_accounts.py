@@ -0,0 +1,29 @@
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from api.views import allocate_username
+
+
+class AllocateUsernameTests(TestCase):
+    def create(self, *usernames):
+        for username in usernames:
+            User.objects.create_user(username)
+
+    def test_free_base_is_used_as_is(self):
+        self.create('johnny', 'john1')
+        with self.assertNumQueries(1):
+            self.assertEqual(allocate_username('john'), 'john')
+
+    def test_taken_base_gets_one_more_than_the_highest_suffix(self):
+        self.create('john', 'john1', 'john7', 'johnny', 'johnny99', 'john.smith')
+        with self.assertNumQueries(2):
+            self.assertEqual(allocate_username('john'), 'john8')
+
+    def test_base_is_matched_literally(self):
+        self.create('j.doe', 'jxdoe5', 'j.doe2')
+        self.assertEqual(allocate_username('j.doe'), 'j.doe3')
+
+    def test_long_bases_are_cut_to_fit(self):
+        base = 'a' * 200
+        self.create(base[:140])
+        self.assertEqual(allocate_username(base), base[:140] + '1')
@@ -0,0 +1,37 @@
+import json
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.test import RequestFactory, TransactionTestCase
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api import async_views, views
+
+
+class RequestDataTests(TransactionTestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.addCleanup(caches['default'].clear)
+        user = User.objects.create_user('kiran')
+        self.auth = f'Bearer {RefreshToken.for_user(user).access_token}'
+
+    def post(self, view, body, content_type='application/json'):
+        request = RequestFactory().post('/api/chat', body, content_type=content_type, HTTP_AUTHORIZATION=self.auth)
+        response = view(request)
+        if hasattr(response, 'render'):
+            response.render()
+        return response
+
+    def test_malformed_json_fails_like_the_sync_view(self):
+        body = '{"message": "hi",}'
+        sync = self.post(views.ChatView.as_view(), body)
+        asynchronous = self.post(async_to_sync(async_views.AsyncChatView.as_view()), body)
+        self.assertEqual(sync.status_code, 400)
+        self.assertEqual(asynchronous.status_code, 400)
+        self.assertEqual(json.loads(asynchronous.content), json.loads(sync.content))
+        self.assertIn('JSON parse error - ', json.loads(sync.content)['detail'])
+
+    def test_empty_body_is_no_message(self):
+        response = self.post(async_to_sync(async_views.AsyncChatView.as_view()), '')
+        self.assertEqual((response.status_code, json.loads(response.content)), (400, {'error': 'No message provided'}))
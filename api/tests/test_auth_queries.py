@@ -0,0 +1,55 @@
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from api import authentication
+from api.models import FoodScan, UserProfile
+
+
+class CachedUserQueryTests(TestCase):
+    def setUp(self):
+        caches[authentication.CACHE_ALIAS].clear()
+        self.addCleanup(caches[authentication.CACHE_ALIAS].clear)
+        self.user = User.objects.create_user('ana', 'ana@example.com', first_name='Ana')
+        self.profile = UserProfile.objects.create(user=self.user, goal='lose weight', weight=60)
+        for calories in (300, 450):
+            FoodScan.objects.create(user=self.user, food_items=[{'name': 'Rice'}], calories=calories,
+                                    protein=5, carbs=60, fats=2)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {RefreshToken.for_user(self.user).access_token}')
+
+    def get(self, name, queries, **params):
+        with self.assertNumQueries(queries):
+            response = self.client.get(reverse(name), params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_me(self):
+        # Cold: the user and profile in one joined query; warm: none
+        self.assertEqual(self.get('me', 1)['fitness_goal'], 'lose weight')
+        self.assertEqual(self.get('me', 0)['fitness_goal'], 'lose weight')
+
+    def test_history(self):
+        self.assertEqual(len(self.get('food_history', 2)), 2)
+        self.assertEqual(len(self.get('food_history', 1)), 2)
+
+    def test_paginated_history(self):
+        self.get('food_history', 2, limit=1)
+        page = self.get('food_history', 1, limit=1)
+        self.assertEqual(len(page['results']), 1)
+
+    def test_profile_save_invalidates_the_cached_user(self):
+        self.get('me', 1)
+        self.profile.goal = 'build muscle'
+        self.profile.save()
+        self.assertEqual(self.get('me', 1)['fitness_goal'], 'build muscle')
+        self.assertEqual(self.get('me', 0)['fitness_goal'], 'build muscle')
+
+    def test_user_save_invalidates_the_cached_user(self):
+        self.get('me', 1)
+        self.user.first_name = 'Anna'
+        self.user.save()
+        self.assertEqual(self.get('me', 1)['name'], 'Anna')
@@ -0,0 +1,86 @@
+import asyncio
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from api import routing, utils
+from api.ai_client import AIClientError
+from api.models import ChatMessage
+
+PRIMARY, SIBLING = settings.AI_MODEL_TIERS['flash'][:2]
+POLICIES = {'coach': {'retries': 1, 'backoff_base': 0, 'hedge': False}}
+
+
+class StreamingClient:
+    """Streams a two-chunk reply, except from models listed as unavailable."""
+
+    def __init__(self, unavailable=()):
+        self.unavailable = unavailable
+        self.models = []
+
+    def stream_content(self, model, contents):
+        self.models.append(model)
+        if model in self.unavailable:
+            raise AIClientError(503, "Service Unavailable")
+        yield "Eat more "
+        yield "greens."
+
+    async def astream_content(self, model, contents):
+        self.models.append(model)
+        if model in self.unavailable:
+            raise AIClientError(503, "Service Unavailable")
+        yield "Eat more "
+        yield "greens."
+
+
+@override_settings(AI_BACKEND='fake', AI_CALL_POLICIES=POLICIES, AI_RATE_LIMIT_USER='')
+class CoachStreamTests(TestCase):
+    message = "Which vegetables have the most iron?"
+
+    def setUp(self):
+        caches['default'].clear()
+        self.addCleanup(caches['default'].clear)
+        self.addCleanup(routing._stats.clear)
+        self.user = User.objects.create_user('ana', 'ana@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def stream(self, client):
+        with mock.patch('api.utils.get_ai_client', return_value=client):
+            response = self.client.post(reverse('chat') + '?stream=true', {'message': self.message},
+                                        format='json')
+            body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body.decode()
+
+    def test_stream_fails_over_when_the_primary_cannot_open_it(self):
+        client = StreamingClient(unavailable=[PRIMARY])
+        response, body = self.stream(client)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(client.models, [PRIMARY, SIBLING])
+        self.assertIn('event: done\ndata: {"response": "Eat more greens."}', body)
+        self.assertEqual(ChatMessage.objects.get().response, "Eat more greens.")
+
+    @override_settings(AI_RATE_LIMIT_GLOBAL='1/hour', AI_RATE_LIMIT_GLOBAL_BURST=1, AI_RATE_LIMIT_MAX_WAIT=0)
+    def test_shed_stream_is_a_503_before_the_stream_starts(self):
+        self.assertEqual(self.stream(StreamingClient())[0].status_code, 200)
+        client = StreamingClient()
+        response, _ = self.stream(client)
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+        self.assertEqual(client.models, [])
+
+    def test_async_stream_fails_over(self):
+        client = StreamingClient(unavailable=[PRIMARY])
+
+        async def reply():
+            chunks = await utils.astream_ai_coach_response(self.message)
+            return [chunk async for chunk in chunks]
+
+        with mock.patch('api.utils.get_ai_client', return_value=client):
+            self.assertEqual(asyncio.run(reply()), ["Eat more ", "greens."])
+        self.assertEqual(client.models, [PRIMARY, SIBLING])
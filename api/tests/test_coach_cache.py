@@ -0,0 +1,42 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.test import TestCase
+
+from api import coach_cache
+from api.models import ChatMessage, UserProfile
+
+
+class SharedReplyTests(TestCase):
+    def setUp(self):
+        caches[coach_cache.CACHE_ALIAS].clear()
+        self.users = []
+        for name in ('ana', 'ben', 'cy'):
+            user = User.objects.create_user(name, f'{name}@example.com')
+            UserProfile.objects.create(user=user, goal='lose weight')
+            self.users.append(user)
+
+    def ask(self, user, message):
+        with mock.patch('api.utils.get_ai_coach_response', return_value=f"reply for {user.username}") as model:
+            reply, status = coach_cache.generate(User.objects.get(pk=user.pk), message)
+        return reply, status, model.call_args
+
+    def test_goal_only_reply_is_shared(self):
+        ana, ben, _ = self.users
+        self.ask(ana, "What is a good snack?")
+        reply, status, _ = self.ask(ben, "what is a good snack")
+        self.assertEqual((reply, status), ("reply for ana", 'hit'))
+
+    def test_reply_written_with_personal_context_is_not_shared(self):
+        ana, ben, cy = self.users
+        ChatMessage.objects.create(user=ana, message="I skipped lunch", response="Have a snack then.")
+        _, _, (args, _) = self.ask(ana, "What is a good snack?")
+        self.assertIn("I skipped lunch", args[1])
+
+        reply, status, _ = self.ask(ben, "What is a good snack?")
+        self.assertEqual((reply, status), ("reply for ben", 'miss'))
+        # Ana's own reply is still cached for her
+        self.assertEqual(self.ask(ana, "What is a good snack?")[:2], ("reply for ana", 'hit'))
+        # Ben's goal-only reply is the one shared
+        self.assertEqual(self.ask(cy, "What is a good snack?")[:2], ("reply for ben", 'hit'))
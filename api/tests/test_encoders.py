@@ -0,0 +1,99 @@
+from datetime import datetime, timezone as dt_timezone
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from api import encoders
+from api.models import ChatMessage, FoodScan
+from api.renderers import ORJSONRenderer, _float_mismatch
+from api.serializers import ChatMessageSerializer, FoodScanSerializer
+
+ITEMS = [
+    {'name': 'Café crème ☕', 'calories': 0.1 + 0.2, 'protein': None, 'weight_grams': 1e-05},
+    {'name': '鸡肉饭\u2028', 'calories': 1e16, 'sodium': -0.0, 'portion': None, 'confidence': 0.95},
+]
+
+
+def drf_bytes(data):
+    return JSONRenderer().render(data)
+
+
+@override_settings(TIME_ZONE='Asia/Kolkata')
+class EncoderBytesTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('ana', 'ana@example.com')
+        self.scans = [
+            FoodScan.objects.create(user=self.user, image_url='ab/abcd.jpg', food_items=ITEMS,
+                                    calories=680.5, protein=37, carbs=1e-7, fats=26.123456789,
+                                    meal_type='déjeuner', dietary_tags=['Végétarien', 'Spicy 🌶']),
+            FoodScan.objects.create(user=self.user, food_items=[], calories=0, protein=0, carbs=0, fats=0,
+                                    meal_type=None, status=FoodScan.STATUS_PENDING),
+            FoodScan.objects.create(user=self.user, food_items=[{'name': None, 'calories': None}],
+                                    calories=1e16, protein=2.5e-5, carbs=100, fats=0.30000000000000004,
+                                    status=FoodScan.STATUS_FAILED, error='AI Analysis failed: “quota”'),
+        ]
+        # Whole seconds and microseconds, rendered in a +05:30 time zone
+        stamps = [datetime(2026, 3, 1, 12, 0, tzinfo=dt_timezone.utc),
+                  datetime(2026, 3, 1, 12, 0, 0, 123456, tzinfo=dt_timezone.utc),
+                  datetime(2025, 12, 31, 23, 59, 59, 1, tzinfo=dt_timezone.utc)]
+        for scan, stamp in zip(self.scans, stamps):
+            FoodScan.objects.filter(pk=scan.pk).update(timestamp=stamp)
+        ChatMessage.objects.create(user=self.user, message='Is ghee OK? 🧈', response='In moderation.\u2029')
+        ChatMessage.objects.create(user=self.user, message='', response='"Quoted" \\ reply')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def scans_newest_first(self):
+        return FoodScan.objects.filter(user=self.user).order_by('-timestamp', '-id')
+
+    def test_scan_rows_match_the_serializer(self):
+        for fields in (None, ['id', 'created_at'], ['detected_foods', 'meal_type', 'total_carbs', 'status']):
+            with self.subTest(fields=fields):
+                expected = drf_bytes(FoodScanSerializer(self.scans_newest_first(), many=True, fields=fields).data)
+                rows = encoders.scan_values(self.scans_newest_first(), fields)
+                self.assertEqual(ORJSONRenderer().render(encoders.scan_dicts(rows, fields)), expected)
+
+    def test_chat_rows_match_the_serializer(self):
+        messages = ChatMessage.objects.order_by('timestamp', 'id')
+        expected = drf_bytes(ChatMessageSerializer(messages, many=True).data)
+        rendered = ORJSONRenderer().render(encoders.chat_dicts(encoders.chat_values(messages)))
+        self.assertEqual(rendered, expected)
+
+    def test_history_endpoint_matches_the_serializer(self):
+        response = self.client.get(reverse('food_history'))
+        self.assertEqual(response.content, drf_bytes(FoodScanSerializer(self.scans_newest_first(), many=True).data))
+
+    def test_detail_endpoint_matches_the_serializer(self):
+        for scan in self.scans:
+            with self.subTest(scan=scan.pk):
+                response = self.client.get(reverse('food-scan-detail', args=[scan.pk]))
+                scan.refresh_from_db()
+                self.assertEqual(response.content, drf_bytes(FoodScanSerializer(scan).data))
+
+
+class FloatMismatchTests(SimpleTestCase):
+    def test_floats_orjson_formats_differently_fall_back_to_drf(self):
+        for value in (1e-05, 2.5e-5, 1e16, -1e-07, 1.5e300, [0.00001], {'x': {'y': 1e-5}}):
+            with self.subTest(value=value):
+                data = {'value': value, 'name': 'Café'}
+                with mock.patch.object(JSONRenderer, 'render', wraps=JSONRenderer().render) as fallback:
+                    rendered = ORJSONRenderer().render(data)
+                self.assertEqual(rendered, drf_bytes(data))
+                fallback.assert_called_once()
+
+    def test_look_alikes_in_strings_do_not_fall_back(self):
+        # (A number-like run after a comma inside a string only costs a fallback)
+        for text in ('12:00:00.00001', 'e-5', 'sha 1e16ab', '0.00001'):
+            with self.subTest(text=text):
+                data = {'text': text, 'values': [1.5, 0.0001, 123456789.0]}
+                rendered = ORJSONRenderer().render(data)
+                self.assertEqual(rendered, drf_bytes(data))
+                self.assertFalse(_float_mismatch(rendered))
+
+    def test_line_separators_are_escaped_like_drf(self):
+        data = {'text': 'a\u2028b\u2029c', 'emoji': '🍛'}
+        self.assertEqual(ORJSONRenderer().render(data), drf_bytes(data))
@@ -0,0 +1,31 @@
+import os
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from api.models import FoodScan
+from api.tests.helpers import noise_jpeg, use_temporary_scan_storage
+
+
+class SpooledUploadTests(TestCase):
+    def setUp(self):
+        self.media = use_temporary_scan_storage(self)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('ana', 'ana@example.com'))
+
+    def test_large_upload_without_exif_is_memory_mapped_and_stored(self):
+        data = noise_jpeg(1536)
+        # Over FILE_UPLOAD_MAX_MEMORY_SIZE: Django spools it to a temporary file
+        self.assertGreater(len(data), 2.5 * 1024 * 1024)
+        response = self.client.post(
+            reverse('food_analyze') + '?mode=async',
+            {'image': SimpleUploadedFile('meal.jpg', data, content_type='image/jpeg')},
+        )
+        self.assertEqual(response.status_code, 202, response.content)
+        scan = FoodScan.objects.get()
+        self.assertEqual(scan.status, FoodScan.STATUS_PENDING)
+        with open(os.path.join(self.media, scan.image_path), 'rb') as stored:
+            self.assertEqual(stored.read(2), b'\xff\xd8')
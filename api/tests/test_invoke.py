@@ -0,0 +1,111 @@
+import asyncio
+import threading
+import time
+
+from django.core.cache import caches
+from django.test import SimpleTestCase, override_settings
+
+from api import invoke
+from api.ai_client import AIClientError
+
+ENDPOINT = 'test'
+
+
+class FakeClient:
+    """Answers after the given delays in turn (the last one repeats), or raises ``error``."""
+
+    def __init__(self, *delays, error=None):
+        self.delays = list(delays)
+        self.error = error
+        self.calls = 0
+        self.lock = threading.Lock()
+        self.released = threading.Event()  # ends stuck calls when the test is over
+
+    def _next(self):
+        with self.lock:
+            self.calls += 1
+            return self.calls, self.delays[min(self.calls, len(self.delays)) - 1]
+
+    def generate(self, timeout):
+        number, delay = self._next()
+        if self.error is not None:
+            raise self.error
+        if delay > timeout:
+            self.released.wait(timeout)
+            raise TimeoutError(f"call {number} timed out")
+        time.sleep(delay)
+        return f"reply {number}"
+
+    async def agenerate(self, timeout):
+        number, delay = self._next()
+        await asyncio.wait_for(asyncio.sleep(delay), timeout)
+        return f"reply {number}"
+
+
+def policies(**policy):
+    return override_settings(AI_CALL_POLICIES={ENDPOINT: {'backoff_base': 0.01, 'backoff_max': 0.01, **policy}},
+                             AI_RATE_LIMIT_GLOBAL='')
+
+
+class InvokeTests(SimpleTestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.addCleanup(caches['default'].clear)
+        self.addCleanup(invoke._latencies.clear)
+
+    def fake_client(self, *delays, error=None):
+        client = FakeClient(*delays, error=error)
+        self.addCleanup(client.released.set)
+        return client
+
+    def warm_up(self, seconds=0.01, samples=5):
+        for _ in range(samples):
+            invoke.record_latency(ENDPOINT, seconds)
+
+    @policies(timeout=5, hedge=True, hedge_min_delay=0.05, hedge_min_samples=5)
+    def test_slow_primary_is_hedged(self):
+        self.warm_up()
+        client = self.fake_client(10, 0.01)
+        started = time.monotonic()
+        self.assertEqual(invoke.call(ENDPOINT, client.generate), "reply 2")
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(client.calls, 2)
+
+    @policies(timeout=5, hedge=True, hedge_min_delay=0.05, hedge_min_samples=5)
+    def test_no_hedge_before_enough_samples(self):
+        self.warm_up(samples=4)
+        client = self.fake_client(0.2, 0.01)
+        self.assertEqual(invoke.call(ENDPOINT, client.generate), "reply 1")
+        self.assertEqual(client.calls, 1)
+
+    @policies(timeout=5, hedge=True, hedge_min_delay=0.05, hedge_min_samples=5)
+    def test_async_slow_primary_is_hedged(self):
+        self.warm_up()
+        client = FakeClient(10, 0.01)
+        self.assertEqual(asyncio.run(invoke.acall(ENDPOINT, client.agenerate)), "reply 2")
+        self.assertEqual(client.calls, 2)
+
+    @policies(timeout=0.1, deadline=0.35, retries=10)
+    def test_retries_stop_at_the_deadline(self):
+        client = self.fake_client(10)
+        started = time.monotonic()
+        with self.assertRaises(invoke.ModelCallTimeout):
+            invoke.call(ENDPOINT, client.generate)
+        self.assertLess(time.monotonic() - started, 0.6)
+        self.assertLessEqual(client.calls, 4)
+
+    @policies(timeout=5, retries=2)
+    def test_retryable_errors_are_retried(self):
+        client = self.fake_client(0, error=AIClientError(503, "Service Unavailable"))
+        with self.assertRaises(AIClientError):
+            invoke.call(ENDPOINT, client.generate)
+        self.assertEqual(client.calls, 3)
+
+    @policies(timeout=5, retries=2)
+    def test_non_retryable_errors_are_not_retried(self):
+        for error in (AIClientError(400, "Bad Request"), ValueError("unparseable reply")):
+            with self.subTest(error=error):
+                client = self.fake_client(0, error=error)
+                with self.assertRaises(type(error)):
+                    invoke.call(ENDPOINT, client.generate)
+                self.assertEqual(client.calls, 1)
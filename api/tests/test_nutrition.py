@@ -0,0 +1,103 @@
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from api import nutrition
+from api.models import Feedback, FoodAlias, FoodScan
+
+FOODS = [
+    {'id': 1, 'name': 'chicken curry', 'calories': 140, 'protein': 14, 'carbs': 5, 'fats': 7.5,
+     'fiber': 1, 'sugar': 2, 'sodium': 420},
+    {'id': 2, 'name': 'steamed rice', 'calories': 130, 'protein': 2.7, 'carbs': 28.2, 'fats': 0.3,
+     'fiber': 0.4, 'sugar': 0.1, 'sodium': 1},
+]
+
+
+def alias(name, food_id, source=FoodAlias.SOURCE_SEED, votes=1):
+    return {'alias': name, 'food_id': food_id, 'source': source, 'votes': votes}
+
+
+@override_settings(NUTRITION_MATCH_THRESHOLD=0.5, NUTRITION_ALIAS_MIN_VOTES=2)
+class FoodIndexTests(SimpleTestCase):
+    def index(self, *aliases):
+        return nutrition.FoodIndex(FOODS, aliases)
+
+    def test_exact_names_match_after_normalizing(self):
+        self.assertEqual(self.index().match('Chicken Curry (1 bowl)'), nutrition.Match(1, 'chicken curry', 1.0))
+
+    def test_misspelled_names_match_the_closest_food(self):
+        index = self.index()
+        match = index.match('chiken cury')
+        self.assertEqual(match.food_id, 1)
+        self.assertAlmostEqual(match.score, 9 / 13)
+        self.assertEqual(index.match('steamd rice').food_id, 2)
+        self.assertIsNone(index.match('pizza'))
+
+    def test_score_must_reach_the_threshold(self):
+        index = self.index()
+        # "curry" shares all 6 of its trigrams with the 14 of "chicken curry"
+        self.assertEqual(index.match('curry', threshold=0.6), nutrition.Match(1, 'chicken curry', 0.6))
+        self.assertIsNone(index.match('curry', threshold=0.61))
+        with self.settings(NUTRITION_MATCH_THRESHOLD=0.61):
+            self.assertIsNone(index.match('curry'))
+
+    def test_aliases_match_fuzzily_to_their_food(self):
+        self.assertEqual(self.index(alias('white rice', 2)).match('white rise').name, 'steamed rice')
+
+    def test_learned_aliases_need_enough_votes(self):
+        self.assertIsNone(self.index(alias('dal tadka', 1, FoodAlias.SOURCE_FEEDBACK)).match('dal tadka'))
+        learned = self.index(alias('dal tadka', 1, FoodAlias.SOURCE_FEEDBACK, votes=2))
+        self.assertEqual(learned.match('dal tadka'), nutrition.Match(1, 'chicken curry', 1.0))
+
+    def test_food_names_are_never_re_pointed(self):
+        index = self.index(alias('steamed rice', 1, FoodAlias.SOURCE_FEEDBACK, votes=5))
+        self.assertEqual(index.match('steamed rice').food_id, 2)
+
+
+@override_settings(NUTRITION_FEEDBACK_THRESHOLD=0.6, NUTRITION_ALIAS_MIN_VOTES=2)
+class LearnFromFeedbackTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.addCleanup(caches['default'].clear)
+        self.user = User.objects.create_user('meera')
+
+    def scan(self, name='house special'):
+        return FoodScan.objects.create(
+            user=self.user, image_url='', calories=300, protein=5, carbs=40, fats=10,
+            food_items=[{'name': name, 'weight_grams': 200, 'calories': 300, 'protein': 5, 'carbs': 40, 'fats': 10}],
+        )
+
+    def correct(self, scan, name):
+        Feedback.objects.create(scan=scan, is_accurate=False, correct_food_name=name)
+        scan.refresh_from_db()
+        return scan
+
+    def test_correction_fixes_the_scan(self):
+        scan = self.correct(self.scan(), 'paneer buter masala')
+        item, = scan.food_items
+        self.assertEqual(item['name'], 'paneer butter masala')
+        self.assertEqual((item['calories'], item['nutrition_source']), (460.0, 'database'))
+        self.assertEqual(scan.calories, 460.0)
+
+    def test_agreeing_corrections_teach_the_index(self):
+        self.assertIsNone(nutrition.get_index().match('house special'))
+        self.correct(self.scan(), 'paneer butter masala')
+        learned = FoodAlias.objects.get(alias='house special')
+        self.assertEqual((learned.food.name, learned.source, learned.votes),
+                         ('paneer butter masala', FoodAlias.SOURCE_FEEDBACK, 1))
+        # One correction is not enough to relabel the food for everyone
+        self.assertIsNone(nutrition.get_index().match('house special'))
+
+        self.correct(self.scan(), 'Paneer Butter Masala')
+        learned.refresh_from_db()
+        self.assertEqual(learned.votes, 2)
+        self.assertEqual(nutrition.get_index().match('house special'),
+                         nutrition.Match(learned.food_id, 'paneer butter masala', 1.0))
+
+        fields = nutrition.reconcile_fields(self.scan().food_items)
+        self.assertEqual(fields['food_items'][0]['canonical_name'], 'paneer butter masala')
+
+    def test_corrections_below_the_feedback_threshold_are_ignored(self):
+        scan = self.correct(self.scan(), 'something else entirely')
+        self.assertEqual(scan.food_items[0]['name'], 'house special')
+        self.assertFalse(FoodAlias.objects.filter(alias='house special').exists())
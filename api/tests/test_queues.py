@@ -0,0 +1,166 @@
+import threading
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from api import pipeline
+from api.models import DailyNutritionSummary, FoodScan
+from api.queues import DatabaseScanQueue, run_workers
+from api.ratelimit import AIServiceUnavailable
+from api.tests.helpers import noise_jpeg, use_temporary_scan_storage
+
+ANALYSIS = {
+    'items': [{'name': 'Rice', 'calories': 200, 'protein': 4, 'carbs': 44, 'fats': 1}],
+    'calories': 200, 'protein': 4, 'carbs': 44, 'fats': 1,
+    'health_score': 'B', 'dietary_tags': ['vegan'], 'ai_insights': 'Plain rice.',
+}
+
+
+def pending_scan(user, **fields):
+    fields = {'status': FoodScan.STATUS_PENDING, 'image_path': 'ab/abc.jpg', 'content_type': 'image/jpeg',
+              **fields}
+    return FoodScan.objects.create(user=user, food_items=[], calories=0, protein=0, carbs=0, fats=0, **fields)
+
+
+class ProcessScanTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('ana', 'ana@example.com')
+        self.scan = pending_scan(self.user, status=FoodScan.STATUS_PROCESSING, attempts=1)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def process(self, result=ANALYSIS, during=None):
+        def analyze(*args):
+            if during is not None:
+                during()
+            return result, 'miss'
+
+        with mock.patch('api.pipeline.read_stored_image', return_value=b'jpeg'), \
+                mock.patch('api.pipeline.analyze_image', side_effect=analyze), \
+                self.settings(NUTRITION_RECONCILE=False):
+            return pipeline.process_scan(self.scan.pk)
+
+    def test_analysis_fills_in_the_scan_and_its_rollup(self):
+        scan = self.process()
+        self.assertEqual((scan.status, scan.calories, scan.food_items), ('done', 200, ANALYSIS['items']))
+        self.assertEqual(DailyNutritionSummary.objects.get(user=self.user).calories, 200)
+
+    def test_edits_made_during_analysis_are_kept(self):
+        items = [{'name': 'Dal', 'calories': 150, 'protein': 9, 'carbs': 20, 'fats': 4}]
+
+        def edit():
+            response = self.client.patch(reverse('food-scan-detail', args=[self.scan.pk]),
+                                         {'meal_type': 'lunch', 'detected_foods': items}, format='json')
+            self.assertEqual(response.status_code, 200, response.content)
+
+        with self.settings(NUTRITION_RECONCILE=False):
+            scan = self.process(during=edit)
+        self.assertEqual((scan.status, scan.meal_type, scan.food_items), ('done', 'lunch', items))
+        self.assertEqual(scan.ai_insights, 'Plain rice.')
+        self.assertEqual(DailyNutritionSummary.objects.get(user=self.user).meal_type, 'lunch')
+
+    def test_scan_deleted_during_analysis_stays_deleted(self):
+        with self.assertRaises(FoodScan.DoesNotExist):
+            self.process(during=self.scan.delete)
+        self.assertFalse(FoodScan.objects.exists())
+        self.assertFalse(DailyNutritionSummary.objects.exists())
+
+    def test_failed_analysis_marks_the_scan_failed(self):
+        scan = self.process(result={'error': 'AI Analysis failed: bad image'})
+        self.assertEqual((scan.status, scan.error), ('failed', 'AI Analysis failed: bad image'))
+        self.assertFalse(DailyNutritionSummary.objects.exists())
+
+
+@override_settings(SCAN_QUEUE_VISIBILITY_TIMEOUT=300, SCAN_QUEUE_MAX_ATTEMPTS=3)
+class DatabaseScanQueueTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('ana', 'ana@example.com')
+        self.queue = DatabaseScanQueue()
+
+    def test_claims_the_oldest_pending_scan_once(self):
+        first, second = pending_scan(self.user), pending_scan(self.user)
+        self.assertEqual(self.queue.claim(), first.pk)
+        self.assertEqual(self.queue.claim(), second.pk)
+        self.assertIsNone(self.queue.claim())
+        first.refresh_from_db()
+        self.assertEqual((first.status, first.attempts), (FoodScan.STATUS_PROCESSING, 1))
+        self.assertIsNotNone(first.claimed_at)
+
+    def test_second_worker_loses_the_claim(self):
+        scan = pending_scan(self.user)
+        claimable = self.queue._claimable()
+        self.assertEqual(self.queue._claim_one(scan.pk, claimable), 1)
+        self.assertEqual(self.queue._claim_one(scan.pk, self.queue._claimable()), 0)
+        scan.refresh_from_db()
+        self.assertEqual(scan.attempts, 1)
+
+    def test_scan_of_a_dead_worker_is_retried_after_the_visibility_timeout(self):
+        claimed_at = timezone.now() - timedelta(seconds=60)
+        scan = pending_scan(self.user, status=FoodScan.STATUS_PROCESSING, attempts=1, claimed_at=claimed_at)
+        self.assertIsNone(self.queue.claim())
+        FoodScan.objects.filter(pk=scan.pk).update(claimed_at=claimed_at - timedelta(seconds=300))
+        self.assertEqual(self.queue.claim(), scan.pk)
+        scan.refresh_from_db()
+        self.assertEqual(scan.attempts, 2)
+
+    def test_gives_up_after_the_last_attempt(self):
+        stale = timezone.now() - timedelta(seconds=600)
+        scan = pending_scan(self.user, status=FoodScan.STATUS_PROCESSING, attempts=3, claimed_at=stale)
+        self.assertIsNone(self.queue.claim())
+        scan.refresh_from_db()
+        self.assertEqual(scan.status, FoodScan.STATUS_FAILED)
+
+    def test_shed_analysis_goes_back_to_the_queue_without_using_an_attempt(self):
+        scan = pending_scan(self.user)
+        self.assertEqual(self.queue.claim(), scan.pk)
+        with mock.patch('api.pipeline.read_stored_image', return_value=b'jpeg'), \
+                mock.patch('api.pipeline.analyze_image', side_effect=AIServiceUnavailable(5)):
+            with self.assertRaises(AIServiceUnavailable):
+                pipeline.process_scan(scan.pk)
+        scan.refresh_from_db()
+        self.assertEqual((scan.status, scan.attempts, scan.claimed_at), (FoodScan.STATUS_PENDING, 0, None))
+        self.assertEqual(self.queue.claim(), scan.pk)
+
+
+class RunWorkersTests(TransactionTestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.user = User.objects.create_user('ana', 'ana@example.com')
+
+    def test_workers_drain_the_queue_and_retry_shed_scans(self):
+        scans = [pending_scan(self.user) for _ in range(3)]
+        outcomes = [AIServiceUnavailable(0), (ANALYSIS, 'miss'), (ANALYSIS, 'miss'), (ANALYSIS, 'miss')]
+        with mock.patch('api.pipeline.read_stored_image', return_value=b'jpeg'), \
+                mock.patch('api.pipeline.analyze_image', side_effect=outcomes) as analyze, \
+                self.settings(NUTRITION_RECONCILE=False):
+            run_workers(DatabaseScanQueue(), concurrency=1, poll_interval=0.01,
+                        stop_event=threading.Event(), once=True)
+        self.assertEqual(analyze.call_count, 4)
+        for scan in scans:
+            scan.refresh_from_db()
+            self.assertEqual((scan.status, scan.attempts), (FoodScan.STATUS_DONE, 1))
+        self.assertEqual(DailyNutritionSummary.objects.get(user=self.user).scan_count, 3)
+
+
+class QueuedUploadTests(TestCase):
+    def setUp(self):
+        use_temporary_scan_storage(self)
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('ana', 'ana@example.com'))
+
+    def test_upload_is_queued_with_retry_after_when_the_model_is_unavailable(self):
+        upload = SimpleUploadedFile('meal.jpg', noise_jpeg(64), content_type='image/jpeg')
+        with mock.patch('api.pipeline.run_analysis', side_effect=AIServiceUnavailable(7)):
+            response = self.client.post(reverse('food_analyze'), {'image': upload})
+        self.assertEqual(response.status_code, 202, response.content)
+        self.assertEqual(response['Retry-After'], '7')
+        scan = FoodScan.objects.get()
+        self.assertEqual(response['Location'], reverse('food-scan-detail', args=[scan.pk]))
+        self.assertEqual((scan.status, response.json()['status']), (FoodScan.STATUS_PENDING, 'pending'))
@@ -0,0 +1,45 @@
+import asyncio
+import time
+
+from django.core.cache import caches
+from django.test import SimpleTestCase, override_settings
+
+from api import ratelimit
+from api.ratelimit import breaker
+
+
+@override_settings(AI_RATE_LIMIT_GLOBAL='')
+class ProbeReleaseTests(SimpleTestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.addCleanup(caches['default'].clear)
+        # Half-open: the cooldown is over and the next call is the probe
+        caches['default'].set(breaker.OPEN_KEY, time.time() - 1, timeout=None)
+
+    def test_probe_failing_without_a_quota_error_releases_the_slot(self):
+        with self.assertRaises(TimeoutError):
+            with ratelimit.model_call():
+                self.assertEqual(breaker.before_call(), 1.0)  # others wait for the probe
+                raise TimeoutError("model call timed out")
+        self.assertEqual(breaker.state(), 'half_open')
+        self.assertEqual(breaker.before_call(), 0.0)
+
+    def test_cancelled_async_probe_releases_the_slot(self):
+        async def probe():
+            async with ratelimit.amodel_call():
+                await asyncio.sleep(10)
+
+        async def cancel_probe():
+            task = asyncio.ensure_future(probe())
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(cancel_probe())
+        self.assertEqual(breaker.before_call(), 0.0)
+
+    def test_successful_probe_closes_the_breaker(self):
+        with ratelimit.model_call():
+            pass
+        self.assertEqual(breaker.state(), 'closed')
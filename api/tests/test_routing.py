@@ -0,0 +1,70 @@
+import asyncio
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import call_command
+from django.test import SimpleTestCase, TransactionTestCase, override_settings
+
+from api import routing
+from api.ai_client import AIClientError
+from api.invoke import ModelCallTimeout
+
+POLICIES = {
+    'scan': {'retries': 2, 'backoff_base': 0, 'hedge': False},
+    'coach': {'retries': 1, 'backoff_base': 0, 'hedge': False},
+}
+
+
+@override_settings(AI_CALL_POLICIES=POLICIES, AI_RATE_LIMIT_GLOBAL='')
+class RoutePolicyTests(SimpleTestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.addCleanup(caches['default'].clear)
+        self.addCleanup(routing._stats.clear)
+
+    def attempts(self, route):
+        models = []
+
+        def send(model, timeout):
+            models.append(model)
+            raise TimeoutError(f"{model} timed out")
+
+        with self.assertRaises(ModelCallTimeout):
+            routing.call(route, send)
+        return models
+
+    def test_routes_run_under_their_base_endpoint_policy(self):
+        for route, policy in settings.AI_ROUTE_POLICIES.items():
+            with self.subTest(route=route):
+                self.assertEqual(len(self.attempts(route)), POLICIES[policy]['retries'] + 1)
+
+    def test_retries_fail_over_across_the_tier(self):
+        self.assertEqual(self.attempts('coach_small_talk'), settings.AI_MODEL_TIERS['lite'])
+
+
+CACHES_WITH_DATABASE = {**settings.CACHES, 'ratelimit_db': {
+    'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+    'LOCATION': 'test_ratelimit_cache',
+}}
+
+
+@override_settings(AI_CALL_POLICIES=POLICIES, AI_RATE_LIMIT_GLOBAL='', CACHES=CACHES_WITH_DATABASE,
+                   AI_RATE_LIMIT_CACHE='ratelimit_db')
+class AsyncFailoverTests(TransactionTestCase):
+    def setUp(self):
+        call_command('createcachetable', 'test_ratelimit_cache', verbosity=0)
+        self.addCleanup(routing._stats.clear)
+
+    def test_cooldowns_in_a_database_cache_are_used_off_the_event_loop(self):
+        models = []
+
+        async def send(model, timeout):
+            models.append(model)
+            if len(models) == 1:
+                raise AIClientError(429, "Quota exceeded")
+            return f"reply from {model}"
+
+        primary, sibling = settings.AI_MODEL_TIERS['flash'][:2]
+        self.assertEqual(asyncio.run(routing.acall('coach', send)), f"reply from {sibling}")
+        self.assertEqual(models, [primary, sibling])
+        self.assertTrue(routing.cooling_down(primary))
@@ -0,0 +1,25 @@
+from unittest import mock
+
+from django.test import SimpleTestCase, override_settings
+
+from api import utils
+
+
+class AnalysisCacheVersionTests(SimpleTestCase):
+    def test_matches_the_current_settings(self):
+        self.assertEqual(utils.analysis_cache_version(), utils.ANALYSIS_CACHE_VERSION)
+
+    def test_changes_with_structured_output(self):
+        with override_settings(AI_STRUCTURED_OUTPUT=False):
+            free_text = utils.analysis_cache_version()
+        with override_settings(AI_STRUCTURED_OUTPUT=True):
+            structured = utils.analysis_cache_version()
+        self.assertNotEqual(free_text, structured)
+
+    @override_settings(AI_STRUCTURED_OUTPUT=True)
+    def test_changes_with_the_response_schema(self):
+        before = utils.analysis_cache_version()
+        schema = utils.analysis_response_schema()
+        schema['properties']['portion_notes'] = {'type': 'STRING'}
+        with mock.patch('api.schemas.analysis_response_schema', return_value=schema):
+            self.assertNotEqual(utils.analysis_cache_version(), before)
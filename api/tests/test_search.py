@@ -0,0 +1,66 @@
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from api import search
+from api.models import ChatMessage, FoodScan
+
+
+def scan(user, *names, meal_type=None):
+    return FoodScan.objects.create(
+        user=user, image_url='', food_items=[{'name': name} for name in names],
+        calories=0, protein=0, carbs=0, fats=0, meal_type=meal_type)
+
+
+class RankedTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('ravi')
+        self.other = User.objects.create_user('asha')
+
+    def ids(self, model, text, user=None):
+        return [pk for _, pk in search.ranked(model, text, (user or self.user).pk, 10)]
+
+    def test_index_follows_scan_writes(self):
+        curry = scan(self.user, 'Chicken Curry', 'Naan', meal_type='dinner')
+        self.assertEqual(self.ids(FoodScan, 'chick curr'), [curry.pk])
+        self.assertEqual(self.ids(FoodScan, 'dinner'), [curry.pk])
+
+        curry.food_items = [{'name': 'Paneer Tikka'}]
+        curry.save()
+        self.assertEqual(self.ids(FoodScan, 'chicken'), [])
+        self.assertEqual(self.ids(FoodScan, 'paneer'), [curry.pk])
+        FoodScan.objects.filter(pk=curry.pk).update(meal_type='lunch')
+        self.assertEqual(self.ids(FoodScan, 'dinner'), [])
+        self.assertEqual(self.ids(FoodScan, 'lunch'), [curry.pk])
+
+        curry.delete()
+        self.assertEqual(self.ids(FoodScan, 'paneer'), [])
+
+    def test_index_follows_message_writes(self):
+        chat = ChatMessage.objects.create(user=self.user, message='Is dal healthy?', response='Lentils are rich in protein.')
+        self.assertEqual(self.ids(ChatMessage, 'lentil'), [chat.pk])
+
+        ChatMessage.objects.filter(pk=chat.pk).update(response='Yes, in moderation.')
+        self.assertEqual(self.ids(ChatMessage, 'lentil'), [])
+        self.assertEqual(self.ids(ChatMessage, 'moderation'), [chat.pk])
+
+        chat.delete()
+        self.assertEqual(self.ids(ChatMessage, 'dal'), [])
+
+    def test_only_the_users_rows_are_returned(self):
+        mine = scan(self.user, 'Masala Dosa')
+        theirs = [scan(self.other, 'Masala Dosa') for _ in range(3)]
+        self.assertEqual(self.ids(FoodScan, 'dosa'), [mine.pk])
+        self.assertEqual(self.ids(FoodScan, 'dosa', self.other), [s.pk for s in reversed(theirs)])
+
+    def test_item_names_outrank_meal_types(self):
+        by_meal = scan(self.user, 'Toast', meal_type='breakfast')
+        by_name = scan(self.user, 'Breakfast Burrito')
+        self.assertEqual(self.ids(FoodScan, 'breakfast'), [by_name.pk, by_meal.pk])
+
+    def test_fallback_matches_the_same_rows(self):
+        curry = scan(self.user, 'Chicken Curry')
+        scan(self.other, 'Chicken Curry')
+        with mock.patch('api.search.backend', return_value=None):
+            self.assertEqual(search.ranked(FoodScan, 'chick curr', self.user.pk, 10), [(0.0, curry.pk)])
@@ -0,0 +1,142 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from unittest import skipUnless
+from urllib.parse import parse_qs, urlparse
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.test import SimpleTestCase, override_settings
+
+from api import storage
+from api.storage import S3ScanStorage, ScanFileSystemStorage
+
+try:
+    import boto3
+    from botocore.stub import ANY, Stubber
+except ImportError:  # optional, like S3ScanStorage itself
+    boto3 = None
+
+MiB = 1024 * 1024
+DIGEST = hashlib.sha256(b'meal').hexdigest()
+KEY = storage.scan_key(DIGEST, '.jpg')
+S3_OPTIONS = {
+    'bucket_name': 'scans-bucket', 'location': 'scans', 'region_name': 'us-east-1',
+    'access_key': 'test-key', 'secret_key': 'test-secret',
+    'multipart_threshold': 5 * MiB, 'multipart_chunksize': 5 * MiB, 'max_concurrency': 1,
+}
+
+
+class ScanKeyTests(SimpleTestCase):
+    def test_keys_are_sharded_by_the_content_digest(self):
+        self.assertEqual(KEY, f'{DIGEST[:2]}/{DIGEST[2:4]}/{DIGEST}.jpg')
+        self.assertEqual(storage.scan_key(DIGEST, '.jpg', suffix='_thumb'),
+                         f'{DIGEST[:2]}/{DIGEST[2:4]}/{DIGEST}_thumb.jpg')
+
+
+class FailingContent(ContentFile):
+    def chunks(self, chunk_size=None):
+        yield b'half an image'
+        raise OSError("client went away")
+
+
+class ScanFileSystemStorageTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.storage = ScanFileSystemStorage(location=self.root, base_url='/media/scans/')
+
+    def files(self):
+        return sorted(os.path.relpath(os.path.join(path, name), self.root)
+                      for path, _, names in os.walk(self.root) for name in names)
+
+    def test_save_writes_the_key_in_its_shard(self):
+        self.assertEqual(self.storage.save(KEY, ContentFile(b'jpeg bytes')), KEY)
+        self.assertEqual(self.files(), [KEY])
+        with self.storage.open(KEY) as f:
+            self.assertEqual(f.read(), b'jpeg bytes')
+        self.assertEqual(self.storage.url(KEY), f'/media/scans/{KEY}')
+
+    def test_saving_an_existing_key_replaces_it_without_renaming(self):
+        self.storage.save(KEY, ContentFile(b'first'))
+        self.assertEqual(self.storage.save(KEY, ContentFile(b'second')), KEY)
+        self.assertEqual(self.files(), [KEY])
+        with self.storage.open(KEY) as f:
+            self.assertEqual(f.read(), b'second')
+
+    def test_failed_write_leaves_nothing_behind(self):
+        self.storage.save(KEY, ContentFile(b'complete'))
+        with self.assertRaises(OSError):
+            self.storage.save(KEY, FailingContent(b''))
+        self.assertEqual(self.files(), [KEY])
+        with self.storage.open(KEY) as f:
+            self.assertEqual(f.read(), b'complete')
+
+
+@skipUnless(boto3, "boto3 is not installed")
+class S3ScanStorageTests(SimpleTestCase):
+    def setUp(self):
+        scans = override_settings(STORAGES={
+            **settings.STORAGES, 'scans': {'BACKEND': 'api.storage.S3ScanStorage', 'OPTIONS': S3_OPTIONS},
+        })
+        scans.enable()
+        self.addCleanup(scans.disable)
+        self.storage = storage.get_scan_storage()
+        self.stubber = Stubber(self.storage.client)
+        self.stubber.activate()
+        self.addCleanup(self.stubber.deactivate)
+
+    def expect_missing(self, key):
+        self.stubber.add_client_error('head_object', service_error_code='404', http_status_code=404,
+                                      expected_params={'Bucket': 'scans-bucket', 'Key': key})
+
+    def test_large_objects_are_uploaded_in_parts(self):
+        object_key = f'scans/{KEY}'
+        data = os.urandom(12 * MiB)
+        self.expect_missing(object_key)
+        self.stubber.add_response('create_multipart_upload', {'UploadId': 'upload-1'}, {
+            'Bucket': 'scans-bucket', 'Key': object_key, 'ContentType': 'image/jpeg', 'ChecksumAlgorithm': ANY,
+        })
+        for number, part in enumerate((data[:5 * MiB], data[5 * MiB:10 * MiB], data[10 * MiB:]), start=1):
+            self.stubber.add_response('upload_part', {'ETag': f'"etag-{number}"'}, {
+                'Bucket': 'scans-bucket', 'Key': object_key, 'UploadId': 'upload-1', 'PartNumber': number,
+                'Body': ANY, 'ChecksumAlgorithm': ANY,
+            })
+        self.stubber.add_response('complete_multipart_upload', {}, {
+            'Bucket': 'scans-bucket', 'Key': object_key, 'UploadId': 'upload-1', 'MultipartUpload': ANY,
+        })
+        self.assertEqual(storage.put(KEY, data), KEY)
+        self.stubber.assert_no_pending_responses()
+
+    def test_small_objects_are_put_once_per_content(self):
+        object_key = f'scans/{KEY}'
+        self.expect_missing(object_key)
+        self.stubber.add_response('put_object', {}, {
+            'Bucket': 'scans-bucket', 'Key': object_key, 'ContentType': 'image/jpeg', 'Body': ANY,
+            'ChecksumAlgorithm': ANY,
+        })
+        self.stubber.add_response('head_object', {'ContentLength': 4},
+                                  {'Bucket': 'scans-bucket', 'Key': object_key})
+        storage.put(KEY, b'meal')
+        # The same content maps to the same key, which is now there
+        storage.put(storage.scan_key(hashlib.sha256(b'meal').hexdigest(), '.jpg'), b'meal')
+        self.stubber.assert_no_pending_responses()
+
+    def test_references_are_presigned_when_read(self):
+        reference = storage.stored_url(KEY)
+        self.assertEqual(reference, f's3://scans-bucket/scans/{KEY}')
+        url = urlparse(storage.resolve_url(reference))
+        self.assertEqual(url.path, f'/scans/{KEY}')
+        self.assertIn('scans-bucket', url.netloc)
+        query = parse_qs(url.query)
+        self.assertTrue({'Signature', 'X-Amz-Signature'} & set(query))
+        self.assertTrue({'Expires', 'X-Amz-Expires'} & set(query))
+
+    def test_other_urls_are_left_alone(self):
+        self.assertEqual(storage.resolve_url('https://cdn.example.com/a.jpg'), 'https://cdn.example.com/a.jpg')
+
+    def test_public_url_is_saved_as_is(self):
+        public = S3ScanStorage(**{**S3_OPTIONS, 'public_url': 'https://cdn.example.com/'})
+        self.assertFalse(public.signs_urls)
+        self.assertEqual(public.url(KEY), f'https://cdn.example.com/scans/{KEY}')
@@ -1,13 +1,30 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import views, async_views
 from .views import AuthenticateView, MeView
 
+if settings.ASYNC_VIEWS:
+    FoodAnalyzeView = async_views.AsyncFoodAnalyzeView
+    FoodAnalyzeBatchView = async_views.AsyncFoodAnalyzeBatchView
+    ChatView = async_views.AsyncChatView
+    AdminCheckAIView = async_views.AsyncAdminCheckAIView
+else:
+    FoodAnalyzeView = views.FoodAnalyzeView
+    FoodAnalyzeBatchView = views.FoodAnalyzeBatchView
+    ChatView = views.ChatView
+    AdminCheckAIView = views.AdminCheckAIView
+
 urlpatterns = [
     path('auth/authenticate', AuthenticateView.as_view(), name='authenticate'),
     path('auth/me', MeView.as_view(), name='me'),
-    path('food/analyze', views.FoodAnalyzeView.as_view(), name='food_analyze'),
+    path('food/analyze', FoodAnalyzeView.as_view(), name='food_analyze'),
+    path('food/analyze/batch', FoodAnalyzeBatchView.as_view(), name='food_analyze_batch'),
     path('food/history', views.HistoryView.as_view(), name='food_history'),
+    path('food/summary', views.NutritionSummaryView.as_view(), name='food_summary'),
     path('food/scans/<int:pk>', views.FoodScanDetailView.as_view(), name='food-scan-detail'),
-    path('chat', views.ChatView.as_view(), name='chat'),
-    path('admin/check-ai', views.AdminCheckAIView.as_view(), name='admin_check_ai'),
+    path('chat', ChatView.as_view(), name='chat'),
+    path('search', views.SearchView.as_view(), name='search'),
+    path('admin/check-ai', AdminCheckAIView.as_view(), name='admin_check_ai'),
+    path('admin/ai-limits', views.AdminAILimitsView.as_view(), name='admin_ai_limits'),
+    path('metrics', views.MetricsView.as_view(), name='metrics'),
 ]
@@ -1,33 +1,40 @@
-import os, json
+import os, json, hashlib, itertools, logging
 from datetime import datetime, timedelta
+from functools import lru_cache
 from typing import Optional, Any
-from jose import jwt
-from passlib.context import CryptContext
 from dotenv import load_dotenv
-import google.generativeai as genai
+from django.conf import settings
+
+from .ai_client import get_ai_client, get_gemini_client, configure_sdk
+from . import ratelimit, routing, metrics
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Security constants
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "43200"))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-# AI Setup
+# AI Setup (the SDK is imported and configured on first use, see api/ai_client.py)
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
 
 # --- Security Helpers ---
+# passlib and jose load on first use; the request path does not need them
+@lru_cache(maxsize=None)
+def pwd_context():
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=settings.PASSWORD_BCRYPT_ROUNDS)
+
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return pwd_context().verify(plain_password, hashed_password)
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return pwd_context().hash(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
+    from jose import jwt
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
@@ -38,23 +45,13 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 # --- AI Helpers ---
-def get_gemini_vision_model():
-    return genai.GenerativeModel('models/gemini-2.5-flash')
+# Primary models of the scan and coach routes; calls pick their model
+# through api/routing.py
+VISION_MODEL_NAME = settings.AI_MODEL_TIERS[settings.AI_MODEL_ROUTES['scan']][0]
+COACH_MODEL_NAME = settings.AI_MODEL_TIERS[settings.AI_MODEL_ROUTES['coach']][0]
+CONNECTION_TEST_PROMPT = "Say 'Connection Successful'"
 
-def get_gemini_pro_model():
-    return genai.GenerativeModel('models/gemini-2.5-flash')
-
-def analyze_food_image(image_data: bytes, content_type: str):
-    if not GEMINI_API_KEY:
-        return {
-            "error": "Gemini API Key not configured",
-            "mock_data": True,
-            "items": [{"name": "Mock Food", "calories": 250}],
-            "calories": 250.0, "protein": 10.0, "carbs": 30.0, "fats": 8.0
-        }
-    
-    model = get_gemini_vision_model()
-    prompt = """
+FOOD_ANALYSIS_PROMPT = """
     Analyze this food image and provide the nutrition information in a strict JSON format.
     Include: 
     1. 'items': List of objects with:
@@ -77,58 +74,234 @@ def analyze_food_image(image_data: bytes, content_type: str):
     7. 'dietary_tags': (list of strings, e.g., ['Vegetarian', 'High Protein'])
     8. 'ai_insights': (string, brief summary of the meal's healthiness)
     """
-    
-    response = model.generate_content([
-        prompt,
+
+def get_gemini_vision_model():
+    return get_gemini_client().model(routing.primary_model('scan'))
+
+def get_gemini_pro_model():
+    return get_gemini_client().model(routing.primary_model('scan_review'))
+
+def ai_configured():
+    return bool(GEMINI_API_KEY) or settings.AI_BACKEND == 'fake'
+
+OFFLINE_ANALYSIS = {
+    "error": "Gemini API Key not configured",
+    "mock_data": True,
+    "items": [{"name": "Mock Food", "calories": 250}],
+    "calories": 250.0, "protein": 10.0, "carbs": 30.0, "fats": 8.0
+}
+
+OFFLINE_COACH_REPLY = "I am currently in offline mode. Please configure the Gemini API Key to talk to the AI Coach."
+
+def build_analysis_contents(image_data: bytes, content_type: str):
+    return [
+        FOOD_ANALYSIS_PROMPT,
         {"mime_type": content_type, "data": image_data}
-    ])
-    
-    print(f"DEBUG: Gemini Raw Response: {response.text}")
-    
+    ]
+
+def parse_analysis_response(text: str):
+    """Turn the model's reply into an analysis result (or an error result)."""
+    logger.debug("Gemini raw response: %s", text)
+
+    from . import schemas  # pydantic, loaded with the first analysis
     try:
-        # Extract JSON from the response text
-        text = response.text
-        # Clean markdown formatting if present
-        if "```json" in text:
-            text = text.split("```json")[1].split("```")[0].strip()
-        elif "```" in text:
-            text = text.split("```")[1].split("```")[0].strip()
-            
-        print(f"DEBUG: Cleaned Text for JSON parsing: {text}")
-        data = json.loads(text)
-        print(f"DEBUG: Parsed JSON Data: {data}")
-        
-        return {
-            "items": data.get("items", []),
-            "calories": float(data.get("total_calories", 0)),
-            "protein": float(data.get("total_protein", 0)),
-            "carbs": float(data.get("total_carbs", 0)),
-            "fats": float(data.get("total_fats", 0)),
-            "health_score": data.get("health_score", "B"),
-            "dietary_tags": data.get("dietary_tags", []),
-            "ai_insights": data.get("ai_insights", "Balanced meal.")
-        }
-    except Exception as e:
+        with metrics.span('parse'):
+            data = schemas.parse_analysis(text)
+    except schemas.AnalysisParseError as e:
         error_str = str(e)
-        print(f"DEBUG: AI Error encountered: {error_str}")
-        import traceback
-        traceback.print_exc()
+        logger.warning("Unusable scan analysis from the model: %s", error_str)
         return {
             "error": f"AI Analysis failed: {error_str}",
-            "raw_text": getattr(response, 'text', 'No response text available')
+            "raw_text": text if text is not None else 'No response text available'
         }
+    
+    return {
+        "items": [item.model_dump(exclude_none=True) for item in data.items],
+        "calories": data.total_calories,
+        "protein": data.total_protein,
+        "carbs": data.total_carbs,
+        "fats": data.total_fats,
+        "health_score": data.health_score,
+        "dietary_tags": data.dietary_tags,
+        "ai_insights": data.ai_insights
+    }
 
-def get_ai_coach_response(message: str, user_context: Optional[str] = None):
-    if not GEMINI_API_KEY:
-        return "I am currently in offline mode. Please configure the Gemini API Key to talk to the AI Coach."
+def analysis_response_schema():
+    """Schema for structured output, or None to let the model answer in free text."""
+    if not settings.AI_STRUCTURED_OUTPUT:
+        return None
+    from . import schemas
+    return schemas.analysis_response_schema()
+
+# Changes whenever the prompt, the scan models or the requested response
+# format change, so cached analyses produced by an older prompt/model or
+# parsed from a different output shape are never served.
+def analysis_cache_version():
+    return hashlib.sha256("\n".join([
+        *settings.AI_MODEL_TIERS[settings.AI_MODEL_ROUTES['scan']],
+        *settings.AI_MODEL_TIERS[settings.AI_MODEL_ROUTES['scan_review']],
+        FOOD_ANALYSIS_PROMPT,
+        json.dumps(analysis_response_schema(), sort_keys=True),
+    ]).encode()).hexdigest()[:12]
+
+ANALYSIS_CACHE_VERSION = analysis_cache_version()
+
+def analyze_food_image(image_data: bytes, content_type: str):
+    if not ai_configured():
+        return dict(OFFLINE_ANALYSIS)
+    
+    contents = build_analysis_contents(image_data, content_type)
+    response_schema = analysis_response_schema()
+    send = lambda model, timeout: get_ai_client().generate_content(
+        model, contents, timeout=timeout, response_schema=response_schema
+    )
+    with metrics.span('model_call'):
+        text = routing.call('scan', send)
+    result = parse_analysis_response(text)
+    if "error" in result or not routing.needs_review(result):
+        return result
+    try:
+        with metrics.span('model_call'):
+            text = routing.call('scan_review', send)
+        review = parse_analysis_response(text)
+    except Exception as e:
+        logger.warning("Low-confidence re-analysis failed, keeping first result: %s", e)
+        return result
+    return result if "error" in review else review
+
+async def analyze_food_image_async(image_data: bytes, content_type: str):
+    if not ai_configured():
+        return dict(OFFLINE_ANALYSIS)
     
-    model = get_gemini_pro_model()
-    prompt = f"You are a friendly Nutrition Coach for the app 'Find Your Food'. User says: {message}"
+    contents = build_analysis_contents(image_data, content_type)
+    response_schema = analysis_response_schema()
+    send = lambda model, timeout: get_ai_client().agenerate_content(
+        model, contents, timeout=timeout, response_schema=response_schema
+    )
+    with metrics.span('model_call'):
+        text = await routing.acall('scan', send)
+    result = parse_analysis_response(text)
+    if "error" in result or not routing.needs_review(result):
+        return result
+    try:
+        with metrics.span('model_call'):
+            text = await routing.acall('scan_review', send)
+        review = parse_analysis_response(text)
+    except Exception as e:
+        logger.warning("Low-confidence re-analysis failed, keeping first result: %s", e)
+        return result
+    return result if "error" in review else review
+
+def build_coach_prompt(message: str, user_context: Optional[str] = None):
+    """``user_context`` is the profile, intake and conversation block from
+    coach_context.build()."""
+    prompt = "You are a friendly Nutrition Coach for the app 'Find Your Food'."
     if user_context:
-        prompt += f"\nUser Goal: {user_context}"
-        
-    response = model.generate_content(prompt)
-    return response.text
+        prompt += f"\n\n{user_context}"
+    return prompt + f"\n\nUser says: {message}"
+
+CHAT_SUMMARY_PROMPT = """
+    You keep a running summary of a conversation between a user and the Nutrition Coach of the app 'Find Your Food'.
+    Rewrite the summary so it also covers the new turns. Keep what the coach needs later: the user's goals,
+    preferences, allergies, habits and progress, and the advice already given. Drop greetings and small talk.
+    Answer with the summary only, in at most {words} words.
+
+    Current summary:
+    {summary}
+
+    New turns:
+    {turns}
+"""
+
+def summarize_conversation(summary: str, turns: str):
+    """Fold ``turns`` into the rolling chat ``summary`` (api/coach_context.py)."""
+    prompt = CHAT_SUMMARY_PROMPT.format(
+        words=settings.COACH_SUMMARY_MAX_TOKENS * 3 // 4, summary=summary or "(none yet)", turns=turns,
+    )
+    return routing.call('coach_summary', lambda model, timeout: get_ai_client().generate_content(
+        model, prompt, timeout=timeout
+    )).strip()
+
+# Changes whenever the coach prompt or models change, so cached replies
+# (api/coach_cache.py) from an older prompt/model are never served.
+COACH_CACHE_VERSION = hashlib.sha256("\n".join([
+    *settings.AI_MODEL_TIERS[settings.AI_MODEL_ROUTES['coach']],
+    *settings.AI_MODEL_TIERS[settings.AI_MODEL_ROUTES['coach_small_talk']],
+    build_coach_prompt("{message}", "{goal}"),
+]).encode()).hexdigest()[:12]
+
+def get_ai_coach_response(message: str, user_context: Optional[str] = None):
+    if not ai_configured():
+        return OFFLINE_COACH_REPLY
+    
+    prompt = build_coach_prompt(message, user_context)
+    return routing.call(routing.chat_route(message), lambda model, timeout: get_ai_client().generate_content(
+        model, prompt, timeout=timeout
+    ))
+
+async def get_ai_coach_response_async(message: str, user_context: Optional[str] = None):
+    if not ai_configured():
+        return OFFLINE_COACH_REPLY
+    
+    prompt = build_coach_prompt(message, user_context)
+    return await routing.acall(routing.chat_route(message), lambda model, timeout: get_ai_client().agenerate_content(
+        model, prompt, timeout=timeout
+    ))
+
+def _open_stream(chunks):
+    """``(first_chunk, chunks)``: the first chunk is awaited inside the model call."""
+    return next(chunks, None), chunks
+
+async def _aopen_stream(chunks):
+    try:
+        return await chunks.__anext__(), chunks
+    except StopAsyncIteration:
+        return None, chunks
+
+def stream_ai_coach_response(message: str, user_context: Optional[str] = None):
+    """The coach's reply as an iterator of chunks, as the model generates it.
+
+    The stream is opened here, before the caller starts its response:
+    admission, the route's timeout (to the first chunk), retries and
+    failover all apply, and a shed call raises AIServiceUnavailable
+    instead of breaking a stream that has already begun.
+    """
+    if not ai_configured():
+        return iter([OFFLINE_COACH_REPLY])
+
+    prompt = build_coach_prompt(message, user_context)
+    first, chunks = routing.call(routing.chat_route(message), lambda model, timeout: _open_stream(
+        get_ai_client().stream_content(model, prompt)
+    ))
+    return itertools.chain([first] if first else [], chunks)
+
+async def astream_ai_coach_response(message: str, user_context: Optional[str] = None):
+    """Async counterpart of stream_ai_coach_response(); returns an async iterator."""
+    if not ai_configured():
+        return _achain(OFFLINE_COACH_REPLY, None)
+
+    prompt = build_coach_prompt(message, user_context)
+    first, chunks = await routing.acall(routing.chat_route(message), lambda model, timeout: _aopen_stream(
+        get_ai_client().astream_content(model, prompt)
+    ))
+    return _achain(first, chunks)
+
+async def _achain(first, chunks):
+    if first:
+        yield first
+    if chunks is not None:
+        async for chunk in chunks:
+            yield chunk
+
+def classify_ai_error(error_str: str):
+    """Best-effort HTTP status for a model API error message."""
+    if ratelimit.is_quota_error(error_str):
+        return 429
+    elif "403" in error_str or "permission" in error_str.lower():
+        return 403
+    elif "401" in error_str or "invalid" in error_str.lower():
+        return 401
+    return None
 
 def test_gemini_connection(api_key: Optional[str] = None):
     """Diagnostic function to test if the API key is working"""
@@ -139,32 +312,44 @@ def test_gemini_connection(api_key: Optional[str] = None):
     try:
         # Temporarily reconfigure if a specific key is provided
         if api_key:
-            genai.configure(api_key=api_key)
+            configure_sdk(api_key)
         
-        model = genai.GenerativeModel('models/gemini-2.5-flash')
-        response = model.generate_content("Say 'Connection Successful'")
+        model = get_gemini_client().model(VISION_MODEL_NAME)
+        response = model.generate_content(CONNECTION_TEST_PROMPT)
         
         # Restore original config if we changed it
         if api_key and GEMINI_API_KEY:
-            genai.configure(api_key=GEMINI_API_KEY)
+            configure_sdk(GEMINI_API_KEY)
             
         return {"success": True, "response": response.text}
     except Exception as e:
         # Restore original config even on error
         if api_key and GEMINI_API_KEY:
-            genai.configure(api_key=GEMINI_API_KEY)
+            configure_sdk(GEMINI_API_KEY)
             
         error_str = str(e)
-        status_code = None
-        if "429" in error_str or "Quota exceeded" in error_str or "ResourceExhausted" in error_str:
-            status_code = 429
-        elif "403" in error_str or "permission" in error_str.lower():
-            status_code = 403
-        elif "401" in error_str or "invalid" in error_str.lower():
-            status_code = 401
-            
         return {
             "success": False, 
             "error": error_str, 
-            "status_code": status_code
+            "status_code": classify_ai_error(error_str)
+        }
+
+async def test_gemini_connection_async(api_key: Optional[str] = None):
+    """Async variant of test_gemini_connection; the key is sent per request,
+    so no global reconfiguration is needed."""
+    target_key = api_key or GEMINI_API_KEY
+    if not target_key:
+        return {"success": False, "error": "API Key missing"}
+    
+    try:
+        text = await get_gemini_client().agenerate_content(
+            VISION_MODEL_NAME, CONNECTION_TEST_PROMPT, api_key=target_key
+        )
+        return {"success": True, "response": text}
+    except Exception as e:
+        error_str = str(e)
+        return {
+            "success": False, 
+            "error": error_str, 
+            "status_code": classify_ai_error(error_str)
         }
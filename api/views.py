@@ -1,22 +1,80 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, permissions, generics, authentication
+from rest_framework.settings import api_settings
 from rest_framework_simplejwt.tokens import RefreshToken
+from .authentication import CachedJWTAuthentication
 from django.contrib.auth.models import User
 from django.contrib.auth import authenticate as dj_authenticate
 from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import BigIntegerField, Max
+from django.db.models.functions import Cast, Lower, Substr
+from django.http import HttpResponse
 from django.shortcuts import render
+from django.utils.crypto import constant_time_compare
+from django.views import View
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.utils.urls import replace_query_param
 from .models import FoodScan, Feedback, ChatMessage
-from .serializers import FoodScanSerializer, ChatMessageSerializer, UserSerializer
-from . import utils
-import os
+from .serializers import FoodScanSerializer, UserSerializer
+from .queues import get_scan_queue
+from .pagination import KeysetPagination
+from .renderers import EventStreamRenderer
+from .ratelimit import AIRateThrottle
+from . import utils, scan_cache, pipeline, chat_stream, rollups, ratelimit, routing, coach_cache, coach_context, encoders, nutrition, hashers, metrics, search
 import datetime
+import logging
+import re
 import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+def find_user_by_email(email):
+    """Case-insensitive lookup that uses the LOWER(email) index."""
+    return (User.objects.annotate(email_lower=Lower('email'))
+            .filter(email_lower=email.lower()).order_by('pk').first())
+
+
+def allocate_username(base):
+    """``base``, or ``base`` followed by one more than its highest numeric suffix.
+
+    Two indexed queries at most, however many usernames share the prefix;
+    a concurrent sign-up taking the same name is retried by register_user().
+    """
+    base = base[:140]
+    if not User.objects.filter(username=base).exists():
+        return base
+    highest = (User.objects.filter(username__regex=rf'^{re.escape(base)}[0-9]{{1,9}}$')
+               .annotate(suffix=Cast(Substr('username', len(base) + 1), BigIntegerField()))
+               .aggregate(Max('suffix'))['suffix__max'])
+    return f"{base}{(highest or 0) + 1}"
+
+
+def register_user(email, password, name):
+    encoded = hashers.make_password(password)
+    base_username = email.split('@')[0]
+    for attempt in range(3):
+        try:
+            with transaction.atomic():
+                return User.objects.create(username=allocate_username(base_username), email=email,
+                                           password=encoded, first_name=name)
+        except IntegrityError:
+            # Another sign-up took the same username first
+            if attempt == 2:
+                raise
+
+
 class AuthenticateView(APIView):
     permission_classes = [permissions.AllowAny]
 
     def post(self, request):
-        print(f"DEBUG: AuthenticateView.post called with data: {request.data}")
         email = request.data.get('email')
         password = request.data.get('password')
         name = request.data.get('name', '')
@@ -24,28 +82,17 @@ class AuthenticateView(APIView):
         if not email or not password:
             return Response({"error": "Email and password required"}, status=status.HTTP_400_BAD_REQUEST)
 
-        user = User.objects.filter(email=email).first()
-        
+        email = User.objects.normalize_email(email.strip())
+        logger.debug("Sign-in for %s", email)
+        user = find_user_by_email(email)
+
         if user:
             # User exists, check password
-            if not user.check_password(password):
+            if not hashers.check_password(user, password):
                 return Response({"error": "Invalid password"}, status=status.HTTP_401_UNAUTHORIZED)
         else:
             # Register new user
-            username = email.split('@')[0]
-            # Ensure unique username
-            base_username = username
-            counter = 1
-            while User.objects.filter(username=username).exists():
-                username = f"{base_username}{counter}"
-                counter += 1
-            
-            user = User.objects.create_user(
-                username=username,
-                email=email,
-                password=password,
-                first_name=name
-            )
+            user = register_user(email, password, name)
 
         refresh = RefreshToken.for_user(user)
         return Response({
@@ -64,81 +111,251 @@ class MeView(generics.RetrieveAPIView):
     serializer_class = UserSerializer
 
     def get_object(self):
-        print(f"DEBUG: MeView.get_object called for user: {self.request.user}")
-        return self.request.user
+        user = self.request.user
+        if User.profile.is_cached(user):
+            return user
+        return User.objects.select_related('profile').get(pk=user.pk)
 
 class FoodAnalyzeView(APIView):
     permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = [AIRateThrottle]
+    ai_overflow = 'queue'
 
     def post(self, request):
-        print("DEBUG: FoodAnalyzeView.post called")
         image = request.FILES.get('image')
         if not image:
             return Response({"error": "No image provided"}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Save file locally
-        os.makedirs("media/scans", exist_ok=True)
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{timestamp}_{image.name}"
-        file_path = os.path.join("media/scans", filename)
-        
-        with open(file_path, "wb") as buffer:
-            for chunk in image.chunks():
-                buffer.write(chunk)
-        
-        print(f"DEBUG: Processing image: {image.name} ({image.content_type})")
-        print(f"DEBUG: Saved to: {file_path}")
-        
-        # Read image data for Gemini
-        with open(file_path, "rb") as f:
-            image_bytes = f.read()
-        print(f"DEBUG: Read {len(image_bytes)} bytes")
-        
-        # Call AI Analysis (Sync)
-        print("DEBUG: Sending to Gemini AI...")
-        analysis_result = utils.analyze_food_image(image_bytes, image.content_type)
-        print(f"DEBUG: AI Result: {analysis_result}")
-        
+        # Downscale/re-encode; the result is saved under the upload's content
+        # hash in the background while the analysis runs
+        upload = pipeline.prepare_upload(image)
+        upload_fields = pipeline.upload_fields(request, upload)
+        logger.debug("Scan upload %s (%s) stored as %s (%d -> %d bytes)", image.name, image.content_type,
+                     upload.key, upload.size, len(upload.image.data))
+
+        # Duplicate uploads are answered from the cache without calling Gemini
+        analysis_result = scan_cache.lookup(upload.image.data, upload.digest)
+        cache_status = "hit"
+        retry_after = None
+        if analysis_result is None and not pipeline.wants_async(request):
+            try:
+                analysis_result = pipeline.run_analysis(upload.image.data, upload.image.content_type, upload.digest)
+                cache_status = "miss"
+            except ratelimit.AIServiceUnavailable as exc:
+                # Over the model quota: queue the scan instead of failing it
+                retry_after = exc.wait
+
+        if analysis_result is None:
+            # Workers read the stored file
+            upload.wait_stored()
+            with metrics.span('db_insert'):
+                scan = FoodScan.objects.create(
+                    user=request.user,
+                    food_items=[],
+                    calories=0, protein=0, carbs=0, fats=0,
+                    status=FoodScan.STATUS_PENDING,
+                    **upload_fields
+                )
+            get_scan_queue().enqueue(scan)
+            logger.debug("Queued scan %s for async analysis", scan.id)
+            headers = {"Location": reverse('food-scan-detail', args=[scan.id])}
+            if retry_after:
+                headers["Retry-After"] = str(retry_after)
+            return Response(FoodScanSerializer(scan).data, status=status.HTTP_202_ACCEPTED, headers=headers)
+
+        logger.debug("Analysis result (%s): %s", cache_status, analysis_result)
+
         if not analysis_result or "error" in analysis_result:
-            print(f"DEBUG: Analysis failed with error: {analysis_result.get('error')}")
+            logger.warning("Scan analysis failed: %s", analysis_result.get('error'))
             return Response({"error": analysis_result.get("error", "Analysis failed")}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Save scan to database
-        scan = FoodScan.objects.create(
-            user=request.user,
-            image_url=request.build_absolute_uri(settings.MEDIA_URL + f"scans/{filename}"),
-            food_items=analysis_result.get("items", []),
-            calories=analysis_result.get("calories", 0),
-            protein=analysis_result.get("protein", 0),
-            carbs=analysis_result.get("carbs", 0),
-            fats=analysis_result.get("fats", 0)
-        )
-        
-        # Add AI results to scan context for serializer defaults if needed
-        # Actually, let's pass them to serializer or just return the serialized data
-        serializer = FoodScanSerializer(scan)
-        response_data = serializer.data
-        
-        # Override fields from AI result that are not in the model but needed by frontend
-        response_data.update({
-            "health_score": analysis_result.get("health_score", "B"),
-            "dietary_tags": analysis_result.get("dietary_tags", []),
-            "ai_insights": analysis_result.get("ai_insights", "Your meal is analyzed."),
-        })
+        # Save scan to database once its image_url is servable
+        upload.wait_stored()
+        fields = pipeline.analysis_fields(analysis_result)
+        with metrics.span('db_insert'):
+            scan = FoodScan.objects.create(user=request.user, **upload_fields, **fields)
+
+        with metrics.span('serialize'):
+            response_data = FoodScanSerializer(scan).data
+        return Response(response_data, status=status.HTTP_201_CREATED, headers={"X-Scan-Cache": cache_status})
+
+class FoodAnalyzeBatchView(APIView):
+    """Analyze several images (multipart field ``images``) in one request.
+
+    Used by the app to replay scans queued while offline. Up to
+    SCAN_BATCH_CONCURRENCY images are analyzed at once and all rows are
+    inserted together. Answers 201 when every image succeeded and 207 with
+    per-item statuses otherwise.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = [AIRateThrottle]
+
+    def ai_call_cost(self, request):
+        return len(request.FILES.getlist('images'))
+
+    def post(self, request):
+        images = request.FILES.getlist('images')
+        if not images:
+            return Response({"error": "No images provided"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(images) > settings.SCAN_BATCH_MAX_IMAGES:
+            return Response({"error": f"At most {settings.SCAN_BATCH_MAX_IMAGES} images per batch"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        logger.debug("Scan batch of %d images", len(images))
+        workers = min(len(images), settings.SCAN_BATCH_CONCURRENCY)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="scan-batch") as executor:
+            outcomes = list(executor.map(pipeline.analyze_upload, images))
 
-        print(f"DEBUG: Final Response Data: {response_data}")
-        return Response(response_data, status=status.HTTP_201_CREATED)
+        results, all_ok = pipeline.record_batch(request, images, outcomes)
+        return Response({"results": results},
+                        status=status.HTTP_201_CREATED if all_ok else status.HTTP_207_MULTI_STATUS)
+
+def parse_time_bound(value, name):
+    """Parse a since/until query value given as an ISO datetime or date."""
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValidationError({name: "Expected an ISO 8601 date or datetime."})
+        moment = datetime.datetime.combine(day, datetime.time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
 
 class HistoryView(APIView):
+    """A user's scans, newest first.
+
+    Query parameters (all optional):
+      - cursor / limit: keyset pagination; without either the full history
+        is returned as a plain list, as before.
+      - fields: comma-separated serializer fields to return. Leaving out
+        detected_foods also skips loading the food_items JSON.
+      - since / until: ISO date or datetime bounds on the scan time
+        (since inclusive, until exclusive).
+    """
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = KeysetPagination
 
     def get(self, request):
-        print(f"DEBUG: HistoryView.get called for user: {request.user}")
-        scans = FoodScan.objects.filter(user=request.user).order_by('-timestamp')
-        serializer = FoodScanSerializer(scans, many=True)
-        return Response(serializer.data)
+        scans = FoodScan.objects.filter(user=request.user)
+
+        if 'since' in request.query_params:
+            scans = scans.filter(timestamp__gte=parse_time_bound(request.query_params['since'], 'since'))
+        if 'until' in request.query_params:
+            scans = scans.filter(timestamp__lt=parse_time_bound(request.query_params['until'], 'until'))
+
+        fields = None
+        if request.query_params.get('fields'):
+            fields = [name.strip() for name in request.query_params['fields'].split(',') if name.strip()]
+            unknown = set(fields) - set(FoodScanSerializer.Meta.fields)
+            if unknown:
+                raise ValidationError({"fields": f"Unknown fields: {', '.join(sorted(unknown))}"})
 
-class FoodScanDetailView(generics.UpdateAPIView):
+        # values_list() rows encoded as FoodScanSerializer would (api/encoders.py);
+        # only the requested fields' columns are loaded
+        paginator = self.pagination_class()
+        if paginator.is_requested(request):
+            page = paginator.paginate_queryset(encoders.scan_values(scans, fields), request, view=self)
+            return paginator.get_paginated_response(encoders.scan_dicts(page, fields))
+
+        rows = encoders.scan_values(paginator.order(scans), fields)
+        return Response(encoders.scan_dicts(rows, fields))
+
+class SearchView(APIView):
+    """Full-text search over the user's scans and coach conversations (api/search.py).
+
+    Query parameters:
+      - q: the words to find; each matches as a word prefix, all must match.
+      - type: scans, chat or all (default).
+      - limit / offset: page size (default 20, at most 50) and position in
+        the ranking, which is followed at most MAX_RESULTS deep.
+
+    Responses look like ``{"next": <url or null>, "results": [...]}`` with
+    best matches first. A result is ``{"type": "scan", "rank": ..., "scan":
+    {...}}`` or ``{"type": "chat", "rank": ..., "chat": {...}}``, the item
+    as the history endpoints return it.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    PAGE_SIZE = 20
+    MAX_PAGE_SIZE = 50
+    MAX_RESULTS = 500
+    TYPES = {'scans': ('scan',), 'chat': ('chat',), 'all': ('scan', 'chat')}
+
+    @staticmethod
+    def int_param(request, name, default):
+        try:
+            return int(request.query_params.get(name, default))
+        except ValueError:
+            return default
+
+    def get(self, request):
+        text = request.query_params.get('q', '')
+        if not search.terms(text):
+            raise ValidationError({"q": "Give some words to search for."})
+        kinds = self.TYPES.get(request.query_params.get('type', 'all'))
+        if kinds is None:
+            raise ValidationError({"type": "Use scans, chat or all."})
+        limit = max(1, min(self.int_param(request, 'limit', self.PAGE_SIZE), self.MAX_PAGE_SIZE))
+        offset = max(0, self.int_param(request, 'offset', 0))
+        end = min(offset + limit, self.MAX_RESULTS)
+
+        # Each model's best end + 1 matches are enough to place this page and
+        # to tell whether there is another
+        hits = []
+        for kind in kinds:
+            model = FoodScan if kind == 'scan' else ChatMessage
+            hits.extend((rank, pk, kind) for rank, pk in search.ranked(model, text, request.user.pk, end + 1))
+        hits.sort(key=lambda hit: (-hit[0], -hit[1]))
+        page = hits[offset:end]
+
+        items = {}
+        scan_ids = [pk for _, pk, kind in page if kind == 'scan']
+        if scan_ids:
+            rows = encoders.scan_values(FoodScan.objects.filter(user=request.user, id__in=scan_ids))
+            items.update((('scan', item['id']), item) for item in encoders.scan_dicts(rows))
+        chat_ids = [pk for _, pk, kind in page if kind == 'chat']
+        if chat_ids:
+            rows = encoders.chat_values(ChatMessage.objects.filter(user=request.user, id__in=chat_ids))
+            items.update((('chat', item['id']), item) for item in encoders.chat_dicts(rows))
+
+        next_link = None
+        if len(hits) > end and end < self.MAX_RESULTS:
+            next_link = replace_query_param(request.build_absolute_uri(), 'offset', end)
+        return Response({
+            'next': next_link,
+            # Rows deleted since they were ranked are left out
+            'results': [{'type': kind, 'rank': rank, kind: items[kind, pk]}
+                        for rank, pk, kind in page if (kind, pk) in items],
+        })
+
+class NutritionSummaryView(APIView):
+    """Calorie and macro totals read from the precomputed daily rollups.
+
+    ?range=day|week|month|<N>d (default week) ending today, and
+    ?group=day|week to bucket the periods.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    RANGES = {'day': 1, 'week': 7, 'month': 30}
+    MAX_DAYS = 366
+
+    def get(self, request):
+        range_param = request.query_params.get('range', 'week')
+        days = self.RANGES.get(range_param)
+        if days is None and range_param.endswith('d') and range_param[:-1].isdigit():
+            days = int(range_param[:-1])
+        if not days or days > self.MAX_DAYS:
+            raise ValidationError({"range": f"Use day, week, month or 1d-{self.MAX_DAYS}d."})
+
+        group = request.query_params.get('group', 'day')
+        if group not in ('day', 'week'):
+            raise ValidationError({"group": "Use day or week."})
+
+        end = timezone.localdate()
+        start = end - datetime.timedelta(days=days - 1)
+        summary = rollups.summarize(request.user, start, end, group=group)
+        return Response({"range": range_param, **summary})
+
+class FoodScanDetailView(generics.RetrieveUpdateAPIView):
     permission_classes = [permissions.IsAuthenticated]
     serializer_class = FoodScanSerializer
     queryset = FoodScan.objects.all()
@@ -146,22 +363,63 @@ class FoodScanDetailView(generics.UpdateAPIView):
     def get_queryset(self):
         return self.queryset.filter(user=self.request.user)
 
+    def retrieve(self, request, *args, **kwargs):
+        # ?wait=<seconds> long-polls until an async scan finishes or the wait expires
+        try:
+            wait = float(request.query_params.get('wait', 0))
+        except ValueError:
+            return Response({"error": "wait must be a number of seconds"}, status=status.HTTP_400_BAD_REQUEST)
+        wait = max(0.0, min(wait, settings.SCAN_LONG_POLL_MAX_WAIT))
+
+        instance = self.get_object()
+        deadline = time.monotonic() + wait
+        while instance.status in (FoodScan.STATUS_PENDING, FoodScan.STATUS_PROCESSING) \
+                and time.monotonic() < deadline:
+            time.sleep(settings.SCAN_LONG_POLL_INTERVAL)
+            instance.refresh_from_db()
+
+        serializer = self.get_serializer(instance)
+        return Response(serializer.data)
+
+    def perform_update(self, serializer):
+        # Edited items get their nutrition and the totals recomputed locally
+        items = serializer.validated_data.get('food_items')
+        if settings.NUTRITION_RECONCILE and isinstance(items, list):
+            serializer.save(**nutrition.reconcile_fields(items, serializer.instance.food_items))
+        else:
+            serializer.save()
+
 class ChatView(APIView):
+    """GET pages through the chat newest first with ?limit= and ?cursor=
+    (api/pagination.py); without them it returns the whole chat, oldest
+    first, as before."""
     permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = [AIRateThrottle]
+    renderer_classes = list(api_settings.DEFAULT_RENDERER_CLASSES) + [EventStreamRenderer]
+    pagination_class = KeysetPagination
 
     def get(self, request):
-        print(f"DEBUG: ChatView.get called for user: {request.user}")
-        messages = ChatMessage.objects.filter(user=request.user).order_by('timestamp')
-        serializer = ChatMessageSerializer(messages, many=True)
-        return Response(serializer.data)
+        messages = ChatMessage.objects.filter(user=request.user)
+        paginator = self.pagination_class()
+        if paginator.is_requested(request):
+            page = paginator.paginate_queryset(encoders.chat_values(messages), request, view=self)
+            return paginator.get_paginated_response(encoders.chat_dicts(page))
+
+        return Response(encoders.chat_dicts(encoders.chat_values(messages.order_by('timestamp'))))
 
     def post(self, request):
-        print(f"DEBUG: ChatView.post called with data: {request.data}")
         message = request.data.get('message')
+        logger.debug("Coach message from user %s: %s", request.user.pk, message)
         if not message:
             return Response({"error": "No message provided"}, status=status.HTTP_400_BAD_REQUEST)
 
-        ai_response = utils.get_ai_coach_response(message)
+        if chat_stream.wants_stream(request):
+            chunks = utils.stream_ai_coach_response(message, coach_context.build(request.user))
+            return chat_stream.event_stream_response(
+                chat_stream.stream_chat_reply(request.user, message, chunks)
+            )
+
+        ai_response, cache_status = coach_cache.generate(request.user, message)
         
         # Save to DB
         ChatMessage.objects.create(
@@ -170,7 +428,7 @@ class ChatView(APIView):
             response=ai_response
         )
         
-        return Response({"response": ai_response})
+        return Response({"response": ai_response}, headers={"X-Coach-Cache": cache_status})
 
 class AdminCheckAIView(APIView):
     authentication_classes = [authentication.SessionAuthentication]
@@ -180,7 +438,32 @@ class AdminCheckAIView(APIView):
         return render(request, 'api/check_ai.html')
 
     def post(self, request):
-        print(f"DEBUG: AdminCheckAIView.post called with data: {request.data}")
         api_key = request.data.get('api_key')
         result = utils.test_gemini_connection(api_key)
         return Response(result)
+
+class AdminAILimitsView(APIView):
+    """Rate limiter, circuit breaker, model routing and coach cache state for
+    model calls (api/ratelimit.py, api/routing.py, api/coach_cache.py)."""
+    authentication_classes = [authentication.SessionAuthentication, CachedJWTAuthentication]
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response({
+            **ratelimit.snapshot(),
+            'routing': routing.snapshot(),
+            'coach_cache': coach_cache.snapshot(),
+        })
+
+class MetricsView(View):
+    """Latency histograms (api/metrics.py) in the Prometheus text format.
+
+    Served to staff signed in to the admin, or to a scraper sending
+    METRICS_TOKEN as a bearer token.
+    """
+    def get(self, request):
+        token = settings.METRICS_TOKEN
+        scraper = bool(token) and constant_time_compare(request.headers.get('Authorization', ''), f"Bearer {token}")
+        if not scraper and not request.user.is_staff:
+            return HttpResponse(status=status.HTTP_403_FORBIDDEN)
+        return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
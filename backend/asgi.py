@@ -12,5 +12,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+# Under ASGI, serve the model-calling endpoints with their native async views
+os.environ.setdefault('ASYNC_VIEWS', 'True')
 
 application = get_asgi_application()
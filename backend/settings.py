@@ -23,9 +23,6 @@ DEBUG = os.environ.get('DEBUG', 'False') == 'True'
 
 ALLOWED_HOSTS = os.environ.get('ALLOWED_HOSTS', '*').split(',')
 
-print(f"DEBUG: {DEBUG}")
-print(f"ALLOWED_HOSTS: {ALLOWED_HOSTS}")
-
 
 # Application definition
 
@@ -43,6 +40,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.RequestMetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
@@ -84,6 +82,11 @@ DATABASES = {
         conn_max_age=600
     )
 }
+# With SQLite, a transaction that reads before it writes cannot wait for the
+# write lock and fails with "database is locked" under a threaded server.
+# Taking the lock up front makes it queue behind the current writer instead.
+if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3':
+    DATABASES['default'].setdefault('OPTIONS', {}).update(transaction_mode='IMMEDIATE', timeout=20)
 
 
 # Password validation
@@ -105,6 +108,32 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+# Password hashing (api/hashers.py). PASSWORD_HASHER picks the algorithm for
+# new hashes ('pbkdf2', 'bcrypt' or 'argon2', which needs argon2-cffi); the
+# others still verify existing hashes, which are upgraded on login.
+PASSWORD_HASHER = os.environ.get('PASSWORD_HASHER', 'pbkdf2')
+PASSWORD_PBKDF2_ITERATIONS = int(os.environ.get('PASSWORD_PBKDF2_ITERATIONS', '1000000'))
+PASSWORD_BCRYPT_ROUNDS = int(os.environ.get('PASSWORD_BCRYPT_ROUNDS', '12'))
+PASSWORD_ARGON2_TIME_COST = int(os.environ.get('PASSWORD_ARGON2_TIME_COST', '2'))
+PASSWORD_ARGON2_MEMORY_COST = int(os.environ.get('PASSWORD_ARGON2_MEMORY_COST', '102400'))  # KiB
+PASSWORD_ARGON2_PARALLELISM = int(os.environ.get('PASSWORD_ARGON2_PARALLELISM', '8'))
+_PASSWORD_HASHERS = {
+    'pbkdf2': 'api.hashers.PBKDF2PasswordHasher',
+    'bcrypt': 'api.hashers.BCryptSHA256PasswordHasher',
+    'argon2': 'api.hashers.Argon2PasswordHasher',
+}
+PASSWORD_HASHERS = [_PASSWORD_HASHERS[PASSWORD_HASHER]] + [
+    path for name, path in _PASSWORD_HASHERS.items() if name != PASSWORD_HASHER
+] + [
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+# Threads hashing passwords at once, and sign-ins allowed to wait for one
+# before further ones are shed with a 503
+AUTH_HASH_MAX_THREADS = int(os.environ.get('AUTH_HASH_MAX_THREADS', str(min(4, os.cpu_count() or 1))))
+AUTH_HASH_MAX_WAITING = int(os.environ.get('AUTH_HASH_MAX_WAITING', '64'))
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/5.0/topics/i18n/
 
@@ -122,7 +151,6 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 STATIC_ROOT = BASE_DIR / 'staticfiles'
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
@@ -133,7 +161,12 @@ CORS_ALLOW_ALL_ORIGINS = True
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.CachedJWTAuthentication',
+    ),
+    # Same bytes as DRF's JSONRenderer, encoded with orjson when installed
+    'DEFAULT_RENDERER_CLASSES': (
+        'api.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
     ),
 }
 
@@ -146,7 +179,253 @@ SIMPLE_JWT = {
 }
 
 MEDIA_URL = '/media/'
-MEDIA_ROOT = BASE_DIR / 'media'
+MEDIA_ROOT = Path(os.environ.get('MEDIA_ROOT', BASE_DIR / 'media'))
+
+# Logging. The api loggers log at LOG_LEVEL; per-request details (raw model
+# replies, analysis results) are DEBUG and stay off by default.
+# LOG_FORMAT=json writes one JSON object per line.
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text')
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'text': {'format': '%(asctime)s %(levelname)s %(name)s %(message)s'},
+        'json': {'()': 'api.metrics.JsonFormatter'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': LOG_FORMAT},
+    },
+    'loggers': {
+        'api': {'handlers': ['console'], 'level': LOG_LEVEL, 'propagate': False},
+    },
+}
+
+# Latency metrics (api/metrics.py). Requests slower than SLOW_REQUEST_MS are
+# logged with their stage timings (0 disables). /api/metrics is served to
+# staff, or to scrapers sending METRICS_TOKEN as a bearer token.
+SLOW_REQUEST_MS = int(os.environ.get('SLOW_REQUEST_MS', '2000'))
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# AI backend (api/ai_client.py): 'gemini' or 'fake' for offline benchmarking
+AI_BACKEND = os.environ.get('AI_BACKEND', 'gemini')
+GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY')
+GEMINI_API_BASE_URL = os.environ.get('GEMINI_API_BASE_URL', 'https://generativelanguage.googleapis.com/v1beta')
+AI_HTTP_TIMEOUT = float(os.environ.get('AI_HTTP_TIMEOUT', '120'))
+AI_MAX_CONNECTIONS = int(os.environ.get('AI_MAX_CONNECTIONS', '500'))
+AI_FAKE_LATENCY_MS = float(os.environ.get('AI_FAKE_LATENCY_MS', '1500'))
+AI_FAKE_JITTER_MS = float(os.environ.get('AI_FAKE_JITTER_MS', '300'))
+AI_FAKE_TAIL_RATE = float(os.environ.get('AI_FAKE_TAIL_RATE', '0'))
+AI_FAKE_TAIL_MS = float(os.environ.get('AI_FAKE_TAIL_MS', '10000'))
+AI_FAKE_ERROR_RATE = float(os.environ.get('AI_FAKE_ERROR_RATE', '0'))
+
+# Admission control for model calls (api/ratelimit.py). Rates use DRF's
+# "<n>/<sec|min|hour|day>" form; an empty rate disables that limit.
+AI_RATE_LIMIT_CACHE = os.environ.get('AI_RATE_LIMIT_CACHE', 'default')
+AI_RATE_LIMIT_USER = os.environ.get('AI_RATE_LIMIT_USER', '30/min')
+AI_RATE_LIMIT_USER_BURST = int(os.environ.get('AI_RATE_LIMIT_USER_BURST', '20'))
+AI_RATE_LIMIT_GLOBAL = os.environ.get('AI_RATE_LIMIT_GLOBAL', '1000/min')
+AI_RATE_LIMIT_GLOBAL_BURST = int(os.environ.get('AI_RATE_LIMIT_GLOBAL_BURST', '100'))
+# Longest a call waits for a global token before it is shed with a 503
+AI_RATE_LIMIT_MAX_WAIT = float(os.environ.get('AI_RATE_LIMIT_MAX_WAIT', '2'))
+# Open the circuit breaker after this many 429s within the window (seconds)
+AI_BREAKER_THRESHOLD = int(os.environ.get('AI_BREAKER_THRESHOLD', '5'))
+AI_BREAKER_WINDOW = int(os.environ.get('AI_BREAKER_WINDOW', '30'))
+AI_BREAKER_COOLDOWN = float(os.environ.get('AI_BREAKER_COOLDOWN', '30'))
+
+# Per-endpoint deadlines, retries and hedging for model calls (api/invoke.py).
+# Keys missing here fall back to invoke.DEFAULT_POLICY.
+AI_CALL_POLICIES = {
+    'scan': {
+        'timeout': float(os.environ.get('AI_SCAN_TIMEOUT', '30')),
+        'deadline': float(os.environ.get('AI_SCAN_DEADLINE', '60')),
+        'retries': int(os.environ.get('AI_SCAN_RETRIES', '2')),
+        'hedge': os.environ.get('AI_SCAN_HEDGE', 'True') == 'True',
+    },
+    'coach': {
+        'timeout': float(os.environ.get('AI_COACH_TIMEOUT', '20')),
+        'deadline': float(os.environ.get('AI_COACH_DEADLINE', '30')),
+        'retries': int(os.environ.get('AI_COACH_RETRIES', '1')),
+        'hedge': os.environ.get('AI_COACH_HEDGE', 'False') == 'True',
+    },
+}
+AI_INVOKE_MAX_THREADS = int(os.environ.get('AI_INVOKE_MAX_THREADS', '64'))
+
+# Model routing (api/routing.py): each route uses a tier, each tier lists
+# its models primary first; the rest are failover siblings.
+AI_MODEL_TIERS = {
+    'lite': os.environ.get('AI_MODELS_LITE', 'models/gemini-2.5-flash-lite,models/gemini-2.0-flash-lite').split(','),
+    'flash': os.environ.get('AI_MODELS_FLASH', 'models/gemini-2.5-flash,models/gemini-2.0-flash').split(','),
+    'pro': os.environ.get('AI_MODELS_PRO', 'models/gemini-2.5-pro,models/gemini-2.5-flash').split(','),
+}
+AI_MODEL_ROUTES = {
+    'scan': 'flash',
+    'scan_review': 'pro',
+    'coach': 'flash',
+    'coach_small_talk': 'lite',
+    'coach_summary': 'lite',
+}
+# AI_CALL_POLICIES entry each route runs under; routes not listed use their own name
+AI_ROUTE_POLICIES = {
+    'scan_review': 'scan',
+    'coach_small_talk': 'coach',
+    'coach_summary': 'coach',
+}
+# Re-analyze a scan with the scan_review route when any item is less
+# confident than this (0 disables re-analysis)
+AI_REANALYZE_CONFIDENCE = float(os.environ.get('AI_REANALYZE_CONFIDENCE', '0.5'))
+AI_SMALL_TALK_MAX_WORDS = int(os.environ.get('AI_SMALL_TALK_MAX_WORDS', '6'))
+# Siblings are preferred over a model below this success rate or slower
+# than this multiple of the fastest sibling's latency
+AI_ROUTER_MIN_SUCCESS_RATE = float(os.environ.get('AI_ROUTER_MIN_SUCCESS_RATE', '0.8'))
+AI_ROUTER_SLOW_FACTOR = float(os.environ.get('AI_ROUTER_SLOW_FACTOR', '2'))
+
+# Ask for schema-constrained JSON scan analyses (api/schemas.py)
+AI_STRUCTURED_OUTPUT = os.environ.get('AI_STRUCTURED_OUTPUT', 'True') == 'True'
+
+# Serve FoodAnalyzeView, ChatView and AdminCheckAIView with their native
+# async versions (api/async_views.py). Enable when running under ASGI.
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', 'False') == 'True'
+
+# Admin list pages of unfiltered tables at least this big show the
+# database's row estimate instead of running COUNT(*) (api/admin.py)
+ADMIN_COUNT_ESTIMATE_THRESHOLD = int(os.environ.get('ADMIN_COUNT_ESTIMATE_THRESHOLD', '100000'))
+
+# Scan image preprocessing (api/imaging.py)
+SCAN_IMAGE_MAX_DIMENSION = int(os.environ.get('SCAN_IMAGE_MAX_DIMENSION', '1536'))
+SCAN_IMAGE_FORMAT = os.environ.get('SCAN_IMAGE_FORMAT', 'JPEG')  # JPEG or WEBP
+SCAN_IMAGE_QUALITY = int(os.environ.get('SCAN_IMAGE_QUALITY', '85'))
+SCAN_THUMBNAIL_SIZE = int(os.environ.get('SCAN_THUMBNAIL_SIZE', '320'))
+SCAN_THUMBNAIL_QUALITY = int(os.environ.get('SCAN_THUMBNAIL_QUALITY', '75'))
+# Threads writing processed scans to storage while the model call runs (api/pipeline.py)
+SCAN_STORAGE_WORKERS = int(os.environ.get('SCAN_STORAGE_WORKERS', '4'))
+
+# Scan image storage (api/storage.py): 'local' keeps files under MEDIA_ROOT/scans,
+# 's3' uses an S3-compatible bucket shared by all app instances (needs boto3).
+# SCAN_MEDIA_URL / AWS_S3_PUBLIC_URL make image URLs absolute (e.g. a CDN);
+# otherwise local URLs are resolved against the request host.
+SCAN_STORAGE_BACKEND = os.environ.get('SCAN_STORAGE_BACKEND', 'local')
+if SCAN_STORAGE_BACKEND == 's3':
+    SCAN_STORAGE = {
+        'BACKEND': 'api.storage.S3ScanStorage',
+        'OPTIONS': {
+            'bucket_name': os.environ.get('AWS_S3_BUCKET'),
+            'location': os.environ.get('AWS_S3_LOCATION', 'scans'),
+            'endpoint_url': os.environ.get('AWS_S3_ENDPOINT_URL'),
+            'region_name': os.environ.get('AWS_S3_REGION'),
+            'access_key': os.environ.get('AWS_ACCESS_KEY_ID'),
+            'secret_key': os.environ.get('AWS_SECRET_ACCESS_KEY'),
+            'public_url': os.environ.get('AWS_S3_PUBLIC_URL'),
+            'multipart_threshold': int(os.environ.get('AWS_S3_MULTIPART_THRESHOLD', str(8 * 1024 * 1024))),
+        },
+    }
+else:
+    SCAN_STORAGE = {
+        'BACKEND': 'api.storage.ScanFileSystemStorage',
+        'OPTIONS': {
+            'location': MEDIA_ROOT / 'scans',
+            'base_url': os.environ.get('SCAN_MEDIA_URL', MEDIA_URL + 'scans/'),
+        },
+    }
+
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage'},
+    'scans': SCAN_STORAGE,
+}
+
+# Async scan analysis (api/queues.py)
+# Clients opt in per request with ?mode=async or `Prefer: respond-async`.
+SCAN_ASYNC_DEFAULT = os.environ.get('SCAN_ASYNC_DEFAULT', 'False') == 'True'
+SCAN_QUEUE_BACKEND = os.environ.get('SCAN_QUEUE_BACKEND', 'api.queues.DatabaseScanQueue')
+SCAN_WORKER_CONCURRENCY = int(os.environ.get('SCAN_WORKER_CONCURRENCY', '4'))
+SCAN_QUEUE_VISIBILITY_TIMEOUT = int(os.environ.get('SCAN_QUEUE_VISIBILITY_TIMEOUT', '300'))
+SCAN_QUEUE_MAX_ATTEMPTS = int(os.environ.get('SCAN_QUEUE_MAX_ATTEMPTS', '3'))
+# ?wait= on a scan holds a sync worker while it polls, so keep the cap short;
+# clients poll again for longer waits
+SCAN_LONG_POLL_MAX_WAIT = float(os.environ.get('SCAN_LONG_POLL_MAX_WAIT', '5'))
+SCAN_LONG_POLL_INTERVAL = 0.5
+
+# Batch uploads (/api/food/analyze/batch): images per request and analyses run at once
+SCAN_BATCH_MAX_IMAGES = int(os.environ.get('SCAN_BATCH_MAX_IMAGES', '20'))
+SCAN_BATCH_CONCURRENCY = int(os.environ.get('SCAN_BATCH_CONCURRENCY', '4'))
+
+# Caches
+# The scan_results alias backs the content-addressed analysis cache in
+# api/scan_cache.py. CULL_FREQUENCY == MAX_ENTRIES makes LocMemCache evict a
+# single least-recently-used entry when full instead of a third of the cache.
+SCAN_CACHE_TTL = int(os.environ.get('SCAN_CACHE_TTL', str(7 * 24 * 3600)))
+SCAN_CACHE_MAX_ENTRIES = int(os.environ.get('SCAN_CACHE_MAX_ENTRIES', '1000'))
+# Max Hamming distance between perceptual hashes for a near-duplicate hit; 0 disables it.
+SCAN_CACHE_NEAR_DUPLICATE_DISTANCE = int(os.environ.get('SCAN_CACHE_NEAR_DUPLICATE_DISTANCE', '0'))
+
+# AI coach reply cache (api/coach_cache.py)
+COACH_CACHE_TTL = int(os.environ.get('COACH_CACHE_TTL', str(24 * 3600)))
+COACH_CACHE_MAX_ENTRIES = int(os.environ.get('COACH_CACHE_MAX_ENTRIES', '1000'))
+# Min cosine similarity for a nearest-neighbour hit on an embedded message; 0 disables it.
+COACH_CACHE_SIMILARITY = float(os.environ.get('COACH_CACHE_SIMILARITY', '0'))
+COACH_CACHE_EMBEDDING_MODEL = os.environ.get('COACH_CACHE_EMBEDDING_MODEL', 'models/gemini-embedding-001')
+COACH_CACHE_EMBEDDING_DIMENSIONS = int(os.environ.get('COACH_CACHE_EMBEDDING_DIMENSIONS', '256'))
+COACH_CACHE_EMBEDDING_TIMEOUT = float(os.environ.get('COACH_CACHE_EMBEDDING_TIMEOUT', '2'))
+
+# Coach prompt context (api/coach_context.py): the user's profile and recent
+# intake, a rolling summary of older turns and the latest turns, fitted into
+# a token budget. Turns beyond COACH_CONTEXT_TURNS are folded into the
+# summary COACH_SUMMARY_BATCH at a time on a background thread.
+COACH_CONTEXT_MAX_TOKENS = int(os.environ.get('COACH_CONTEXT_MAX_TOKENS', '1500'))
+COACH_CONTEXT_TURNS = int(os.environ.get('COACH_CONTEXT_TURNS', '6'))
+COACH_CONTEXT_INTAKE_DAYS = int(os.environ.get('COACH_CONTEXT_INTAKE_DAYS', '7'))
+COACH_SUMMARY_BATCH = int(os.environ.get('COACH_SUMMARY_BATCH', '10'))
+COACH_SUMMARY_MAX_TOKENS = int(os.environ.get('COACH_SUMMARY_MAX_TOKENS', '300'))
+COACH_SUMMARY_CACHE_TTL = int(os.environ.get('COACH_SUMMARY_CACHE_TTL', '300'))
+COACH_SUMMARY_WORKERS = int(os.environ.get('COACH_SUMMARY_WORKERS', '2'))
+
+# Local nutrition database (api/nutrition.py): recompute scan item nutrition
+# from the Food table instead of trusting the model's numbers
+NUTRITION_RECONCILE = os.environ.get('NUTRITION_RECONCILE', 'True') == 'True'
+# Min trigram similarity for an item name to match a food (1 = exact only)
+NUTRITION_MATCH_THRESHOLD = float(os.environ.get('NUTRITION_MATCH_THRESHOLD', '0.5'))
+# Stricter match for the corrected name in Feedback before it is learned
+NUTRITION_FEEDBACK_THRESHOLD = float(os.environ.get('NUTRITION_FEEDBACK_THRESHOLD', '0.6'))
+# Agreeing corrections before a learned alias is used for everyone's scans
+NUTRITION_ALIAS_MIN_VOTES = int(os.environ.get('NUTRITION_ALIAS_MIN_VOTES', '2'))
+
+# Authenticated users (and their profiles) cached by api/authentication.py
+AUTH_USER_CACHE_TTL = int(os.environ.get('AUTH_USER_CACHE_TTL', '60'))
+AUTH_USER_CACHE_MAX_ENTRIES = int(os.environ.get('AUTH_USER_CACHE_MAX_ENTRIES', '10000'))
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'scan_results': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'scan-results',
+        'TIMEOUT': SCAN_CACHE_TTL,
+        'OPTIONS': {
+            'MAX_ENTRIES': SCAN_CACHE_MAX_ENTRIES,
+            'CULL_FREQUENCY': SCAN_CACHE_MAX_ENTRIES,
+        },
+    },
+    'coach_replies': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'coach-replies',
+        'TIMEOUT': COACH_CACHE_TTL,
+        'OPTIONS': {
+            'MAX_ENTRIES': COACH_CACHE_MAX_ENTRIES,
+            'CULL_FREQUENCY': COACH_CACHE_MAX_ENTRIES,
+        },
+    },
+    'auth_users': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'auth-users',
+        'TIMEOUT': AUTH_USER_CACHE_TTL,
+        'OPTIONS': {
+            'MAX_ENTRIES': AUTH_USER_CACHE_MAX_ENTRIES,
+            'CULL_FREQUENCY': AUTH_USER_CACHE_MAX_ENTRIES,
+        },
+    },
+}
 
 JAZZMIN_SETTINGS = {
     "site_title": "Find Your Food Admin",